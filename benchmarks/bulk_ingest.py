@@ -0,0 +1,88 @@
+"""
+Compare importing messages one commit at a time with the batched bulk insert
+
+Both variants write the same pre-encrypted messages through the message
+store: append() commits each message (what the WebSocket endpoint does),
+append_many() stores them with one executemany INSERT per request, as
+POST /api/messages/bulk does.
+
+Usage:
+    python benchmarks/bulk_ingest.py --messages 5000 --profile production
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography.fernet import Fernet
+
+from server.database import Base, create_engines, create_session_factory
+from server.message_store import NewMessage, SQLMessageStore
+from server.models import User
+from server.ciphertext import decode_ciphertext
+
+
+def run(profile: str, messages: int, batch_size: int):
+    ciphertext = decode_ciphertext(Fernet(Fernet.generate_key()).encrypt(b"x" * 100).decode())
+
+    results = {}
+    for variant in ("append", "append_many"):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer, reader = create_engines(f"sqlite:///{tmp}/bench.db", profile)
+            Base.metadata.create_all(bind=writer)
+            Session = create_session_factory(writer, reader)
+            store = SQLMessageStore(Session)
+
+            db = Session()
+            user = User(username="bot", password_hash="x")
+            db.add(user)
+            db.commit()
+            user_id = user.id
+            db.close()
+
+            batch = [NewMessage("general", seq, user_id, "bot", ciphertext) for seq in range(1, messages + 1)]
+
+            started = time.perf_counter()
+            if variant == "append":
+                for msg in batch:
+                    store.append(*msg)
+            else:
+                for start in range(0, messages, batch_size):
+                    store.append_many(batch[start:start + batch_size])
+            results[variant] = time.perf_counter() - started
+
+            writer.dispose()
+            reader.dispose()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk message ingestion")
+    parser.add_argument("--messages", type=int, default=5000, help="Messages to import")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Messages per bulk request")
+    parser.add_argument("--profile", default="production", choices=["default", "production"],
+                        help="SQLite profile")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BULK INGESTION BENCHMARK")
+    print("=" * 60)
+    print(f"Messages: {args.messages}  Batch size: {args.batch_size}  Profile: {args.profile}")
+    print()
+
+    results = run(args.profile, args.messages, args.batch_size)
+    for variant, elapsed in results.items():
+        print(f"{variant:<12} {elapsed:8.2f}s   {args.messages / elapsed:10.0f} messages/s")
+
+    print()
+    print(f"Speedup: {results['append'] / results['append_many']:.1f}x")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
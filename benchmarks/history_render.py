@@ -0,0 +1,133 @@
+"""
+Measure history load time to first paint and to full paint
+
+Loads the same encrypted history into a headless chat screen two ways:
+  inline  decrypt and render message by message on the event loop
+          (ChatClient.show_chat_messages, the previous history path)
+  stream  decrypt in chunks on a worker pool and render each chunk as it
+          is ready (ChatClient.show_history_messages)
+
+First paint is the first moment the event loop is free to repaint after a
+message reached the message view; full paint is the same after the last one. The longest
+stall is the longest time the event loop (and so the UI) was blocked.
+
+Usage:
+    python benchmarks/history_render.py --messages 500
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shared.crypto import MessageEncryption
+
+
+async def load(variant: str, history, encryption: MessageEncryption):
+    from client.main import ChatClient
+    from client.message_view import MessageView
+
+    client = ChatClient("http://127.0.0.1:1")
+    client._encryption = encryption
+    client.app.set_ready_callback(None)
+
+    async with client.app.run_test(size=(120, 40)) as pilot:
+        client.app.show_chat("reader", 1, "token")
+        await pilot.pause(0.2)
+        chat_screen = client.app.get_chat_screen()
+
+        # Messages reach the view in per-frame batches; time each batch
+        added = []
+        message_display = chat_screen.cached_query("#message-display", MessageView)
+        extend = message_display.extend
+
+        def timed_extend(messages):
+            extend(messages)
+            added.extend([time.perf_counter()] * len(messages))
+
+        message_display.extend = timed_extend
+
+        # Record every turn of the event loop
+        ticks = []
+        stop = False
+
+        async def ticker():
+            while not stop:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.001)
+
+        ticker_task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        if variant == "inline":
+            client.show_chat_messages(history, play_sound=False, phase_prefix="history")
+        else:
+            await client.show_history_messages(history)
+        await pilot.pause(0.05)
+        stop = True
+        await ticker_task
+
+    def next_tick(after: float) -> float:
+        return next(tick for tick in ticks if tick >= after)
+
+    window = [tick for tick in ticks if tick >= started]
+    stall = max((b - a for a, b in zip([started] + window, window)), default=0.0)
+    return {
+        "first_paint": next_tick(added[0]) - started,
+        "full_paint": next_tick(added[-1]) - started,
+        "longest_stall": stall,
+        "rendered": len(added),
+    }
+
+
+def make_history(count: int, encryption: MessageEncryption):
+    return [
+        {
+            "id": seq,
+            "seq": seq,
+            "room_id": "general",
+            "user_id": 2,
+            "username": "writer",
+            "content": encryption.encrypt(f"history message {seq} " + "x" * 80),
+            "timestamp": "2025-01-15T10:30:00",
+        }
+        for seq in range(1, count + 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark history load time to first and full paint")
+    parser.add_argument("--messages", type=int, default=500, help="Messages in the history page")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("HISTORY RENDER BENCHMARK")
+    print("=" * 60)
+    print(f"Messages: {args.messages}")
+    print()
+
+    encryption = MessageEncryption()
+    history = make_history(args.messages, encryption)
+
+    # ChatClient reads its config from the home directory
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+
+        print(f"{'Variant':<8} {'First paint':>12} {'Full paint':>12} {'Longest stall':>14}")
+        for variant in ("inline", "stream"):
+            result = asyncio.run(load(variant, history, encryption))
+            assert result["rendered"] == args.messages
+            print(f"{variant:<8} {result['first_paint'] * 1000:>10.1f}ms {result['full_paint'] * 1000:>10.1f}ms "
+                  f"{result['longest_stall'] * 1000:>12.1f}ms")
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
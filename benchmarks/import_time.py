@@ -0,0 +1,122 @@
+"""
+Check client startup against an import-time budget
+
+Measures, in fresh interpreters:
+    - importing client.main (what every terminal-chat command pays)
+    - running terminal-chat --version end to end
+and checks that importing client.main does not pull in the heavy modules
+that should only load when needed (Textual, aiohttp, websockets,
+cryptography). Exits with status 1 when a budget is exceeded or a heavy
+module is imported eagerly, so it can run in CI.
+
+Usage:
+    python benchmarks/import_time.py --budget-ms 60 --runs 5
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must not be loaded just by importing client.main
+LAZY_MODULES = ["textual", "aiohttp", "websockets", "cryptography", "client.ui", "client.connection"]
+
+
+def best_of(runs: int, args) -> float:
+    """Fastest wall-clock time of a command over several runs, in ms"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def eager_modules():
+    """Heavy modules that are loaded by importing client.main"""
+    probe = (
+        "import sys, client.main; "
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", probe], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout.strip()
+    return [module for module in output.split(",") if module]
+
+
+def slowest_imports(limit: int):
+    """Modules imported directly by client.main, slowest first (from -X importtime)"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import client.main"],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    ).stderr
+
+    # Imports are listed after the modules they pulled in, indented two
+    # spaces per level; collect the direct children of client.main
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == "client.main":
+                return sorted(children, reverse=True)[:limit]
+            children = []
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check client startup against an import-time budget")
+    parser.add_argument("--budget-ms", type=float, default=60,
+                        help="Budget for importing client.main (default: 60)")
+    parser.add_argument("--version-budget-ms", type=float, default=150,
+                        help="Budget for terminal-chat --version end to end (default: 150)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement; the fastest counts")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("CLIENT IMPORT TIME BUDGET")
+    print("=" * 60)
+
+    baseline = best_of(args.runs, [sys.executable, "-c", "pass"])
+    import_ms = best_of(args.runs, [sys.executable, "-c", "import client.main"]) - baseline
+    version_ms = best_of(args.runs, [sys.executable, "-m", "client.main", "--version"])
+    eager = eager_modules()
+
+    print(f"Interpreter startup:        {baseline:8.1f} ms")
+    print(f"import client.main:         {import_ms:8.1f} ms   (budget {args.budget_ms:.0f} ms)")
+    print(f"terminal-chat --version:    {version_ms:8.1f} ms   (budget {args.version_budget_ms:.0f} ms)")
+    print()
+    print("Slowest imports of client.main (cumulative):")
+    for cumulative_ms, name in slowest_imports(8):
+        print(f"  {cumulative_ms:8.1f} ms  {name}")
+    print()
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"import client.main took {import_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if version_ms > args.version_budget_ms:
+        failures.append(f"--version took {version_ms:.1f} ms (budget {args.version_budget_ms:.0f} ms)")
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    else:
+        print("PASS: within budget")
+    print("=" * 60)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
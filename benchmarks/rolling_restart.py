@@ -0,0 +1,122 @@
+"""
+Simulate a rolling restart and compare server load under each reconnect policy
+
+Every client loses its connection at t=0. The replacement server comes up
+after --downtime seconds and can complete at most --capacity handshakes per
+second; handshakes beyond that fail and the client backs off again.
+
+Policies:
+  legacy       fixed 1s delay doubling on failure (previous client behaviour)
+  full-jitter  exponential backoff with full jitter (client.connection)
+  drain        server drain hints spread over --window-ms, then full jitter
+
+Usage:
+    python benchmarks/rolling_restart.py --clients 2000 --capacity 500
+"""
+
+import argparse
+import heapq
+import random
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from client.connection import full_jitter_delay
+from server.connection_manager import spread_reconnect_delays
+
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+
+def legacy_delay(attempt: int) -> float:
+    """Delay used by the old recursive handle_reconnect"""
+    return min(BASE_DELAY * (2 ** attempt), MAX_DELAY)
+
+
+def jitter_delay(attempt: int) -> float:
+    return full_jitter_delay(attempt, BASE_DELAY, MAX_DELAY)
+
+
+def simulate(first_delays, retry_delay, downtime: float, capacity: int, bucket: float):
+    """
+    Run the reconnect storm
+
+    Returns:
+        (attempts per bucket, failed attempts, time the last client reconnected)
+    """
+    per_bucket_capacity = max(1, int(capacity * bucket))
+    attempts = Counter()
+    accepted = Counter()
+    failures = 0
+    last_connect = 0.0
+
+    events = [(delay, client, 0) for client, delay in enumerate(first_delays)]
+    heapq.heapify(events)
+
+    while events:
+        now, client, attempt = heapq.heappop(events)
+        slot = int(now / bucket)
+        attempts[slot] += 1
+
+        if now >= downtime and accepted[slot] < per_bucket_capacity:
+            accepted[slot] += 1
+            last_connect = max(last_connect, now)
+        else:
+            failures += 1
+            heapq.heappush(events, (now + retry_delay(attempt + 1), client, attempt + 1))
+
+    return attempts, failures, last_connect
+
+
+def report(name: str, attempts: Counter, failures: int, last_connect: float, bucket: float):
+    peak = max(attempts.values()) if attempts else 0
+    print(f"{name:<12} peak {peak:>6} handshakes/{int(bucket * 1000)}ms  "
+          f"failed {failures:>7}  all connected after {last_connect:7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate reconnect load during a rolling restart")
+    parser.add_argument("--clients", type=int, default=2000, help="Connected clients")
+    parser.add_argument("--downtime", type=float, default=0.5, help="Seconds until the new instance accepts")
+    parser.add_argument("--capacity", type=int, default=500, help="Handshakes per second the server can complete")
+    parser.add_argument("--window-ms", type=int, default=10000, help="Drain window in milliseconds")
+    parser.add_argument("--bucket-ms", type=int, default=100, help="Load measurement bucket in milliseconds")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    bucket = args.bucket_ms / 1000
+
+    print("=" * 60)
+    print("ROLLING RESTART RECONNECT SIMULATION")
+    print("=" * 60)
+    print(f"Clients: {args.clients}  Downtime: {args.downtime}s  "
+          f"Capacity: {args.capacity}/s  Drain window: {args.window_ms}ms")
+    print()
+
+    legacy = simulate(
+        [legacy_delay(0)] * args.clients, legacy_delay,
+        args.downtime, args.capacity, bucket
+    )
+    report("legacy", *legacy, bucket)
+
+    jitter = simulate(
+        [jitter_delay(0) for _ in range(args.clients)], jitter_delay,
+        args.downtime, args.capacity, bucket
+    )
+    report("full-jitter", *jitter, bucket)
+
+    # A drained server stays up until its clients have moved, so the
+    # replacement is already accepting when the hints start expiring
+    hints = [ms / 1000 for ms in spread_reconnect_delays(args.clients, args.window_ms)]
+    drain = simulate(hints, jitter_delay, 0.0, args.capacity, bucket)
+    report("drain", *drain, bucket)
+
+    print()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compare SQLite message throughput and history latency with and without the production profile
+
+For each profile the script inserts messages one transaction at a time
+(as the WebSocket endpoint does), then measures /api/history-style queries
+while a background thread keeps writing.
+
+Usage:
+    python benchmarks/sqlite_profile.py --messages 2000
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server.database import Base, create_engines, create_session_factory
+from server.models import Message, User
+
+
+def insert_messages(Session, user_id: int, count: int, start_seq: int = 0) -> float:
+    """Insert count messages, committing each one; returns elapsed seconds"""
+    started = time.perf_counter()
+    db = Session()
+    try:
+        for i in range(count):
+            db.add(Message(user_id=user_id, content=b"\x80" + b"x" * 90, room_id="general", seq=start_seq + i + 1))
+            db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+
+def history_latencies(Session, queries: int, limit: int):
+    """Run history queries and return per-query latency in milliseconds"""
+    latencies = []
+    db = Session()
+    try:
+        for _ in range(queries):
+            started = time.perf_counter()
+            messages = db.query(Message).filter(
+                Message.room_id == "general"
+            ).order_by(Message.timestamp.desc()).limit(limit).all()
+            [msg.user.username for msg in messages]
+            latencies.append((time.perf_counter() - started) * 1000)
+            db.rollback()
+    finally:
+        db.close()
+    return latencies
+
+
+def run_profile(profile: str, messages: int, queries: int, limit: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/bench.db"
+        writer, reader = create_engines(url, profile)
+        Base.metadata.create_all(bind=writer)
+        Session = create_session_factory(writer, reader)
+
+        db = Session()
+        user = User(username="bench", password_hash="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        db.close()
+
+        elapsed = insert_messages(Session, user_id, messages)
+
+        # Keep writing while history is being read
+        writer_thread = threading.Thread(
+            target=insert_messages, args=(Session, user_id, messages, messages)
+        )
+        writer_thread.start()
+        latencies = history_latencies(Session, queries, limit)
+        writer_thread.join()
+
+        writer.dispose()
+        reader.dispose()
+
+    latencies.sort()
+    return {
+        "inserts_per_sec": messages / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "max": latencies[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite production profile")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages inserted per phase")
+    parser.add_argument("--queries", type=int, default=500, help="History queries to time")
+    parser.add_argument("--limit", type=int, default=50, help="Messages per history query")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SQLITE PROFILE BENCHMARK")
+    print("=" * 60)
+    print(f"Messages: {args.messages}  History queries: {args.queries} (limit {args.limit})")
+    print()
+
+    for profile in ("default", "production"):
+        result = run_profile(profile, args.messages, args.queries, args.limit)
+        print(f"{profile:<11} inserts {result['inserts_per_sec']:8.0f}/s   "
+              f"history p50 {result['p50']:6.2f}ms  p95 {result['p95']:6.2f}ms  max {result['max']:7.2f}ms")
+
+    print()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,10 @@ class ClientConfig:
         "max_reconnect_delay": 60,
         "notification_sound": True,
         "message_history_limit": 50,
+        "message_cache": True,
+        "message_cache_encrypted": False,
+        "message_cache_max_mb": 50,
+        "history_backfill": True,
     }
 
     def __init__(self):
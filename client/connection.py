@@ -3,10 +3,34 @@ WebSocket client connection handler with auto-reconnection
 """
 
 import asyncio
+import random
 import websockets
-from typing import Callable, Optional, Dict, Any
+from collections import OrderedDict, deque
+from typing import Callable, Optional, Dict, Any, List, Set, Tuple
 import json
 from datetime import datetime
+from shared.tracing import tracer
+
+# Received frames waiting for the UI, by priority. Chat frames beyond the
+# limit are dropped and fetched again with a resume once the queue drains;
+# typing and presence updates are coalesced, and the oldest dropped.
+CHAT_QUEUE_LIMIT = 1000
+STATUS_QUEUE_LIMIT = 100
+
+# Frames that carry chat messages or their replay state
+CHAT_FRAME_TYPES = ("message", "message_batch", "resume_complete", "error")
+
+
+def full_jitter_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Get a reconnect delay using exponential backoff with full jitter
+
+    The delay is drawn uniformly from [0, min(max_delay, base_delay * 2^attempt)],
+    so clients that lost their connection at the same moment spread out
+    instead of reconnecting in lockstep.
+    """
+    ceiling = min(max_delay, base_delay * (2 ** min(attempt, 32)))
+    return random.uniform(0, ceiling)
 
 
 class ChatConnection:
@@ -21,10 +45,23 @@ class ChatConnection:
         self.connected = False
         self.message_callback: Optional[Callable] = None
         self.status_callback: Optional[Callable] = None
-        self.reconnect_delay = 1  # Initial reconnect delay in seconds
+        self.reconnect_delay = 1  # Base reconnect delay in seconds
         self.max_reconnect_delay = 60
+        self.reconnect_hint: Optional[float] = None  # Server-suggested delay in seconds
+        self.reconnecting = False
         self.message_queue = []  # Queue messages when offline
         self.receive_task: Optional[asyncio.Task] = None
+        self.last_seq: Dict[str, int] = {}  # Last delivered sequence number per room
+        self.rooms: Set[str] = {"general"}  # Rooms joined; all are resumed after a reconnect
+        self.has_connected = False
+        self.resuming_rooms = set()  # Rooms waiting for resume_complete
+        self.resume_buffer: List[Dict[str, Any]] = []  # Live messages held back during resume
+        # Received frames waiting to be handled, drained by dispatch_task
+        self.chat_frames: deque = deque()
+        self.status_frames: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self.frames_ready = asyncio.Event()
+        self.resync_needed = False  # Chat frames were dropped; resume once drained
+        self.dispatch_task: Optional[asyncio.Task] = None
 
     async def connect(self):
         """Connect to the WebSocket server"""
@@ -33,16 +70,21 @@ class ChatConnection:
             self.websocket = await websockets.connect(url)
             self.connected = True
             self.running = True
-            self.reconnect_delay = 1  # Reset delay on successful connection
 
             if self.status_callback:
                 self.status_callback("connected")
 
+            # Ask for anything missed while offline
+            await self.send_resume()
+            self.has_connected = True
+
             # Send queued messages
             await self.send_queued_messages()
 
-            # Start receive loop
+            # Start receive loop, and the loop handing frames to the UI
             self.receive_task = asyncio.create_task(self.receive_messages())
+            if self.dispatch_task is None or self.dispatch_task.done():
+                self.dispatch_task = asyncio.create_task(self.dispatch_messages())
 
         except Exception as e:
             self.connected = False
@@ -55,12 +97,13 @@ class ChatConnection:
         self.running = False
         self.connected = False
 
-        if self.receive_task:
-            self.receive_task.cancel()
-            try:
-                await self.receive_task
-            except asyncio.CancelledError:
-                pass
+        for task in (self.receive_task, self.dispatch_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
 
         if self.websocket:
             await self.websocket.close()
@@ -68,17 +111,20 @@ class ChatConnection:
         if self.status_callback:
             self.status_callback("disconnected")
 
-    async def send_message(self, content: str, room_id: str = "general"):
+    async def send_message(self, content: str, room_id: str = "general", trace_id: Optional[str] = None):
         """Send a message to the server"""
         message_data = {
             "type": "message",
             "content": content,
             "room_id": room_id
         }
+        if trace_id:
+            message_data["trace_id"] = trace_id
 
         if self.connected and self.websocket:
             try:
                 await self.websocket.send(json.dumps(message_data))
+                tracer.mark(trace_id, "client_send")
             except Exception as e:
                 # Queue message if send fails
                 self.message_queue.append(message_data)
@@ -110,6 +156,47 @@ class ChatConnection:
             except Exception:
                 pass
 
+    async def send_resume(self):
+        """Request replay of messages newer than the last seen sequence in each room"""
+        self.resume_buffer.clear()
+        self.resuming_rooms.clear()
+
+        # History is loaded over HTTP on the first connect; after a reconnect,
+        # rooms with nothing delivered yet are replayed from the start
+        rooms = dict.fromkeys(self.rooms, 0) if self.has_connected else {}
+        rooms.update(self.last_seq)
+
+        for room_id, last_seq in rooms.items():
+            try:
+                await self.websocket.send(json.dumps({
+                    "type": "resume",
+                    "room_id": room_id,
+                    "last_seq": last_seq
+                }))
+                self.resuming_rooms.add(room_id)
+            except Exception as e:
+                if self.status_callback:
+                    self.status_callback(f"resume_failed: {e}")
+                break
+
+    def note_seq(self, room_id: str, seq: Optional[int]):
+        """Record that messages up to seq have been seen (e.g. from history)"""
+        if seq is not None and seq > self.last_seq.get(room_id, 0):
+            self.last_seq[room_id] = seq
+
+    def deliver_chat_message(self, message_data: Dict[str, Any]):
+        """Pass a chat message to the callback unless it was already delivered"""
+        room_id = message_data.get("room_id", "general")
+        seq = message_data.get("seq")
+
+        if seq is not None:
+            if seq <= self.last_seq.get(room_id, 0):
+                return
+            self.last_seq[room_id] = seq
+
+        if self.message_callback:
+            self.message_callback(message_data)
+
     async def send_queued_messages(self):
         """Send all queued messages after reconnection"""
         if not self.message_queue:
@@ -128,14 +215,23 @@ class ChatConnection:
         self.message_queue.clear()
 
     async def receive_messages(self):
-        """Receive messages from the server"""
+        """
+        Receive messages from the server
+
+        Only control frames (pings, reconnect hints) are handled here; the
+        rest are queued for dispatch_messages, so reading the socket and
+        answering pings never wait on the UI.
+        """
         while self.running and self.websocket:
             try:
                 raw_message = await self.websocket.recv()
                 message_data = json.loads(raw_message)
 
-                # Handle different message types
-                await self.handle_message(message_data)
+                message_type = message_data.get("type")
+                if message_type in ("ping", "reconnect"):
+                    await self.handle_message(message_data)
+                else:
+                    self.queue_frame(message_data)
 
             except websockets.exceptions.ConnectionClosed:
                 self.connected = False
@@ -154,6 +250,70 @@ class ChatConnection:
                 if self.status_callback:
                     self.status_callback(f"receive_error: {e}")
 
+    def queue_frame(self, message_data: Dict[str, Any]):
+        """Queue a received frame for dispatch, by priority"""
+        message_type = message_data.get("type")
+
+        if message_type in CHAT_FRAME_TYPES:
+            if len(self.chat_frames) >= CHAT_QUEUE_LIMIT:
+                # Backed up - drop it and resume from the last delivered
+                # message once the queue has drained
+                self.resync_needed = True
+            else:
+                self.chat_frames.append(message_data)
+        else:
+            # Only the latest typing state per user and presence list matter
+            if message_type in ("typing", "user_joined", "user_left"):
+                # Typing frames carry user_id as a string, presence frames as an int
+                key = (message_type, str(message_data.get("user_id") or message_data.get("username")))
+            else:
+                key = (message_type,)
+            if message_type == "user_joined":
+                self.status_frames.pop(("user_left", key[1]), None)
+            elif message_type == "user_left":
+                self.status_frames.pop(("user_joined", key[1]), None)
+                self.status_frames.pop(("typing", key[1]), None)
+
+            self.status_frames.pop(key, None)
+            self.status_frames[key] = message_data
+            while len(self.status_frames) > STATUS_QUEUE_LIMIT:
+                self.status_frames.popitem(last=False)
+
+        self.frames_ready.set()
+
+    async def dispatch_messages(self):
+        """Hand queued frames to the message callback, chat frames first"""
+        while True:
+            await self.frames_ready.wait()
+            self.frames_ready.clear()
+
+            while self.chat_frames or self.status_frames:
+                if self.chat_frames:
+                    message_data = self.chat_frames.popleft()
+                else:
+                    _, message_data = self.status_frames.popitem(last=False)
+
+                try:
+                    await self.handle_message(message_data)
+                except Exception as e:
+                    if self.status_callback:
+                        self.status_callback(f"receive_error: {e}")
+
+                # Let the receive loop read the socket between frames
+                await asyncio.sleep(0)
+
+            if self.resync_needed and self.connected:
+                self.resync_needed = False
+                await self.send_resume()
+
+    def receive_chat_message(self, message_data: Dict[str, Any]):
+        """Deliver a chat message, holding live ones back until a replay is done"""
+        room_id = message_data.get("room_id", "general")
+        if room_id in self.resuming_rooms and not message_data.get("replay"):
+            self.resume_buffer.append(message_data)
+        else:
+            self.deliver_chat_message(message_data)
+
     async def handle_message(self, message_data: Dict[str, Any]):
         """Handle different types of messages from server"""
         message_type = message_data.get("type")
@@ -163,7 +323,23 @@ class ChatConnection:
             await self.send_pong()
 
         elif message_type == "message":
-            # Chat message - pass to callback
+            self.receive_chat_message(message_data)
+
+        elif message_type == "message_batch":
+            # Bulk import - the same chat messages, several per frame
+            for batched_message in message_data.get("messages", []):
+                self.receive_chat_message(batched_message)
+
+        elif message_type == "resume_complete":
+            # Replay finished - deliver live messages that arrived meanwhile
+            room_id = message_data.get("room_id", "general")
+            self.resuming_rooms.discard(room_id)
+
+            held = [m for m in self.resume_buffer if m.get("room_id", "general") == room_id]
+            self.resume_buffer = [m for m in self.resume_buffer if m.get("room_id", "general") != room_id]
+            for held_message in sorted(held, key=lambda m: m.get("seq") or 0):
+                self.deliver_chat_message(held_message)
+
             if self.message_callback:
                 self.message_callback(message_data)
 
@@ -182,6 +358,16 @@ class ChatConnection:
             if self.message_callback:
                 self.message_callback(message_data)
 
+        elif message_type == "reconnect":
+            # Server is draining or the room moved - it tells us when
+            # (and for a sharded room, where) to come back
+            after_ms = message_data.get("after_ms")
+            if isinstance(after_ms, (int, float)) and after_ms >= 0:
+                self.reconnect_hint = after_ms / 1000
+            url = message_data.get("url")
+            if isinstance(url, str) and url.startswith(("ws://", "wss://")):
+                self.server_url = url.rstrip("/")
+
         elif message_type == "error":
             # Error message from server
             if self.message_callback:
@@ -193,28 +379,49 @@ class ChatConnection:
                 self.message_callback(message_data)
 
     async def handle_reconnect(self):
-        """Handle reconnection with exponential backoff"""
-        if not self.running:
+        """
+        Reconnect until connected or stopped
+
+        Runs as a loop over two states: waiting out a backoff delay, then
+        attempting to connect. The first wait uses the server's reconnect
+        hint when one was received; otherwise (and after every failure) the
+        delay is exponential backoff with full jitter.
+        """
+        if self.reconnecting:
             return
 
-        if self.status_callback:
-            self.status_callback(f"reconnecting in {self.reconnect_delay}s")
+        self.reconnecting = True
+        attempt = 0
+        try:
+            while self.running and not self.connected:
+                # Backoff state
+                if self.reconnect_hint is not None:
+                    delay = self.reconnect_hint
+                    self.reconnect_hint = None
+                else:
+                    delay = full_jitter_delay(attempt, self.reconnect_delay, self.max_reconnect_delay)
 
-        await asyncio.sleep(self.reconnect_delay)
+                if self.status_callback:
+                    self.status_callback(f"reconnecting in {delay:.1f}s")
 
-        try:
-            await self.connect()
-            if self.status_callback:
-                self.status_callback("reconnected")
-        except Exception as e:
-            # Exponential backoff
-            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+                await asyncio.sleep(delay)
 
-            if self.status_callback:
-                self.status_callback(f"reconnect_failed: {e}")
+                if not self.running:
+                    break
 
-            # Try again
-            await self.handle_reconnect()
+                # Connecting state
+                try:
+                    await self.connect()
+                except Exception as e:
+                    attempt += 1
+                    if self.status_callback:
+                        self.status_callback(f"reconnect_failed: {e}")
+                    continue
+
+                if self.status_callback:
+                    self.status_callback("reconnected")
+        finally:
+            self.reconnecting = False
 
     def on_message(self, callback: Callable):
         """Register a callback for incoming messages"""
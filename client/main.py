@@ -1,21 +1,52 @@
 """
 Terminal Chat Client - Entry point
+
+Heavy modules (Textual, aiohttp, websockets, cryptography) are imported
+where they are first needed rather than here, so --config and --version
+return immediately. Textual loads to show the login screen; crypto and
+the network stack then warm up in the background while the user types.
 """
 
-import asyncio
-import aiohttp
 import os
-from typing import Dict, Any
-from .ui import ChatApp, ChatScreen
-from .connection import ChatConnection
+import threading
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Tuple
 from .config import get_config
-from shared.crypto import get_or_create_encryption
+from shared.profiling import phase, phase_timers
+from shared.tracing import tracer
+
+if TYPE_CHECKING:
+    import aiohttp
+    from shared.crypto import MessageEncryption
+    from .connection import ChatConnection
+    from .message_cache import MessageCache
+
+# Pooled HTTP connections to the server, kept alive between requests
+HTTP_POOL_LIMIT = 10
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_DNS_CACHE_SECONDS = 300
+
+# Largest page /api/history returns; delta syncs fetch pages of this size
+HISTORY_PAGE_LIMIT = 500
+# New messages fetched after the cached ones before giving up on the
+# cache and loading the latest page instead
+DELTA_SYNC_MAX_MESSAGES = 2000
+# How often shown messages are written to the local cache
+CACHE_FLUSH_SECONDS = 2
+
+# Hits shown by /search
+SEARCH_RESULT_LIMIT = 20
+# Background backfill of older history into the cache (and search index):
+# pause between pages, and the share of the cache size bound it may fill
+BACKFILL_PAUSE_SECONDS = 0.5
+BACKFILL_MAX_FRACTION = 0.8
 
 
 class ChatClient:
     """Main chat client controller integrated with Textual"""
 
     def __init__(self, server_url: str = None):
+        from .ui import ChatApp
+
         # Load configuration
         self.config = get_config()
 
@@ -24,17 +55,245 @@ class ChatClient:
         self.ws_url = self.server_url.replace('http://', 'ws://').replace('https://', 'wss://')
 
         self.app = ChatApp()
-        self.connection: ChatConnection = None
+        self.connection: Optional["ChatConnection"] = None
         self.user_id: int = None
         self.username: str = None
         self.token: str = None
 
-        # Initialize encryption
-        self.encryption = get_or_create_encryption()
+        # Encryption is loaded on first use or by the background warm-up
+        self._encryption: Optional["MessageEncryption"] = None
+        self.encryption_lock = threading.Lock()
+
+        # One HTTP session for every REST call, created on the app's event loop
+        self.session: Optional["aiohttp.ClientSession"] = None
+
+        # Local cache of shown messages, opened after login
+        self.message_cache: Optional["MessageCache"] = None
+        self.backfilling = False
+
+        # Set once shutdown has started; the app may unmount more than once
+        self.shutting_down = False
+
+        # Live chat messages held back while history loads (None otherwise)
+        self.live_buffer: Optional[List[Dict[str, Any]]] = None
+        self.first_shown_seq: Optional[int] = None
+        self.last_shown_seq: Optional[int] = None
+
+        # Page being fetched ahead of scroll-back: (before_seq, task)
+        self.prefetch: Optional[Tuple[int, Any]] = None
 
         # Set up callbacks
         self.app.set_login_callback(self.handle_login_sync)
         self.app.set_send_message_callback(self.handle_send_message_sync)
+        self.app.set_ready_callback(self.start_warm_up)
+        self.app.set_shutdown_callback(self.shutdown)
+
+    @property
+    def encryption(self) -> "MessageEncryption":
+        """Message encryption, loading the key if the warm-up has not done so yet"""
+        if self._encryption is not None:
+            return self._encryption
+        with self.encryption_lock:
+            if self._encryption is None:
+                from shared.crypto import get_or_create_encryption
+                self._encryption = get_or_create_encryption()
+            return self._encryption
+
+    def start_warm_up(self):
+        """Start warming up while the login screen is shown"""
+        # Own group, so pressing Login (an exclusive worker) does not cancel it
+        self.app.run_worker(self.prepare(), group="warm_up")
+
+    async def prepare(self):
+        """Load modules and the key in a thread, then open a connection to the server"""
+        import asyncio
+        await asyncio.get_event_loop().run_in_executor(None, self.warm_up)
+        await self.prewarm_http()
+
+    def warm_up(self):
+        """Import the modules needed after login and load the encryption key"""
+        with phase("startup.warm_up"):
+            import aiohttp  # noqa: F401
+            from . import connection  # noqa: F401
+            self.encryption.get_key()
+
+    def http_session(self) -> "aiohttp.ClientSession":
+        """Get the shared HTTP session, creating it on first use"""
+        import aiohttp
+
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=HTTP_DNS_CACHE_SECONDS
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def prewarm_http(self):
+        """
+        Resolve the server and complete the TCP/TLS handshake ahead of login
+
+        The pooled connection is then reused by the login request. Failures
+        are ignored here; login reports them.
+        """
+        import aiohttp
+
+        try:
+            with phase("startup.prewarm_http"):
+                async with self.http_session().get(
+                    f"{self.server_url}/api/health", timeout=aiohttp.ClientTimeout(total=10)
+                ) as response:
+                    await response.read()
+        except Exception:
+            pass
+
+    async def close_http_session(self):
+        """Close the shared HTTP session and its pooled connections"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def shutdown(self):
+        """Disconnect, write out the message cache and close the HTTP session"""
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+
+        try:
+            if self.connection:
+                await self.connection.disconnect()
+        finally:
+            if self.message_cache is not None:
+                try:
+                    self.message_cache.close()
+                except Exception:
+                    pass
+                self.message_cache = None
+            await self.close_http_session()
+
+    def open_message_cache(self):
+        """Open the local message cache of this server, unless it is turned off"""
+        if self.message_cache is not None or not self.config.get("message_cache", True):
+            return
+
+        from .message_cache import MessageCache, cache_path
+
+        try:
+            with phase("cache.open"):
+                self.message_cache = MessageCache(
+                    cache_path(self.config.config_dir / "cache", self.server_url),
+                    int(self.config.get("message_cache_max_mb", 50) * 1024 * 1024),
+                    self.encryption if self.config.get("message_cache_encrypted", False) else None
+                )
+        except Exception:
+            # Work without a cache rather than fail the login
+            self.message_cache = None
+            return
+
+        self.app.set_interval(CACHE_FLUSH_SECONDS, self.flush_message_cache)
+
+    def flush_message_cache(self):
+        """Write messages shown since the last flush to the local cache"""
+        if self.message_cache is None:
+            return
+        try:
+            with phase("cache.flush"):
+                self.message_cache.flush()
+        except Exception:
+            pass
+
+    def show_cached_messages(self):
+        """Show the latest cached messages before anything is fetched"""
+        chat_screen = self.app.get_chat_screen()
+        if not chat_screen or self.message_cache is None:
+            return
+
+        try:
+            with phase("cache.load"):
+                records = self.message_cache.latest("general", self.config.get('message_history_limit', 50))
+        except Exception:
+            return
+
+        for record in records:
+            self.show_chat_message(chat_screen, record, record["content"], play_sound=False,
+                                   phase_prefix="cache", store=False)
+
+    def handle_search_sync(self, query: str):
+        """Synchronous wrapper for the /search callback"""
+        self.app.run_worker(self.search(query), group="search")
+
+    async def search(self, query: str):
+        """Search the local message index and show the best hits"""
+        import asyncio
+        import time
+
+        chat_screen = self.app.get_chat_screen()
+        if not chat_screen:
+            return
+        if self.message_cache is None or not self.message_cache.searchable:
+            chat_screen.add_system_message("Search needs the local message cache (message_cache in config)")
+            return
+
+        # In a thread, so a flush or backfill holding the database does not stall the UI
+        started = time.perf_counter()
+        try:
+            with phase("search.query"):
+                hits = await asyncio.get_event_loop().run_in_executor(
+                    None, self.message_cache.search, query, SEARCH_RESULT_LIMIT
+                )
+        except Exception as e:
+            chat_screen.add_system_message(f"Search failed: {str(e)}")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        indexing = self.backfilling or not self.message_cache.indexed
+        chat_screen.show_search_results(query, hits, elapsed_ms, indexing)
+
+    async def backfill_history(self):
+        """
+        Fetch older history page by page into the cache, so search covers it
+
+        Runs in the background after login: pages are decrypted on the
+        worker pool and written in a thread, with a pause between pages.
+        Stops at the start of the room or when the cache is nearly full.
+        """
+        import asyncio
+
+        cache = self.message_cache
+        loop = asyncio.get_event_loop()
+        self.backfilling = True
+        try:
+            # An encrypted cache is indexed in memory, from scratch each run
+            with phase("backfill.index_existing"):
+                await loop.run_in_executor(None, cache.index_existing)
+
+            before_seq = await loop.run_in_executor(None, cache.first_seq, "general")
+            while (before_seq or 0) > 1 and cache.total_bytes < cache.max_bytes * BACKFILL_MAX_FRACTION:
+                with phase("backfill.fetch"):
+                    messages = await self.fetch_history(before_seq=before_seq, limit=HISTORY_PAGE_LIMIT)
+                if not messages:
+                    break
+
+                contents = []
+                async for chunk in self.encryption.decrypt_stream([m.get("content", "") for m in messages]):
+                    contents.extend(chunk)
+
+                def store():
+                    for msg, content in zip(messages, contents):
+                        if content is not None:
+                            cache.add(msg, content)
+                    cache.flush()
+
+                with phase("backfill.store"):
+                    await loop.run_in_executor(None, store)
+
+                before_seq = messages[0].get("seq")
+                await asyncio.sleep(BACKFILL_PAUSE_SECONDS)
+        except Exception:
+            # Search still covers what was cached; the next run continues
+            pass
+        finally:
+            self.backfilling = False
 
     def handle_login_sync(self, username: str, password: str, action: str):
         """Synchronous wrapper for login callback"""
@@ -50,42 +309,61 @@ class ChatClient:
 
     async def handle_login(self, username: str, password: str, action: str):
         """Handle login or registration"""
+        import asyncio
+        import aiohttp
+
         try:
-            async with aiohttp.ClientSession() as session:
-                endpoint = f"{self.server_url}/api/{action}"
-                data = {"username": username, "password": password}
+            session = self.http_session()
+            endpoint = f"{self.server_url}/api/{action}"
+            data = {"username": username, "password": password}
 
-                try:
-                    async with session.post(endpoint, json=data, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                        if response.status in [200, 201]:
-                            result = await response.json()
-                            self.token = result.get("access_token")
-                            self.user_id = result.get("user_id")
-                            self.username = result.get("username")
-
-                            # Switch to chat screen
-                            self.app.show_chat(self.username, self.user_id, self.token)
-
-                            # Connect to WebSocket
-                            await self.connect_websocket()
-
-                            # Load message history
-                            await self.load_history()
-
-                        else:
-                            try:
-                                error_data = await response.json()
-                                error_msg = error_data.get("detail", f"Server error ({response.status})")
-                            except:
-                                error_msg = f"Server returned status {response.status}"
-                            self.app.show_login_error(error_msg)
-
-                except aiohttp.ClientConnectorError:
-                    self.app.show_login_error(f"Cannot connect to server at {self.server_url}. Is it running?")
-                except aiohttp.ClientResponseError as e:
-                    self.app.show_login_error(f"Server error: {e.status}")
-                except asyncio.TimeoutError:
-                    self.app.show_login_error("Connection timeout. Server is not responding.")
+            try:
+                with phase("login.request"):
+                    response = await session.post(endpoint, json=data, timeout=aiohttp.ClientTimeout(total=10))
+                async with response:
+                    if response.status in [200, 201]:
+                        result = await response.json()
+                        self.token = result.get("access_token")
+                        self.user_id = result.get("user_id")
+                        self.username = result.get("username")
+
+                        # Switch to chat screen
+                        self.app.show_chat(self.username, self.user_id, self.token)
+                        chat_screen = self.app.get_chat_screen()
+                        if chat_screen:
+                            chat_screen.set_load_older_callback(self.handle_load_older_sync)
+                            chat_screen.set_load_newer_callback(self.handle_load_newer_sync)
+                            chat_screen.set_search_callback(self.handle_search_sync)
+
+                        # Show cached messages right away, then connect to
+                        # WebSocket and load history concurrently; live
+                        # messages wait in the buffer until history is in
+                        self.live_buffer = []
+                        self.open_message_cache()
+                        self.show_cached_messages()
+                        await asyncio.gather(self.connect_websocket(), self.load_history())
+
+                        # Have the page before the history ready for scroll-back
+                        self.prefetch_older(self.first_shown_seq)
+
+                        # Index older history for /search while the user chats
+                        if self.message_cache is not None and self.config.get("history_backfill", True):
+                            self.app.run_worker(self.backfill_history(), group="backfill")
+
+                    else:
+                        try:
+                            error_data = await response.json()
+                            error_msg = error_data.get("detail", f"Server error ({response.status})")
+                        except:
+                            error_msg = f"Server returned status {response.status}"
+                        self.app.show_login_error(error_msg)
+
+            except aiohttp.ClientConnectorError:
+                self.app.show_login_error(f"Cannot connect to server at {self.server_url}. Is it running?")
+            except aiohttp.ClientResponseError as e:
+                self.app.show_login_error(f"Server error: {e.status}")
+            except asyncio.TimeoutError:
+                self.app.show_login_error("Connection timeout. Server is not responding.")
 
         except aiohttp.ClientError as e:
             self.app.show_login_error(f"Network error: {type(e).__name__}")
@@ -94,12 +372,19 @@ class ChatClient:
 
     async def connect_websocket(self):
         """Connect to WebSocket server"""
+        from .connection import ChatConnection
+
         try:
             self.connection = ChatConnection(self.ws_url, self.user_id, self.token)
+            self.connection.reconnect_delay = self.config.get('reconnect_delay', 1)
+            self.connection.max_reconnect_delay = self.config.get('max_reconnect_delay', 60)
 
             # Set up message and status callbacks
             self.connection.on_message(self.handle_incoming_message)
             self.connection.on_status_change(self.handle_status_change)
+            if self.last_shown_seq is not None:
+                # History arrived first
+                self.connection.note_seq("general", self.last_shown_seq)
 
             # Connect
             await self.connection.connect()
@@ -131,8 +416,53 @@ class ChatClient:
                 chat_screen.update_status(f"Connection error")
                 chat_screen.add_system_message(f"Failed to connect: {str(e)}")
 
+    async def fetch_history(self, before_seq: Optional[int] = None, limit: Optional[int] = None,
+                            after_seq: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Fetch a page of history, oldest first; None if the server refused"""
+        limit = limit or self.config.get('message_history_limit', 50)
+        endpoint = f"{self.server_url}/api/history?limit={limit}"
+        if before_seq is not None:
+            endpoint += f"&before_seq={before_seq}"
+        if after_seq is not None:
+            endpoint += f"&after_seq={after_seq}"
+
+        async with self.http_session().get(endpoint) as response:
+            return await response.json() if response.status == 200 else None
+
+    async def fetch_new_messages(self, after_seq: int,
+                                 until_seq: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch every message after after_seq (up to until_seq, if given), oldest first
+
+        Returns None when more than DELTA_SYNC_MAX_MESSAGES are new, or when
+        the server refused or ignored after_seq; the latest page should be
+        loaded instead.
+        """
+        messages: List[Dict[str, Any]] = []
+        while len(messages) < DELTA_SYNC_MAX_MESSAGES:
+            limit = HISTORY_PAGE_LIMIT
+            if until_seq is not None:
+                limit = max(1, min(limit, until_seq - after_seq))
+            page = await self.fetch_history(after_seq=after_seq, limit=limit)
+            if page is None or (page and (page[0].get("seq") or 0) <= after_seq):
+                return None
+            messages.extend(page)
+            if len(page) < limit:
+                return messages
+            after_seq = page[-1].get("seq")
+            if until_seq is not None and after_seq >= until_seq:
+                return messages
+        return None
+
     async def load_history(self):
-        """Load message history from server"""
+        """
+        Load message history from server
+
+        When cached messages are shown, only newer ones are fetched. Runs
+        while the WebSocket connects, so live messages may arrive first;
+        those are held back and shown after the history (see
+        show_held_messages).
+        """
         chat_screen = self.app.get_chat_screen()
 
         try:
@@ -140,43 +470,299 @@ class ChatClient:
             if chat_screen:
                 chat_screen.update_status("Loading message history...")
 
-            async with aiohttp.ClientSession() as session:
-                history_limit = self.config.get('message_history_limit', 50)
-                endpoint = f"{self.server_url}/api/history?limit={history_limit}"
+            with phase("history.fetch"):
+                messages = None
+                if self.last_shown_seq is not None:
+                    messages = await self.fetch_new_messages(self.last_shown_seq)
+                    if messages is None:
+                        # Too far behind to catch up; start over from the latest page
+                        self.forget_cached_messages()
+                if self.last_shown_seq is None:
+                    messages = await self.fetch_history()
 
-                async with session.get(endpoint) as response:
-                    if response.status == 200:
-                        messages = await response.json()
+            if messages is not None and chat_screen:
+                if messages:
+                    chat_screen.add_system_message(f"Loading {len(messages)} messages...")
 
-                        if chat_screen:
-                            if messages:
-                                chat_screen.add_system_message(f"Loading {len(messages)} messages...")
-
-                            for msg in messages:
-                                # Decrypt message content
-                                encrypted_content = msg.get("content")
-                                try:
-                                    content = self.encryption.decrypt(encrypted_content)
-                                except Exception as e:
-                                    content = f"[Decryption failed]"
-
-                                # Don't play sound for history messages
-                                chat_screen.add_message(
-                                    msg.get("username"),
-                                    content,
-                                    msg.get("timestamp"),
-                                    play_sound=False
-                                )
-
-                            if messages:
-                                chat_screen.add_system_message("Message history loaded")
-                            chat_screen.update_status("Connected")
+                # Don't play sound for history messages
+                await self.show_history_messages(messages)
+
+                if messages:
+                    chat_screen.add_system_message("Message history loaded")
+                chat_screen.update_status("Connected")
 
         except Exception as e:
             if chat_screen:
                 chat_screen.add_system_message(f"Failed to load history: {str(e)}")
                 chat_screen.update_status("Connected (history load failed)")
 
+        finally:
+            await self.show_held_messages()
+            self.flush_message_cache()
+
+    def forget_cached_messages(self):
+        """Drop the cached messages of the room from the cache and the screen"""
+        if self.message_cache is not None:
+            self.message_cache.clear_room("general")
+        chat_screen = self.app.get_chat_screen()
+        if chat_screen:
+            chat_screen.clear_messages(announce=False)
+        self.first_shown_seq = None
+        self.last_shown_seq = None
+
+    async def show_held_messages(self):
+        """
+        Show held-back live messages in seq order
+
+        Messages missing between the last one shown and the first held one
+        (e.g. sent after the history snapshot but before the WebSocket was
+        registered) are fetched first, page by page; if there are more than
+        DELTA_SYNC_MAX_MESSAGES, a notice says how many were skipped. Live
+        messages arriving meanwhile are held too.
+        """
+        while self.live_buffer:
+            first_seq = min(msg.get("seq") or 0 for msg in self.live_buffer)
+            if self.last_shown_seq is not None and first_seq > self.last_shown_seq + 1:
+                missed = first_seq - self.last_shown_seq - 1
+                try:
+                    with phase("history.fetch"):
+                        gap = await self.fetch_new_messages(self.last_shown_seq, until_seq=first_seq - 1)
+                except Exception:
+                    gap = None
+                if gap is None:
+                    # Too many to fetch, or the server is unreachable
+                    chat_screen = self.app.get_chat_screen()
+                    if chat_screen:
+                        chat_screen.add_system_message(f"{missed} missed messages were skipped")
+                else:
+                    self.show_chat_messages([msg for msg in gap if (msg.get("seq") or 0) < first_seq],
+                                            play_sound=False, phase_prefix="history")
+
+            held, self.live_buffer = self.live_buffer, []
+            self.show_chat_messages(held)
+        self.live_buffer = None
+
+    def unseen_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Messages not yet shown, in seq order"""
+        unseen = []
+        last_seq = self.last_shown_seq
+        for msg in sorted(messages, key=lambda m: m.get("seq") or 0):
+            seq = msg.get("seq")
+            if seq is not None:
+                # seq is unique per room, so this also drops duplicate ids
+                if last_seq is not None and seq <= last_seq:
+                    continue
+                last_seq = seq
+            unseen.append(msg)
+        return unseen
+
+    def show_chat_messages(self, messages: List[Dict[str, Any]], play_sound: bool = True,
+                           phase_prefix: str = "message"):
+        """Show chat messages in seq order, skipping any already shown"""
+        chat_screen = self.app.get_chat_screen()
+        if not chat_screen:
+            return
+
+        for msg in self.unseen_messages(messages):
+            try:
+                with phase(f"{phase_prefix}.decrypt"):
+                    content = self.encryption.decrypt(msg.get("content", ""))
+                decrypted = True
+            except Exception as e:
+                content = f"[Decryption failed: {str(e)}]"
+                decrypted = False
+            self.show_chat_message(chat_screen, msg, content, play_sound, phase_prefix, store=decrypted)
+
+    async def show_history_messages(self, messages: List[Dict[str, Any]]):
+        """
+        Show a page of history, decrypting it off the event loop
+
+        Chunks are decrypted on a worker pool and rendered as each one is
+        ready, so the first messages appear quickly and the UI stays
+        responsive through long histories.
+        """
+        import asyncio
+
+        chat_screen = self.app.get_chat_screen()
+        if not chat_screen:
+            return
+
+        messages = self.unseen_messages(messages)
+        position = 0
+        with phase("history.decrypt_render"):
+            async for contents in self.encryption.decrypt_stream([m.get("content", "") for m in messages]):
+                for content in contents:
+                    msg = messages[position]
+                    position += 1
+                    # Skip anything shown meanwhile (e.g. by a gap fetch)
+                    seq = msg.get("seq")
+                    if seq is not None and self.last_shown_seq is not None and seq <= self.last_shown_seq:
+                        continue
+                    self.show_chat_message(chat_screen, msg, content if content is not None else "[Decryption failed]",
+                                           play_sound=False, phase_prefix="history", store=content is not None)
+                # Let the screen repaint before the next chunk
+                await asyncio.sleep(0)
+
+    def show_chat_message(self, chat_screen, message_data: Dict[str, Any], content: str,
+                          play_sound: bool = True, phase_prefix: str = "message", store: bool = True):
+        """Add a decrypted chat message to the chat screen, and to the local cache if store is set"""
+        seq = message_data.get("seq")
+        if seq is not None:
+            self.last_shown_seq = seq
+            if self.first_shown_seq is None or seq < self.first_shown_seq:
+                self.first_shown_seq = seq
+        trace_id = message_data.get("trace_id")
+        tracer.mark(trace_id, "remote_decrypt", peer=self.user_id)
+
+        with phase(f"{phase_prefix}.render"):
+            chat_screen.add_message(
+                message_data.get("username", "Unknown"),
+                content,
+                message_data.get("timestamp"),
+                play_sound=play_sound,
+                seq=seq,
+                trace_id=trace_id
+            )
+
+        if store and self.message_cache is not None:
+            self.message_cache.add(message_data, content)
+
+        # Remember position so reconnects only fetch the gap
+        if self.connection:
+            self.connection.note_seq(message_data.get("room_id", "general"), seq)
+
+    def handle_load_older_sync(self, before_seq: int):
+        """Synchronous wrapper for the scroll-back callback"""
+        self.app.run_worker(self.load_older(before_seq), group="history")
+
+    async def fetch_older_page(self, before_seq: int) -> Tuple[List[tuple], bool]:
+        """
+        Get the page of messages before before_seq, decrypted
+
+        From the cache if it has all of it, otherwise from the server (the
+        page is then cached).
+
+        Returns:
+            (username, content, timestamp, seq) tuples, oldest first, and
+            whether the page reaches the start of the room
+        """
+        limit = self.config.get('message_history_limit', 50)
+
+        if self.message_cache is not None:
+            try:
+                cached = self.message_cache.before("general", before_seq, limit)
+            except Exception:
+                cached = []
+            if len(cached) == limit or (cached and cached[0]["seq"] == 1):
+                page = [(r["username"], r["content"], r["timestamp"], r["seq"]) for r in cached]
+                return page, cached[0]["seq"] == 1
+
+        with phase("history.fetch"):
+            messages = await self.fetch_history(before_seq, limit)
+        if messages is None:
+            raise RuntimeError("server refused the request")
+        page = await self.decrypt_page(messages)
+
+        # A short page means nothing older is left
+        return page, len(messages) < limit or (bool(messages) and messages[0].get("seq") == 1)
+
+    async def decrypt_page(self, messages: List[Dict[str, Any]]) -> List[tuple]:
+        """
+        Decrypt a fetched page on the worker pool and cache it
+
+        Returns:
+            (username, content, timestamp, seq) tuples in the same order
+        """
+        contents = []
+        async for chunk in self.encryption.decrypt_stream([m.get("content", "") for m in messages]):
+            contents.extend(chunk)
+
+        page = []
+        for msg, content in zip(messages, contents):
+            if content is not None and self.message_cache is not None:
+                self.message_cache.add(msg, content)
+            page.append((
+                msg.get("username", "Unknown"),
+                content if content is not None else "[Decryption failed]",
+                msg.get("timestamp"),
+                msg.get("seq")
+            ))
+        return page
+
+    def prefetch_older(self, before_seq: Optional[int]):
+        """Start fetching the page before before_seq, for the next scroll to the top"""
+        import asyncio
+
+        if self.prefetch is not None:
+            self.prefetch[1].cancel()
+            self.prefetch = None
+        if before_seq is None or before_seq <= 1:
+            return
+
+        task = asyncio.ensure_future(self.fetch_older_page(before_seq))
+        # A failed prefetch is retried when the page is wanted
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.prefetch = (before_seq, task)
+
+    async def load_older(self, before_seq: int):
+        """Show the page before before_seq above the messages shown, then prefetch the one before it"""
+        chat_screen = self.app.get_chat_screen()
+
+        page, reached_start = [], False
+        prefetch, self.prefetch = self.prefetch, None
+        try:
+            if prefetch is not None and prefetch[0] == before_seq:
+                try:
+                    page, reached_start = await prefetch[1]
+                except Exception:
+                    page, reached_start = await self.fetch_older_page(before_seq)
+            else:
+                if prefetch is not None:
+                    prefetch[1].cancel()
+                page, reached_start = await self.fetch_older_page(before_seq)
+        except Exception as e:
+            if chat_screen:
+                chat_screen.add_system_message(f"Failed to load older messages: {str(e)}")
+
+        if not chat_screen:
+            return
+        chat_screen.add_older_messages(page, reached_start=reached_start)
+
+        if page and not reached_start:
+            self.prefetch_older(page[0][3])
+
+    def handle_load_newer_sync(self, after_seq: int):
+        """Synchronous wrapper for the callback that refills evicted newer messages"""
+        self.app.run_worker(self.load_newer(after_seq), group="history")
+
+    async def load_newer(self, after_seq: int):
+        """Show the page after after_seq below the messages shown"""
+        chat_screen = self.app.get_chat_screen()
+        if not chat_screen:
+            return
+
+        limit = self.config.get('message_history_limit', 50)
+        page = []
+        try:
+            if self.message_cache is not None:
+                # Every message received was cached, so this usually suffices
+                self.flush_message_cache()
+                cached = self.message_cache.after("general", after_seq, limit)
+                page = [(r["username"], r["content"], r["timestamp"], r["seq"]) for r in cached]
+            if len(page) < limit and (not page or page[-1][3] < (self.last_shown_seq or 0)):
+                with phase("history.fetch"):
+                    messages = await self.fetch_history(limit=limit, after_seq=after_seq)
+                if messages is None:
+                    raise RuntimeError("server refused the request")
+                page = await self.decrypt_page(messages)
+        except Exception as e:
+            chat_screen.add_system_message(f"Failed to load newer messages: {str(e)}")
+            chat_screen.add_newer_messages([], reached_end=False)
+            return
+
+        reached_end = not page or page[-1][3] >= (self.last_shown_seq or 0)
+        chat_screen.add_newer_messages(page, reached_end=reached_end)
+
     def handle_incoming_message(self, message_data: Dict[str, Any]):
         """Handle incoming WebSocket messages"""
         message_type = message_data.get("type")
@@ -186,18 +772,16 @@ class ChatClient:
             return
 
         if message_type == "message":
-            # Regular chat message - decrypt content
-            username = message_data.get("username", "Unknown")
-            encrypted_content = message_data.get("content", "")
-            timestamp = message_data.get("timestamp")
-
-            # Decrypt the message
-            try:
-                content = self.encryption.decrypt(encrypted_content)
-            except Exception as e:
-                content = f"[Decryption failed: {str(e)}]"
-
-            chat_screen.add_message(username, content, timestamp)
+            # Regular chat message - held back while history or a gap is loading
+            seq = message_data.get("seq")
+            if self.live_buffer is not None:
+                self.live_buffer.append(message_data)
+            elif self.last_shown_seq is not None and seq is not None and seq > self.last_shown_seq + 1:
+                # Messages are missing before this one; fetch them first
+                self.live_buffer = [message_data]
+                self.app.run_worker(self.show_held_messages())
+            else:
+                self.show_chat_messages([message_data])
 
         elif message_type == "user_joined":
             # User joined notification
@@ -219,6 +803,16 @@ class ChatClient:
 
             chat_screen.update_online_users(count, usernames)
 
+        elif message_type == "resume_complete":
+            # Missed messages were replayed after a reconnect
+            replayed = message_data.get("replayed", 0)
+            if message_data.get("truncated"):
+                chat_screen.add_system_message(
+                    f"Replayed the last {replayed} missed messages (older ones skipped)"
+                )
+            elif replayed:
+                chat_screen.add_system_message(f"Caught up on {replayed} missed messages")
+
         elif message_type == "error":
             # Error message from server
             error_message = message_data.get("message", "Unknown error")
@@ -271,11 +865,15 @@ class ChatClient:
                     chat_screen.add_system_message("Message too long (max 5000 characters)")
                 return
 
+            # Trace id for latency tracing (None unless tracing is on)
+            trace_id = tracer.new_trace_id()
+            tracer.mark(trace_id, "client_encrypt")
+
             if self.connection and self.connection.connected:
                 try:
                     # Encrypt message before sending
                     encrypted_message = self.encryption.encrypt(message)
-                    await self.connection.send_message(encrypted_message)
+                    await self.connection.send_message(encrypted_message, trace_id=trace_id)
                 except Exception as e:
                     chat_screen = self.app.get_chat_screen()
                     if chat_screen:
@@ -283,7 +881,7 @@ class ChatClient:
                         # Queue the message for retry
                         if self.connection:
                             encrypted_message = self.encryption.encrypt(message)
-                            await self.connection.send_message(encrypted_message)
+                            await self.connection.send_message(encrypted_message, trace_id=trace_id)
             else:
                 chat_screen = self.app.get_chat_screen()
                 if chat_screen:
@@ -292,7 +890,7 @@ class ChatClient:
                     if self.connection:
                         try:
                             encrypted_message = self.encryption.encrypt(message)
-                            await self.connection.send_message(encrypted_message)
+                            await self.connection.send_message(encrypted_message, trace_id=trace_id)
                         except Exception as e:
                             chat_screen.add_system_message(f"Failed to queue message: {str(e)}")
         except Exception as e:
@@ -300,19 +898,36 @@ class ChatClient:
             if chat_screen:
                 chat_screen.add_system_message(f"Error: {str(e)}")
 
-    async def shutdown(self):
-        """Clean shutdown"""
-        if self.connection:
-            await self.connection.disconnect()
-
     def run(self):
-        """Run the chat client"""
+        """Run the chat client (the app runs shutdown as it unmounts)"""
+        self.app.run()
+
+
+def run_profiled(client: ChatClient, profile_file: str, mode: str):
+    """
+    Run the client under a profiler and write the capture on exit
+
+    mode "cprofile" writes pstats data (open with pstats or snakeviz);
+    "sample" writes folded stacks of the UI thread (flamegraph.pl, speedscope).
+    """
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
         try:
-            self.app.run()
+            profiler.runcall(client.run)
         finally:
-            # Cleanup
-            if self.connection:
-                asyncio.run(self.shutdown())
+            profiler.dump_stats(profile_file)
+    else:
+        from shared.profiling import SamplingProfiler
+        sampler = SamplingProfiler()
+        sampler.start()
+        try:
+            client.run()
+        finally:
+            sampler.stop()
+            with open(profile_file, "w") as f:
+                f.write(sampler.folded())
+    print(f"Profile written to {profile_file}")
 
 
 def main():
@@ -335,6 +950,31 @@ def main():
         action="store_true",
         help="Show current configuration and exit"
     )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        metavar="FILE",
+        help="Profile the client and write the capture to FILE on exit",
+        default=None
+    )
+    parser.add_argument(
+        "--profile-mode",
+        choices=["sample", "cprofile"],
+        default="sample",
+        help="sample: folded stacks for flame graphs (low overhead); cprofile: pstats data"
+    )
+    parser.add_argument(
+        "--phase-timers",
+        action="store_true",
+        help="Time login, history load, decrypt and render and print a summary on exit"
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="FILE",
+        help="Trace sent and received messages, appending spans to FILE",
+        default=None
+    )
     parser.add_argument(
         "--version",
         "-v",
@@ -356,9 +996,21 @@ def main():
         print(f"  Message history limit: {config.get('message_history_limit')}")
         return
 
+    if args.phase_timers:
+        phase_timers.enabled = True
+    if args.trace:
+        tracer.open(args.trace)
+
     # Create and run client
     client = ChatClient(server_url=args.server)
-    client.run()
+    if args.profile:
+        run_profiled(client, args.profile, args.profile_mode)
+    else:
+        client.run()
+
+    tracer.close()
+    if phase_timers.enabled:
+        print(phase_timers.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,466 @@
+"""
+Local message cache for instant startup, delta sync and search
+
+Chat messages the client has shown are kept in a SQLite database per
+server under ~/.terminal-chat/cache/, keyed by room and seq and indexed by
+message id and timestamp. At startup the latest cached page is shown
+straight from disk, and only messages newer than the last cached seq are
+requested from the server.
+
+Records hold decrypted message text. With encrypted mode on, the username
+and text of each record are encrypted with the local key before they are
+written, so nothing readable is stored at rest. The database is bounded
+in size; the oldest messages are evicted first.
+
+Cached messages are also indexed for full-text search (SQLite FTS5). In
+plain mode the index lives in the database and follows the messages table
+through triggers. In encrypted mode it is kept in memory only, filled from
+the cache in the background and as messages are added.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from shared.crypto import MessageEncryption
+
+# Eviction frees space down to this share of the size bound, so it runs
+# once per chunk of messages rather than on every write
+EVICT_TO_FRACTION = 0.9
+
+# Bytes counted per record on top of its text fields (keys and index entries)
+RECORD_OVERHEAD_BYTES = 64
+
+# Encrypted records decrypted per batch when building the in-memory index
+INDEX_BATCH_SIZE = 1000
+
+# Matches scored per search, the most recently cached first
+SEARCH_WINDOW = 2000
+
+# Longest snippet shown for a search hit, in characters
+SNIPPET_LENGTH = 160
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    room_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    id INTEGER,
+    user_id INTEGER,
+    username TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (room_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_id ON messages (id);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Search index over the plaintext messages table, kept in step by triggers
+DISK_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE message_search USING fts5(
+    content, content='messages', content_rowid='rowid', prefix='2 3'
+);
+CREATE TRIGGER message_search_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO message_search (rowid, content) VALUES (new.rowid, new.content);
+END;
+CREATE TRIGGER message_search_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO message_search (message_search, rowid, content) VALUES ('delete', old.rowid, old.content);
+END;
+CREATE TRIGGER message_search_update AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO message_search (message_search, rowid, content) VALUES ('delete', old.rowid, old.content);
+    INSERT INTO message_search (rowid, content) VALUES (new.rowid, new.content);
+END;
+INSERT INTO message_search (message_search) VALUES ('rebuild');
+"""
+
+DROP_DISK_SEARCH = """
+DROP TRIGGER IF EXISTS message_search_insert;
+DROP TRIGGER IF EXISTS message_search_delete;
+DROP TRIGGER IF EXISTS message_search_update;
+DROP TABLE IF EXISTS message_search;
+"""
+
+# In-memory index for encrypted mode; rowids match the messages table
+MEMORY_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE message_search USING fts5(
+    content, room_id UNINDEXED, seq UNINDEXED, username UNINDEXED, timestamp UNINDEXED,
+    prefix='2 3'
+);
+"""
+
+UPSERT = (
+    "INSERT INTO messages (room_id, seq, id, user_id, username, content, timestamp, size) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (room_id, seq) DO UPDATE SET id = excluded.id, user_id = excluded.user_id, "
+    "username = excluded.username, content = excluded.content, timestamp = excluded.timestamp, "
+    "size = excluded.size"
+)
+
+
+def cache_path(cache_dir: Path, server_url: str) -> Path:
+    """Get the database file of a server's cache"""
+    host = re.sub(r"[^A-Za-z0-9.-]+", "_", urlparse(server_url).netloc) or "server"
+    digest = hashlib.sha1(server_url.encode("utf-8")).hexdigest()[:12]
+    return cache_dir / f"{host}-{digest}.db"
+
+
+def fts5_available() -> bool:
+    """Check whether this Python's SQLite was built with FTS5"""
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    Turn a search box query into an FTS5 match expression
+
+    Every word must appear, as a prefix of a word in the message; quotes
+    and FTS5 operators in the query are treated as plain text.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def highlight(content: str, words: List[str], length: int = SNIPPET_LENGTH) -> str:
+    """Wrap the words of a search (as prefixes) in [reverse] markup, cut to length around the first one"""
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\w*", re.IGNORECASE)
+
+    first = pattern.search(content)
+    start = max(0, (first.start() if first else 0) - length // 4)
+    end = start + length
+    text = content[start:end]
+    text = ("…" if start > 0 else "") + text + ("…" if end < len(content) else "")
+    return pattern.sub(lambda match: f"[reverse]{match.group(0)}[/reverse]", text)
+
+
+class MessageCache:
+    """On-disk store of the chat messages of one server"""
+
+    def __init__(self, path: Path, max_bytes: int, encryption: Optional["MessageEncryption"] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.encryption = encryption  # Set for encrypted-at-rest mode
+        self.pending: List[tuple] = []  # Rows waiting for the next flush
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+        # Records written in the other mode cannot be read (or must not stay)
+        mode = "encrypted" if self.encryption else "plain"
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'mode'").fetchone()
+        if row is None or row[0] != mode:
+            with self.db:
+                self.db.execute("DELETE FROM messages")
+                self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('mode', ?)", (mode,))
+
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM messages").fetchone()[0]
+
+        # Search index: on disk for plaintext, in memory for encrypted records
+        self.search_db: Optional[sqlite3.Connection] = None
+        self.indexed = False  # The index covers every cached record
+        if fts5_available():
+            if self.encryption:
+                self.db.executescript(DROP_DISK_SEARCH)
+                self.search_db = sqlite3.connect(":memory:", check_same_thread=False)
+                self.search_db.executescript(MEMORY_SEARCH_SCHEMA)
+            else:
+                exists = self.db.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'message_search'"
+                ).fetchone()
+                if not exists:
+                    self.db.executescript(DISK_SEARCH_SCHEMA)
+                self.search_db = self.db
+                self.indexed = True
+
+    @property
+    def searchable(self) -> bool:
+        return self.search_db is not None
+
+    # Reading
+
+    def latest(self, room_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Get the newest limit messages of a room, oldest first"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT room_id, seq, id, user_id, username, content, timestamp FROM messages "
+                "WHERE room_id = ? ORDER BY seq DESC LIMIT ?",
+                (room_id, limit)
+            ).fetchall()
+        return self.records(reversed(rows))
+
+    def before(self, room_id: str, before_seq: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get up to limit messages right before before_seq, oldest first
+
+        Only an unbroken run of seqs ending at before_seq - 1 is returned,
+        so the page can stand in for the server's.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT room_id, seq, id, user_id, username, content, timestamp FROM messages "
+                "WHERE room_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (room_id, before_seq, limit)
+            ).fetchall()
+
+        run = []
+        expected = before_seq - 1
+        for row in rows:
+            if row[1] != expected:
+                break
+            run.append(row)
+            expected -= 1
+        return self.records(reversed(run))
+
+    def after(self, room_id: str, after_seq: int, limit: int) -> List[Dict[str, Any]]:
+        """Get up to limit messages right after after_seq, oldest first (an unbroken run, as in before)"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT room_id, seq, id, user_id, username, content, timestamp FROM messages "
+                "WHERE room_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (room_id, after_seq, limit)
+            ).fetchall()
+
+        run = []
+        expected = after_seq + 1
+        for row in rows:
+            if row[1] != expected:
+                break
+            run.append(row)
+            expected += 1
+        return self.records(run)
+
+    def first_seq(self, room_id: str) -> Optional[int]:
+        """Get the oldest cached seq of a room, or None if it has none"""
+        with self.lock:
+            return self.db.execute("SELECT MIN(seq) FROM messages WHERE room_id = ?", (room_id,)).fetchone()[0]
+
+    def records(self, rows) -> List[Dict[str, Any]]:
+        """Turn rows into message dicts shaped like /api/history, with decrypted content"""
+        records = []
+        for room_id, seq, message_id, user_id, username, content, timestamp in rows:
+            if self.encryption:
+                try:
+                    username = self.encryption.decrypt(username)
+                    content = self.encryption.decrypt(content)
+                except Exception:
+                    # Written with another key
+                    continue
+            records.append({
+                "id": message_id,
+                "seq": seq,
+                "room_id": room_id,
+                "user_id": user_id,
+                "username": username,
+                "content": content,
+                "timestamp": timestamp,
+            })
+        return records
+
+    # Search
+
+    def search(self, query: str, limit: int = 20, room_id: str = "general") -> List[Dict[str, Any]]:
+        """
+        Find cached messages containing every word of query, best match first
+
+        Matches are ranked by BM25. Only the SEARCH_WINDOW most recently
+        cached matches are scored, so a search for a word in most messages
+        stays fast; rarer words are ranked over all their matches.
+
+        Hits are dicts with seq, username, timestamp and a snippet of the
+        content with the matches wrapped in [reverse] markup.
+        """
+        expression = match_expression(query)
+        if expression is None or self.search_db is None:
+            return []
+
+        with self.lock:
+            if self.encryption:
+                rows = self.search_db.execute(
+                    "SELECT seq, username, timestamp, content FROM ("
+                    "  SELECT seq, username, timestamp, content, room_id, bm25(message_search) AS score"
+                    "  FROM message_search WHERE message_search MATCH ? ORDER BY rowid DESC LIMIT ?"
+                    ") WHERE room_id = ? ORDER BY score LIMIT ?",
+                    (expression, SEARCH_WINDOW, room_id, limit)
+                ).fetchall()
+            else:
+                rows = self.db.execute(
+                    "SELECT m.seq, m.username, m.timestamp, m.content FROM ("
+                    "  SELECT rowid, bm25(message_search) AS score"
+                    "  FROM message_search WHERE message_search MATCH ? ORDER BY rowid DESC LIMIT ?"
+                    ") hits JOIN messages m ON m.rowid = hits.rowid "
+                    "WHERE m.room_id = ? ORDER BY hits.score LIMIT ?",
+                    (expression, SEARCH_WINDOW, room_id, limit)
+                ).fetchall()
+
+        words = re.findall(r"\w+", query)
+        return [
+            {"seq": seq, "username": username, "timestamp": timestamp, "snippet": highlight(content, words)}
+            for seq, username, timestamp, content in rows
+        ]
+
+    def index_existing(self):
+        """
+        Add the records already in an encrypted cache to the in-memory index
+
+        Decrypts in batches and takes the lock per batch, so flushes and
+        searches are not held up for long. Slow; run it in a thread.
+        """
+        if self.indexed or self.search_db is None:
+            return
+
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute(
+                    "SELECT rowid, room_id, seq, username, content, timestamp FROM messages "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, INDEX_BATCH_SIZE)
+                ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+
+            entries = []
+            for rowid, room_id, seq, username, content, timestamp in rows:
+                try:
+                    entries.append((rowid, self.encryption.decrypt(content), room_id, seq,
+                                    self.encryption.decrypt(username), timestamp))
+                except Exception:
+                    continue
+
+            with self.lock:
+                with self.search_db:
+                    # Rows flushed meanwhile are already indexed
+                    self.search_db.executemany(
+                        "DELETE FROM message_search WHERE rowid = ?", [(entry[0],) for entry in entries]
+                    )
+                    self.search_db.executemany(
+                        "INSERT INTO message_search (rowid, content, room_id, seq, username, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        entries
+                    )
+        self.indexed = True
+
+    # Writing
+
+    def add(self, message_data: Dict[str, Any], content: str):
+        """Queue a shown message, with its decrypted content, for the next flush"""
+        seq = message_data.get("seq")
+        if seq is None:
+            return
+
+        username = plain_username = message_data.get("username", "Unknown")
+        plain_content = content
+        if self.encryption:
+            username = self.encryption.encrypt(username)
+            content = self.encryption.encrypt(content)
+        timestamp = message_data.get("timestamp")
+        size = len(username) + len(content) + len(timestamp or "") + RECORD_OVERHEAD_BYTES
+
+        row = (
+            message_data.get("room_id", "general"), seq, message_data.get("id"),
+            message_data.get("user_id"), username, content, timestamp, size,
+            plain_username, plain_content
+        )
+        with self.lock:
+            self.pending.append(row)
+
+    def flush(self):
+        """Write queued messages in one transaction, then evict if over the size bound"""
+        with self.lock:
+            if not self.pending:
+                return
+
+            # The last write of a message wins
+            rows = list({(row[0], row[1]): row for row in self.pending}.values())
+            self.pending = []
+
+            with self.db:
+                # A replaced record's size is subtracted before it is overwritten
+                replaced = 0
+                for room_id, seq, *_ in rows:
+                    old = self.db.execute(
+                        "SELECT size FROM messages WHERE room_id = ? AND seq = ?", (room_id, seq)
+                    ).fetchone()
+                    if old:
+                        replaced += old[0]
+                self.db.executemany(UPSERT, [row[:8] for row in rows])
+                self.total_bytes += sum(row[7] for row in rows) - replaced
+
+            if self.encryption and self.search_db is not None:
+                self.index_rows(rows)
+
+            if self.total_bytes > self.max_bytes:
+                self.evict(self.total_bytes - int(self.max_bytes * EVICT_TO_FRACTION))
+
+    def index_rows(self, rows: List[tuple]):
+        """Add just-written rows to the in-memory index (lock held)"""
+        entries = []
+        for room_id, seq, _, _, _, _, timestamp, _, username, content in rows:
+            rowid = self.db.execute(
+                "SELECT rowid FROM messages WHERE room_id = ? AND seq = ?", (room_id, seq)
+            ).fetchone()[0]
+            entries.append((rowid, content, room_id, seq, username, timestamp))
+
+        with self.search_db:
+            self.search_db.executemany("DELETE FROM message_search WHERE rowid = ?", [(e[0],) for e in entries])
+            self.search_db.executemany(
+                "INSERT INTO message_search (rowid, content, room_id, seq, username, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                entries
+            )
+
+    def evict(self, target_bytes: int):
+        """Delete the oldest messages until at least target_bytes are freed (lock held)"""
+        freed = 0
+        doomed = []
+        for rowid, size in self.db.execute("SELECT rowid, size FROM messages ORDER BY timestamp, seq"):
+            if freed >= target_bytes:
+                break
+            doomed.append((rowid,))
+            freed += size
+
+        with self.db:
+            self.db.executemany("DELETE FROM messages WHERE rowid = ?", doomed)
+        if self.encryption and self.search_db is not None:
+            with self.search_db:
+                self.search_db.executemany("DELETE FROM message_search WHERE rowid = ?", doomed)
+        self.total_bytes -= freed
+
+    def clear_room(self, room_id: str):
+        """Forget every cached message of a room"""
+        with self.lock:
+            self.pending = [row for row in self.pending if row[0] != room_id]
+            with self.db:
+                self.db.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+            if self.encryption and self.search_db is not None:
+                with self.search_db:
+                    self.search_db.execute("DELETE FROM message_search WHERE room_id = ?", (room_id,))
+            self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM messages").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+            if self.search_db is not None and self.search_db is not self.db:
+                self.search_db.close()
@@ -0,0 +1,419 @@
+"""
+Virtualized, memory-bounded message view for the chat screen
+
+Messages are kept as compact records (their markup and the cell width of
+each text line) rather than as rendered lines. Only the lines in the
+visible window are rendered, and rendered lines are kept in an LRU cache
+capped at CACHE_LINES. At most MAX_RECORDS records are kept: records are
+evicted from whichever end is farther from the viewport and fetched again
+when the user scrolls back to that end.
+
+Records that have not been rendered at the current width use a height
+estimated from their cell widths, so a terminal resize is a pass over a
+list of integers rather than a re-render of the whole session. Estimates
+are replaced by exact heights as records scroll into view.
+"""
+
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from rich.cells import cell_len
+from rich.errors import MarkupError
+from rich.highlighter import ReprHighlighter
+from rich.text import Text
+from textual.geometry import Region, Size
+from textual.message import Message
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+# Records kept in memory while following the live end of the conversation
+MAX_RECORDS = 2000
+# Rendered lines kept in the line cache
+CACHE_LINES = 1000
+
+
+class MessageRecord(NamedTuple):
+    key: int  # Unique per view; keys the line cache
+    seq: Optional[int]  # Room sequence number (None for system messages)
+    markup: str
+    cells: Tuple[int, ...]  # Cell width of each line of the plain text
+
+
+def make_record(key: int, seq: Optional[int], markup: str, plain: str) -> MessageRecord:
+    return MessageRecord(key, seq, markup, tuple(cell_len(line) for line in plain.split("\n")))
+
+
+class MessageView(ScrollView, can_focus=True):
+    """Scrollable message list that renders only the visible lines"""
+
+    DEFAULT_CSS = """
+    MessageView {
+        background: $surface;
+        color: $text;
+        overflow-y: scroll;
+        overflow-x: hidden;
+    }
+    """
+
+    class OlderWanted(Message):
+        """Posted when the view is scrolled to the top and older messages exist"""
+
+        def __init__(self, before_seq: int):
+            super().__init__()
+            self.before_seq = before_seq
+
+    class NewerWanted(Message):
+        """Posted when the view is scrolled to the bottom and newer messages were evicted"""
+
+        def __init__(self, after_seq: int):
+            super().__init__()
+            self.after_seq = after_seq
+
+    def __init__(self, max_records: int = MAX_RECORDS, cache_lines: int = CACHE_LINES,
+                 id: Optional[str] = None, classes: Optional[str] = None):
+        super().__init__(id=id, classes=classes)
+        self.max_records = max_records
+        self.cache_lines = cache_lines
+        self.records: List[MessageRecord] = []
+        self.heights: List[int] = []  # Lines per record at layout_width (estimated until rendered)
+        self.offsets: List[int] = [0]  # First line of each record, plus the total
+        self.offsets_dirty = False
+        self.line_cache: "OrderedDict[int, List[Strip]]" = OrderedDict()
+        self.cached_lines = 0
+        self.layout_width = 0
+        self.next_key = 0
+        self.follow = True  # Keep the newest message in view
+        self.reached_start = False  # The server has nothing older
+        self.loading_older = False
+        self.missing_newer = False  # Newer records were evicted while scrolled up
+        self.loading_newer = False
+        self.held: List[Tuple[str, str, Optional[int]]] = []  # System messages held while newer are missing
+        self.highlighter = ReprHighlighter()
+
+    # Records
+
+    @property
+    def oldest_seq(self) -> Optional[int]:
+        return next((record.seq for record in self.records if record.seq is not None), None)
+
+    @property
+    def newest_seq(self) -> Optional[int]:
+        return next((record.seq for record in reversed(self.records) if record.seq is not None), None)
+
+    @property
+    def has_older(self) -> bool:
+        """Whether older messages can be fetched from the server"""
+        oldest = self.oldest_seq
+        return not self.reached_start and oldest is not None and oldest > 1
+
+    def add(self, markup: str, plain: str, seq: Optional[int] = None):
+        """Append a message at the bottom"""
+        self.extend([(markup, plain, seq)])
+
+    def extend(self, messages: List[Tuple[str, str, Optional[int]]]):
+        """Append messages, given as (markup, plain, seq), with one layout update"""
+        if self.missing_newer:
+            # They come back with the newer pages; system messages (no seq)
+            # are shown once those are all in
+            self.held.extend(message for message in messages if message[2] is None)
+            del self.held[:-self.max_records]
+            return
+        self.append_records(messages)
+
+    def append_page(self, messages: List[Tuple[str, str, Optional[int]]], reached_end: bool):
+        """
+        Append a page of newer messages fetched after evicted ones
+
+        Args:
+            messages: (markup, plain, seq) tuples, oldest first
+            reached_end: The page reaches the newest message received
+        """
+        self.loading_newer = False
+        if reached_end:
+            self.missing_newer = False
+            self.follow = self.scroll_y >= self.max_scroll_y
+            messages = messages + self.held
+            self.held = []
+        # The user is heading for the newest end, so make room at the other
+        self.append_records(messages, keep_newest=True)
+        if messages:
+            # Keep going while the bottom is still within a screen
+            self.want_newer()
+
+    def append_records(self, messages: List[Tuple[str, str, Optional[int]]], keep_newest: bool = False):
+        newest = self.newest_seq
+        appended = False
+        for markup, plain, seq in messages:
+            # A page and the live messages it raced with may overlap
+            if seq is not None and newest is not None and seq <= newest:
+                continue
+            record = make_record(self.next_key, seq, markup, plain)
+            self.next_key += 1
+
+            self.records.append(record)
+            height = self.estimate_height(record)
+            self.heights.append(height)
+            if not self.offsets_dirty:
+                self.offsets.append(self.offsets[-1] + height)
+            appended = True
+
+        if not appended:
+            return
+
+        self.trim(keep_newest)
+        self.update_virtual_size()
+        if self.follow:
+            self.scroll_end(animate=False)
+
+    def prepend(self, messages: List[Tuple[str, str, Optional[int]]]):
+        """Insert older messages, given as (markup, plain, seq), above the current ones"""
+        if not messages:
+            return
+
+        records = []
+        for markup, plain, seq in messages:
+            records.append(make_record(self.next_key, seq, markup, plain))
+            self.next_key += 1
+        heights = [self.estimate_height(record) for record in records]
+
+        self.records[:0] = records
+        self.heights[:0] = heights
+        self.offsets_dirty = True
+        self.update_virtual_size()
+
+        # Keep the lines the user is looking at in place
+        self.scroll_to(y=self.scroll_y + sum(heights), animate=False)
+        self.trim(keep_newest=False)
+
+    def trim(self, keep_newest: Optional[bool] = None):
+        """
+        Keep at most max_records records, evicting from the end farther from the viewport
+
+        While following, that is always the oldest end. keep_newest picks
+        the end instead, after a page was added at the other one. A tenth
+        extra goes at once, so offsets are not rebuilt on every message.
+        """
+        excess = len(self.records) - self.max_records
+        if excess <= 0:
+            return
+        excess += self.max_records // 10
+
+        if self.follow:
+            self.evict(excess)
+            return
+
+        # Never evict the records on screen
+        offsets = self.line_offsets()
+        top = int(self.scroll_y)
+        first = max(0, bisect_right(offsets, top) - 1)
+        last = min(len(self.records), bisect_right(offsets, top + self.size.height))
+        above, below = first, len(self.records) - last
+
+        if keep_newest is None:
+            keep_newest = above >= below
+        if keep_newest:
+            count = min(excess, above)
+            newest = min(excess - count, below)
+        else:
+            newest = min(excess, below)
+            count = min(excess - newest, above)
+        removed = sum(self.heights[:count])
+        if newest:
+            self.evict_newest(newest)
+        if count:
+            self.evict(count)
+        self.update_virtual_size()
+        if removed:
+            # Keep the lines the user is looking at in place
+            self.scroll_to(y=max(0, self.scroll_y - removed), animate=False)
+
+    def evict(self, count: int):
+        """Drop the oldest count records"""
+        for record in self.records[:count]:
+            self.forget_lines(record.key)
+        del self.records[:count]
+        del self.heights[:count]
+        self.offsets_dirty = True
+        self.reached_start = False
+
+    def evict_newest(self, count: int):
+        """Drop the newest count records; they are fetched again when scrolled back to"""
+        for record in self.records[-count:]:
+            self.forget_lines(record.key)
+        del self.records[-count:]
+        del self.heights[-count:]
+        self.offsets_dirty = True
+        self.missing_newer = True
+
+    def clear(self):
+        self.records.clear()
+        self.heights.clear()
+        self.offsets = [0]
+        self.offsets_dirty = False
+        self.line_cache.clear()
+        self.cached_lines = 0
+        self.reached_start = False
+        self.missing_newer = False
+        self.held = []
+        self.update_virtual_size()
+        self.refresh()
+
+    # Layout
+
+    def estimate_height(self, record: MessageRecord) -> int:
+        width = max(self.layout_width, 1)
+        return sum(max(1, -(-cells // width)) for cells in record.cells)
+
+    def line_offsets(self) -> List[int]:
+        if self.offsets_dirty:
+            offsets = [0]
+            for height in self.heights:
+                offsets.append(offsets[-1] + height)
+            self.offsets = offsets
+            self.offsets_dirty = False
+        return self.offsets
+
+    def update_virtual_size(self):
+        self.virtual_size = Size(self.layout_width, self.line_offsets()[-1])
+
+    def on_resize(self) -> None:
+        width = self.scrollable_content_region.width
+        if width == self.layout_width:
+            return
+
+        # Re-estimate every record; only visible ones are rendered again
+        self.layout_width = width
+        self.line_cache.clear()
+        self.cached_lines = 0
+        self.heights = [self.estimate_height(record) for record in self.records]
+        self.offsets_dirty = True
+        self.update_virtual_size()
+        if self.follow:
+            self.scroll_end(animate=False)
+
+    # Rendering
+
+    def record_lines(self, index: int) -> List[Strip]:
+        """Rendered lines of a record at the current width, from the cache if possible"""
+        record = self.records[index]
+        lines = self.line_cache.get(record.key)
+        if lines is not None:
+            self.line_cache.move_to_end(record.key)
+            return lines
+
+        try:
+            text = Text.from_markup(record.markup)
+        except MarkupError:
+            text = Text(record.markup)
+        text = self.highlighter(text)
+
+        console = self.app.console
+        options = console.options.update_width(max(self.layout_width, 1))
+        lines = Strip.from_lines(console.render_lines(text, options, pad=False)) or [Strip.blank(0)]
+
+        self.line_cache[record.key] = lines
+        self.cached_lines += len(lines)
+        while self.cached_lines > self.cache_lines and len(self.line_cache) > 1:
+            _, evicted = self.line_cache.popitem(last=False)
+            self.cached_lines -= len(evicted)
+
+        if len(lines) != self.heights[index]:
+            self.heights[index] = len(lines)
+            self.offsets_dirty = True
+        return lines
+
+    def forget_lines(self, key: int):
+        lines = self.line_cache.pop(key, None)
+        if lines is not None:
+            self.cached_lines -= len(lines)
+
+    def render_lines(self, crop: Region) -> List[Strip]:
+        # Render the visible records first, so estimated heights are
+        # corrected before lines are looked up by offset
+        if self.records:
+            offsets = self.line_offsets()
+            top = int(self.scroll_y)
+            first = max(0, bisect_right(offsets, top) - 1)
+            last = min(len(self.records), bisect_right(offsets, top + self.size.height))
+            for index in range(first, last):
+                self.record_lines(index)
+            if self.offsets_dirty:
+                self.update_virtual_size()
+                if self.follow:
+                    self.scroll_end(animate=False)
+        return super().render_lines(crop)
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        line = scroll_y + y
+        width = self.size.width
+
+        offsets = self.line_offsets()
+        index = bisect_right(offsets, line) - 1
+        if index < 0 or index >= len(self.records):
+            return Strip.blank(width, self.rich_style)
+
+        lines = self.record_lines(index)
+        row = line - offsets[index]
+        if row >= len(lines):
+            return Strip.blank(width, self.rich_style)
+        return lines[row].crop_extend(scroll_x, scroll_x + width, self.rich_style)
+
+    # Scrolling
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        # The live end is only followed once no newer records are missing
+        self.follow = new_value >= self.max_scroll_y and not self.missing_newer
+
+        if new_value < old_value:
+            self.want_older()
+        elif new_value > old_value:
+            self.want_newer()
+
+    def want_older(self):
+        """Ask for older messages when within one screen of the top"""
+        if self.scroll_y <= self.size.height and self.has_older and not self.loading_older:
+            self.loading_older = True
+            self.post_message(self.OlderWanted(self.oldest_seq))
+
+    def want_newer(self):
+        """Ask for evicted newer messages when within one screen of the bottom"""
+        if (self.scroll_y >= self.max_scroll_y - self.size.height and self.missing_newer
+                and not self.loading_newer and self.newest_seq is not None):
+            self.loading_newer = True
+            self.post_message(self.NewerWanted(self.newest_seq))
+
+    # Scrolling when already at the top or bottom (or when everything fits
+    # on the screen) does not move scroll_y, so these ask for messages too
+
+    def action_scroll_up(self) -> None:
+        super().action_scroll_up()
+        self.want_older()
+
+    def action_page_up(self) -> None:
+        super().action_page_up()
+        self.want_older()
+
+    def action_scroll_home(self) -> None:
+        super().action_scroll_home()
+        self.want_older()
+
+    def on_mouse_scroll_up(self) -> None:
+        self.want_older()
+
+    def action_scroll_down(self) -> None:
+        super().action_scroll_down()
+        self.want_newer()
+
+    def action_page_down(self) -> None:
+        super().action_page_down()
+        self.want_newer()
+
+    def action_scroll_end(self) -> None:
+        super().action_scroll_end()
+        self.want_newer()
+
+    def on_mouse_scroll_down(self) -> None:
+        self.want_newer()
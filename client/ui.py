@@ -4,13 +4,23 @@ Textual UI components for the terminal chat client
 
 from textual.app import App, ComposeResult
 from textual.containers import Container, Vertical, Horizontal, ScrollableContainer
-from textual.widgets import Header, Footer, Input, Static, Button, Label, RichLog
+from textual.widgets import Header, Footer, Input, Static, Button, Label
 from textual.binding import Binding
 from textual.screen import Screen
+from textual.constants import MAX_FPS
 from datetime import datetime
 from typing import Optional, Callable
 from rich.text import Text
 import hashlib
+import time
+
+from shared.profiling import phase
+from shared.tracing import tracer
+
+from .message_view import MessageView
+
+# Incoming messages are added to the message view at most once per frame
+FRAME_INTERVAL = 1 / MAX_FPS
 
 
 class LoginScreen(Screen):
@@ -261,6 +271,7 @@ class ChatScreen(Screen):
         self.online_usernames = []
         # User colors for consistent color assignment
         self.user_colors = {}
+        self.username_markup = {}  # Styled "username:" markup per user
         self.available_colors = [
             "cyan", "magenta", "yellow", "blue",
             "green", "bright_cyan", "bright_magenta", "bright_yellow"
@@ -268,8 +279,24 @@ class ChatScreen(Screen):
         # Typing indicator tracking
         self.typing_users = set()  # Set of usernames currently typing
         self.typing_indicator_callback = None  # Callback to send typing events
+        self.load_older_callback = None  # Callback to fetch messages before a seq
+        self.load_newer_callback = None  # Callback to fetch messages after a seq
+        self.search_callback = None  # Callback to search the local message index
         self.typing_timer = None  # Timer to debounce typing indicator
         self.is_currently_typing = False  # Track if user is currently indicated as typing
+        # Messages waiting for the next flush to the message view
+        self.pending_messages = []  # (markup, plain, seq, trace_id) tuples
+        self.pending_bell = False
+        self.flush_scheduled = False
+        self.last_flush = 0.0
+        self.widget_cache = {}
+
+    def cached_query(self, selector: str, expect_type):
+        """query_one, remembered; the chat screen never replaces its widgets"""
+        widget = self.widget_cache.get(selector)
+        if widget is None:
+            widget = self.widget_cache[selector] = self.query_one(selector, expect_type)
+        return widget
 
     def get_user_color(self, username: str) -> str:
         """Get a consistent color for a username"""
@@ -296,7 +323,7 @@ class ChatScreen(Screen):
         yield Label("", id="typing-indicator")
 
         # Message display area
-        yield RichLog(id="message-display", highlight=True, markup=True, wrap=True)
+        yield MessageView(id="message-display")
 
         # Input area
         with Container(id="input-container"):
@@ -319,10 +346,8 @@ class ChatScreen(Screen):
                 self.on_send_message(message)
                 event.input.value = ""
 
-    def add_message(self, username: str, content: str, timestamp: str = None, play_sound: bool = True):
-        """Add a chat message to the display"""
-        message_display = self.query_one("#message-display", RichLog)
-
+    def format_message(self, username: str, content: str, timestamp: str = None):
+        """Get the display markup and plain text of a chat message"""
         # Format timestamp
         if timestamp:
             try:
@@ -333,43 +358,112 @@ class ChatScreen(Screen):
         else:
             time_str = datetime.now().strftime("%H:%M:%S")
 
-        # Get user color
-        user_color = self.get_user_color(username)
-
-        # Use different color for own messages
-        if username == self.username:
-            new_message = f"[dim]{time_str}[/dim] [bold white]{username}:[/bold white] {content}"
-        else:
-            new_message = f"[dim]{time_str}[/dim] [bold {user_color}]{username}:[/bold {user_color}] {content}"
+        markup = f"[dim]{time_str}[/dim] {self.get_username_markup(username)} {content}"
+        return markup, f"{time_str} {username}: {content}"
+
+    def get_username_markup(self, username: str) -> str:
+        """Get the styled "username:" markup for a user"""
+        markup = self.username_markup.get(username)
+        if markup is None:
+            # Use different color for own messages
+            color = "white" if username == self.username else self.get_user_color(username)
+            markup = self.username_markup[username] = f"[bold {color}]{username}:[/bold {color}]"
+        return markup
+
+    def add_message(self, username: str, content: str, timestamp: str = None, play_sound: bool = True,
+                    seq: int = None, trace_id: str = None):
+        """Queue a chat message for the display"""
+        markup, plain = self.format_message(username, content, timestamp)
+        # Play notification sound for messages from other users
+        self.queue_message(markup, plain, seq, trace_id, bell=play_sound and username != self.username)
+
+    def queue_message(self, markup: str, plain: str, seq: int = None, trace_id: str = None,
+                      bell: bool = False):
+        """Queue a message for the next flush to the display"""
+        self.pending_messages.append((markup, plain, seq, trace_id))
+        self.pending_bell = self.pending_bell or bell
+
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            delay = self.last_flush + FRAME_INTERVAL - time.monotonic()
+            if delay > 0:
+                self.set_timer(delay, self.flush_messages)
+            else:
+                # A frame has passed since the last flush; flush once the
+                # messages already waiting in the queue are handled
+                self.call_later(self.flush_messages)
+
+    def flush_messages(self) -> None:
+        """Add queued messages to the display, with at most one bell for the batch"""
+        self.flush_scheduled = False
+        self.last_flush = time.monotonic()
+        if not self.pending_messages:
+            return
 
-        # Write the message to RichLog
-        message_display.write(new_message)
+        pending, self.pending_messages = self.pending_messages, []
+        with phase("render.flush"):
+            self.cached_query("#message-display", MessageView).extend(
+                [(markup, plain, seq) for markup, plain, seq, _ in pending]
+            )
+        for _, _, _, trace_id in pending:
+            tracer.mark(trace_id, "remote_render", peer=self.app.user_id)
 
-        # Play notification sound for messages from other users
-        if play_sound and username != self.username:
+        if self.pending_bell:
+            self.pending_bell = False
             self.app.bell()
 
+    def add_older_messages(self, messages: list, reached_start: bool = False):
+        """
+        Add a page of older messages above the ones shown
+
+        Args:
+            messages: (username, content, timestamp, seq) tuples, oldest first
+            reached_start: The server has no messages older than these
+        """
+        message_display = self.cached_query("#message-display", MessageView)
+        entries = [
+            self.format_message(username, content, timestamp) + (seq,)
+            for username, content, timestamp, seq in messages
+        ]
+        if reached_start and not message_display.reached_start:
+            entries.insert(0, ("[dim italic]Beginning of the conversation[/dim italic]",
+                               "Beginning of the conversation", None))
+
+        message_display.loading_older = False
+        message_display.reached_start = reached_start
+        message_display.prepend(entries)
+
+    def add_newer_messages(self, messages: list, reached_end: bool = False):
+        """
+        Add a page of newer messages that were evicted while scrolled up
+
+        Args:
+            messages: (username, content, timestamp, seq) tuples, oldest first
+            reached_end: The page reaches the newest message received
+        """
+        self.cached_query("#message-display", MessageView).append_page([
+            self.format_message(username, content, timestamp) + (seq,)
+            for username, content, timestamp, seq in messages
+        ], reached_end)
+
     def add_system_message(self, message: str):
         """Add a system message (user joined, left, etc.)"""
-        message_display = self.query_one("#message-display", RichLog)
-
         time_str = datetime.now().strftime("%H:%M:%S")
         # Use Rich markup for system messages
         new_message = f"[dim]{time_str}[/dim] [italic yellow]* {message}[/italic yellow]"
 
-        # Write the system message to RichLog
-        message_display.write(new_message)
+        self.queue_message(new_message, f"{time_str} * {message}")
 
     def update_status(self, status: str):
         """Update the status bar"""
-        status_bar = self.query_one("#status-bar", Label)
+        status_bar = self.cached_query("#status-bar", Label)
         status_bar.update(status)
 
     def update_online_users(self, count: int, usernames: list = None):
         """Update online users count and list"""
         self.online_users_count = count
         self.online_usernames = usernames or []
-        online_label = self.query_one("#online-users", Label)
+        online_label = self.cached_query("#online-users", Label)
 
         # Display count and usernames if available
         if usernames:
@@ -397,6 +491,14 @@ class ChatScreen(Screen):
             self.clear_messages()
         elif cmd == "/who":
             self.show_online_users()
+        elif cmd == "/search":
+            query = command[len(parts[0]):].strip()
+            if not query:
+                self.add_system_message("Usage: /search <words>")
+            elif self.search_callback:
+                self.search_callback(query)
+            else:
+                self.add_system_message("Search is not available")
         else:
             self.add_system_message(f"Unknown command: {cmd}. Type /help for available commands.")
 
@@ -406,6 +508,7 @@ class ChatScreen(Screen):
             "Available Commands:",
             "  /help       - Show this help message",
             "  /who        - Show list of online users",
+            "  /search     - Search message history on this device",
             "  /quit       - Exit the application",
             "  /clear      - Clear message history",
             "",
@@ -425,11 +528,13 @@ class ChatScreen(Screen):
                 marker = " (you)" if username == self.username else ""
                 self.add_system_message(f"  • {username}{marker}")
 
-    def clear_messages(self):
+    def clear_messages(self, announce: bool = True):
         """Clear the message display"""
-        message_display = self.query_one("#message-display", RichLog)
-        message_display.clear()
-        self.add_system_message("Message history cleared")
+        self.pending_messages = []
+        self.pending_bell = False
+        self.cached_query("#message-display", MessageView).clear()
+        if announce:
+            self.add_system_message("Message history cleared")
 
     def action_quit(self) -> None:
         """Quit the application"""
@@ -443,7 +548,7 @@ class ChatScreen(Screen):
             self.typing_users.discard(username)
 
         # Update the typing indicator label
-        typing_label = self.query_one("#typing-indicator", Label)
+        typing_label = self.cached_query("#typing-indicator", Label)
 
         if not self.typing_users:
             # Hide the typing indicator when no one is typing
@@ -461,6 +566,60 @@ class ChatScreen(Screen):
             typing_label.update(f"{len(self.typing_users)} people are typing...")
             typing_label.add_class("visible")
 
+    def set_search_callback(self, callback: Callable):
+        """Set callback for the /search command"""
+        self.search_callback = callback
+
+    def show_search_results(self, query: str, hits: list, elapsed_ms: float, indexing: bool = False):
+        """
+        Show /search hits as system messages
+
+        Args:
+            query: The words searched for
+            hits: Dicts with username, timestamp and a markup snippet, best first
+            elapsed_ms: Time the search took
+            indexing: Older history is still being added to the index
+        """
+        note = " (still indexing older history)" if indexing else ""
+        if not hits:
+            self.add_system_message(f"No messages match \"{query}\"{note}")
+            return
+
+        self.add_system_message(f"{len(hits)} best matches for \"{query}\" in {elapsed_ms:.1f} ms{note}:")
+        for hit in hits:
+            # Hits can be days old, so show the date too
+            try:
+                when = datetime.fromisoformat(hit["timestamp"].replace('Z', '+00:00')).strftime("%Y-%m-%d %H:%M")
+            except Exception:
+                when = ""
+            snippet = hit["snippet"]
+            self.queue_message(
+                f"  [dim]{when}[/dim] {self.get_username_markup(hit['username'])} {snippet}",
+                f"  {when} {hit['username']}: " + snippet.replace("[reverse]", "").replace("[/reverse]", "")
+            )
+
+    def set_load_older_callback(self, callback: Callable):
+        """Set callback for fetching older messages when scrolled to the top"""
+        self.load_older_callback = callback
+
+    def on_message_view_older_wanted(self, event: MessageView.OlderWanted) -> None:
+        """Fetch older messages when the message view nears the top"""
+        if self.load_older_callback:
+            self.load_older_callback(event.before_seq)
+        else:
+            self.cached_query("#message-display", MessageView).loading_older = False
+
+    def set_load_newer_callback(self, callback: Callable):
+        """Set callback for fetching evicted newer messages when scrolled to the bottom"""
+        self.load_newer_callback = callback
+
+    def on_message_view_newer_wanted(self, event: MessageView.NewerWanted) -> None:
+        """Fetch newer messages when the message view nears the bottom"""
+        if self.load_newer_callback:
+            self.load_newer_callback(event.after_seq)
+        else:
+            self.cached_query("#message-display", MessageView).loading_newer = False
+
     def set_typing_indicator_callback(self, callback: Callable):
         """Set callback for sending typing indicator events"""
         self.typing_indicator_callback = callback
@@ -508,10 +667,19 @@ class ChatApp(App):
         self.token: Optional[str] = None
         self.send_message_callback: Optional[Callable] = None
         self.login_callback: Optional[Callable] = None
+        self.ready_callback: Optional[Callable] = None
+        self.shutdown_callback: Optional[Callable] = None
 
     def on_mount(self) -> None:
         """Show login screen on startup"""
         self.push_screen(LoginScreen(self.handle_login))
+        if self.ready_callback:
+            self.ready_callback()
+
+    async def on_unmount(self) -> None:
+        """Release network resources before the event loop stops"""
+        if self.shutdown_callback:
+            await self.shutdown_callback()
 
     def handle_login(self, username: str, password: str, action: str):
         """Handle login/register action"""
@@ -541,6 +709,14 @@ class ChatApp(App):
         """Set callback for sending messages"""
         self.send_message_callback = callback
 
+    def set_ready_callback(self, callback: Callable):
+        """Set callback for when the login screen has been shown"""
+        self.ready_callback = callback
+
+    def set_shutdown_callback(self, callback: Callable):
+        """Set coroutine callback run when the app exits"""
+        self.shutdown_callback = callback
+
     def get_chat_screen(self) -> Optional[ChatScreen]:
         """Get the chat screen if it exists"""
         for screen in self.screen_stack:
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
+import hmac
 import os
 from dotenv import load_dotenv
 
@@ -17,6 +18,9 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-super-secret-jwt-key-change-t
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRATION_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
 
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
@@ -77,3 +81,15 @@ def verify_token(token: str) -> Optional[dict]:
         return payload
     except JWTError:
         return None
+
+
+def verify_admin_token(token: Optional[str]) -> bool:
+    """
+    Check a token against the configured admin token
+
+    Always fails when ADMIN_TOKEN is not set, so admin endpoints are
+    unreachable by default.
+    """
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
@@ -0,0 +1,71 @@
+"""
+Conversion between the Fernet tokens clients send and the bytes stored
+
+Clients encrypt messages with Fernet, whose tokens are URL-safe base64
+text. The server never decrypts them, so it stores the decoded bytes -
+a quarter smaller - and re-encodes only when writing JSON.
+"""
+
+from typing import Union
+import base64
+
+FERNET_VERSION = 0x80
+# version, timestamp and IV before the ciphertext, HMAC after it
+FERNET_OVERHEAD = 1 + 8 + 16 + 32
+FERNET_BLOCK = 16
+
+
+class InvalidCiphertext(ValueError):
+    """Raised when message content is not a well-formed Fernet token"""
+
+
+def decode_ciphertext(token: str) -> bytes:
+    """
+    Decode a Fernet token to raw bytes for storage
+
+    Only the token structure is checked (the server has no key), but the
+    check guarantees encode_ciphertext() gives back exactly the same token.
+
+    Raises:
+        InvalidCiphertext: If the token is not canonical URL-safe base64
+            or does not have the layout of a Fernet token
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii"))
+    except (ValueError, UnicodeEncodeError):
+        raise InvalidCiphertext("Content is not base64")
+
+    # urlsafe_b64decode skips invalid characters instead of failing
+    if encode_ciphertext(raw) != token:
+        raise InvalidCiphertext("Content is not canonical base64")
+
+    if (len(raw) < FERNET_OVERHEAD + FERNET_BLOCK
+            or (len(raw) - FERNET_OVERHEAD) % FERNET_BLOCK
+            or raw[0] != FERNET_VERSION):
+        raise InvalidCiphertext("Content is not a Fernet token")
+
+    return raw
+
+
+def encode_ciphertext(raw: bytes) -> str:
+    """Encode stored ciphertext back to the Fernet token clients expect"""
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def from_legacy(value: Union[str, bytes]) -> bytes:
+    """
+    Convert content stored by older versions (base64 text) to raw bytes
+
+    Raw tokens always start with the version byte, which base64 text never
+    does, so values that are already raw are returned unchanged. Content
+    that is not a valid token is kept as its UTF-8 bytes.
+    """
+    if isinstance(value, bytes):
+        if value[:1] == bytes([FERNET_VERSION]):
+            return value
+        value = value.decode("utf-8", errors="replace")
+
+    try:
+        return decode_ciphertext(value)
+    except InvalidCiphertext:
+        return value.encode("utf-8")
@@ -2,8 +2,35 @@
 WebSocket connection manager for handling active connections
 """
 
-from typing import List, Dict
-from fastapi import WebSocket
+from typing import List, Dict, Optional, Tuple
+from fastapi import WebSocket, status
+import json
+import os
+import random
+from dotenv import load_dotenv
+
+from shared.tracing import tracer
+
+# Load environment variables
+load_dotenv()
+
+# Default window over which drained clients are told to reconnect
+DRAIN_WINDOW_MS = int(os.getenv("DRAIN_WINDOW_MS", "30000"))
+
+
+def spread_reconnect_delays(count: int, window_ms: int) -> List[int]:
+    """
+    Spread reconnect delays for count clients evenly across a window
+
+    Each client gets its own slot of the window with a random offset
+    inside it, so reconnects arrive at a steady rate instead of all at once.
+    """
+    if count <= 0:
+        return []
+    slot = window_ms / count
+    delays = [int((i + random.random()) * slot) for i in range(count)]
+    random.shuffle(delays)
+    return delays
 
 
 class ConnectionManager:
@@ -11,48 +38,111 @@ class ConnectionManager:
 
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.connection_rooms: Dict[str, str] = {}  # Room each connection joined
+        self.draining = False
 
-    async def connect(self, user_id: str, websocket: WebSocket):
+    async def connect(self, user_id: str, websocket: WebSocket, room_id: str = "general"):
         """Accept a new WebSocket connection"""
         await websocket.accept()
         self.active_connections[user_id] = websocket
+        self.connection_rooms[user_id] = room_id
 
     def disconnect(self, user_id: str):
         """Remove a WebSocket connection"""
         if user_id in self.active_connections:
             del self.active_connections[user_id]
+        self.connection_rooms.pop(user_id, None)
 
     async def send_personal_message(self, message: str, user_id: str):
         """Send a message to a specific user"""
         if user_id in self.active_connections:
             await self.active_connections[user_id].send_text(message)
 
-    async def broadcast(self, message: str, exclude_user: str = None):
-        """Broadcast a message to all connected clients"""
-        # Create a copy of items to avoid RuntimeError during iteration
-        for user_id, connection in list(self.active_connections.items()):
+    def room_connections(self, room_id: Optional[str] = None) -> List[Tuple[str, WebSocket]]:
+        """Get the connections that joined a room (every connection if room_id is None)"""
+        # A copy, so callers can await while connections come and go
+        return [
+            (user_id, connection)
+            for user_id, connection in self.active_connections.items()
+            if room_id is None or self.connection_rooms.get(user_id) == room_id
+        ]
+
+    async def broadcast(self, message: str, room_id: Optional[str] = None, exclude_user: str = None,
+                        trace_id: Optional[str] = None):
+        """Broadcast a message to the clients in a room (all clients if room_id is None)"""
+        for user_id, connection in self.room_connections(room_id):
             if exclude_user and user_id == exclude_user:
                 continue
             await connection.send_text(message)
+            tracer.mark(trace_id, "socket_write", peer=user_id)
 
-    async def broadcast_typing_indicator(self, user_id: str, username: str, is_typing: bool):
-        """Broadcast typing indicator to all other connected clients"""
-        # Create a copy of items to avoid RuntimeError during iteration
-        for uid, connection in list(self.active_connections.items()):
+    async def broadcast_typing_indicator(self, user_id: str, username: str, is_typing: bool,
+                                         room_id: Optional[str] = None):
+        """Broadcast typing indicator to the other clients in a room"""
+        for uid, connection in self.room_connections(room_id):
             if uid != user_id:  # Don't send to the user who is typing
                 await connection.send_text(
                     f'{{"type": "typing", "user_id": "{user_id}", "username": "{username}", "is_typing": {str(is_typing).lower()}}}'
                 )
 
-    def get_active_users(self) -> List[str]:
-        """Get list of currently connected user IDs"""
-        return list(self.active_connections.keys())
+    async def drain(self, window_ms: int) -> int:
+        """
+        Stop serving clients ahead of a restart
+
+        Every connected client is told to reconnect after a delay spread
+        across window_ms and then disconnected. New connections are refused
+        while draining.
+
+        Returns:
+            Number of clients that were drained
+        """
+        self.draining = True
+
+        connections = list(self.active_connections.items())
+        self.active_connections.clear()
+        self.connection_rooms.clear()
+
+        await self.send_reconnect(connections, window_ms, "server_restart")
+        return len(connections)
+
+    async def move_room(self, room_id: str, url: str, window_ms: int) -> int:
+        """
+        Send a room's clients to the worker that now owns it
+
+        Returns:
+            Number of clients that were moved
+        """
+        connections = self.room_connections(room_id)
+        for user_id, _ in connections:
+            self.disconnect(user_id)
+
+        await self.send_reconnect(connections, window_ms, "shard_moved", url)
+        return len(connections)
+
+    async def send_reconnect(self, connections: List[Tuple[str, WebSocket]], window_ms: int,
+                             reason: str, url: Optional[str] = None):
+        """Tell clients when (and optionally where) to reconnect, then close them"""
+        delays = spread_reconnect_delays(len(connections), window_ms)
+        for (user_id, connection), after_ms in zip(connections, delays):
+            frame = {"type": "reconnect", "after_ms": after_ms, "reason": reason}
+            if url:
+                frame["url"] = url
+            try:
+                await connection.send_text(json.dumps(frame))
+                await connection.close(code=status.WS_1012_SERVICE_RESTART)
+            except Exception:
+                # Client already gone
+                pass
+
+    def get_active_users(self, room_id: Optional[str] = None) -> List[str]:
+        """Get list of currently connected user IDs (in a room, if given)"""
+        return [user_id for user_id, _ in self.room_connections(room_id)]
 
-    def get_active_user_info(self, db_session) -> List[Dict[str, str]]:
-        """Get list of currently connected users with their usernames"""
+    def get_active_user_info(self, db_session, room_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """Get list of currently connected users with their usernames (in a room, if given)"""
         from .models import User
         user_info = []
-        for user_id in self.active_connections.keys():
+        for user_id in self.get_active_users(room_id):
             user = db_session.query(User).filter(User.id == int(user_id)).first()
             if user:
                 user_info.append({
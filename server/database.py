@@ -2,9 +2,12 @@
 Database configuration and session management
 """
 
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+import asyncio
+import functools
 import os
 from dotenv import load_dotenv
 
@@ -14,18 +17,124 @@ load_dotenv()
 # Database URL - defaults to SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./terminal_chat.db")
 
-# Create engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+# SQLite tuning profile: "default" keeps SQLite's stock settings, "production"
+# enables WAL, relaxed fsync, memory-mapped I/O and a single writer connection
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_READER_POOL_SIZE = int(os.getenv("SQLITE_READER_POOL_SIZE", "8"))
+
+# SQLite user_version once message content has been converted to raw bytes
+CONTENT_BYTES_VERSION = 1
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configure every new SQLite connection for the production profile"""
+    cursor = dbapi_connection.cursor()
+    # Readers no longer block the writer (and vice versa)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode NORMAL only skips the fsync per commit; the database stays consistent
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_engines(database_url: str, profile: str = "default"):
+    """
+    Create the engines used for writes and reads
+
+    With the SQLite production profile, writes go through a pool of exactly
+    one connection, so they queue in-process instead of contending for the
+    database lock. Reads use a separate autocommit pool that never holds a
+    snapshot open between queries. Everything else uses a single engine
+    for both.
+
+    Returns:
+        (writer engine, reader engine) - the same object when not split
+    """
+    if not database_url.startswith("sqlite"):
+        engine = create_engine(database_url)
+        return engine, engine
+
+    connect_args = {"check_same_thread": False}
+    in_memory = database_url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in database_url
+
+    if profile != "production" or in_memory:
+        engine = create_engine(database_url, connect_args=connect_args)
+        return engine, engine
+
+    writer = create_engine(
+        database_url,
+        connect_args=connect_args,
+        pool_size=1,
+        max_overflow=0
+    )
+    reader = create_engine(
+        database_url,
+        connect_args=connect_args,
+        pool_size=SQLITE_READER_POOL_SIZE,
+        max_overflow=SQLITE_READER_POOL_SIZE,
+        isolation_level="AUTOCOMMIT"
+    )
+    event.listen(writer, "connect", apply_sqlite_pragmas)
+    event.listen(reader, "connect", apply_sqlite_pragmas)
+
+    return writer, reader
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the reader engine and everything else to the writer"""
+
+    def __init__(self, writer=None, reader=None, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+        self.reader = reader
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or not getattr(clause, "is_select", False):
+            return self.writer
+        return self.reader
+
+
+def create_session_factory(writer, reader) -> sessionmaker:
+    """Create a session factory, routing reads and writes when the engines differ"""
+    if writer is reader:
+        return sessionmaker(autocommit=False, autoflush=False, bind=writer)
+    return sessionmaker(
+        class_=RoutingSession,
+        autocommit=False,
+        autoflush=False,
+        writer=writer,
+        reader=reader
+    )
+
+
+# Create engines
+engine, read_engine = create_engines(DATABASE_URL, SQLITE_PROFILE)
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = create_session_factory(engine, read_engine)
 
 # Base class for models
 Base = declarative_base()
 
+# Writes from request handlers run here, one at a time and in the order they
+# were submitted. The writer pool has a single connection, so a write on the
+# event loop would stall every client while another thread (e.g. retention)
+# holds it; this thread waits for it instead.
+write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+
+async def run_write(func, *args, **kwargs):
+    """Run a blocking database write on the writer thread and wait for its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(write_executor, functools.partial(func, *args, **kwargs))
+
 
 def get_db():
     """Dependency to get database session"""
@@ -39,3 +148,98 @@ def get_db():
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
+    migrate_db()
+
+
+def migrate_db():
+    """
+    Bring tables created by older versions up to date
+
+    create_all() never alters existing tables, so columns added since
+    the first release are added here.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("messages")}
+
+    if "seq" not in columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE messages ADD COLUMN seq INTEGER"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_messages_room_seq ON messages (room_id, seq)"
+            ))
+        backfill_message_seq()
+
+    migrate_message_content()
+
+
+def backfill_message_seq(batch_size: int = 1000):
+    """Assign per-room sequence numbers to messages stored before sequencing existed"""
+    with engine.begin() as conn:
+        last_seq = dict(conn.execute(text(
+            "SELECT room_id, MAX(seq) FROM messages WHERE seq IS NOT NULL GROUP BY room_id"
+        )).all())
+
+        rows = conn.execute(text(
+            "SELECT id, room_id FROM messages WHERE seq IS NULL ORDER BY id"
+        )).all()
+
+        updates = []
+        for message_id, room_id in rows:
+            last_seq[room_id] = (last_seq.get(room_id) or 0) + 1
+            updates.append({"id": message_id, "seq": last_seq[room_id]})
+
+            if len(updates) >= batch_size:
+                conn.execute(text("UPDATE messages SET seq = :seq WHERE id = :id"), updates)
+                updates = []
+
+        if updates:
+            conn.execute(text("UPDATE messages SET seq = :seq WHERE id = :id"), updates)
+
+
+def migrate_message_content(batch_size: int = 1000):
+    """
+    Convert message content stored as base64 text to raw ciphertext bytes
+
+    SQLite keeps each value's own storage class, so rows are rewritten in
+    batches and PRAGMA user_version records that the conversion finished.
+    PostgreSQL converts the whole column in a single ALTER TABLE.
+    """
+    from .ciphertext import from_legacy
+
+    if engine.dialect.name == "postgresql":
+        column = next(
+            column for column in inspect(engine).get_columns("messages")
+            if column["name"] == "content"
+        )
+        if column["type"].python_type is str:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "ALTER TABLE messages ALTER COLUMN content TYPE BYTEA "
+                    "USING decode(translate(content, '-_', '+/'), 'base64')"
+                ))
+        return
+
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        if conn.execute(text("PRAGMA user_version")).scalar() >= CONTENT_BYTES_VERSION:
+            return
+
+    # Page by primary key, so each batch resumes where the last one ended
+    # instead of scanning past every already converted row again
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, content FROM messages WHERE id > :last_id AND typeof(content) = 'text' "
+                "ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": batch_size}).all()
+            if not rows:
+                conn.execute(text(f"PRAGMA user_version = {CONTENT_BYTES_VERSION}"))
+                break
+            last_id = rows[-1][0]
+
+            conn.execute(
+                text("UPDATE messages SET content = :content WHERE id = :id"),
+                [{"id": message_id, "content": from_legacy(content)} for message_id, content in rows]
+            )
@@ -0,0 +1,138 @@
+"""
+Rendered /api/history responses with ETags and compressed variants
+
+Reconnecting clients mostly ask for the same latest page of a room. The
+ETag is derived from the room's latest sequence number, so it can be
+checked (and a 304 returned) from memory without a database query, and
+the latest page for each (room, limit) is kept as ready-to-send bytes,
+plain and compressed.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import gzip
+import hashlib
+import os
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+# Load environment variables
+load_dotenv()
+
+# Number of rooms whose latest history pages are kept rendered in memory
+HISTORY_CACHE_ROOMS = int(os.getenv("HISTORY_CACHE_ROOMS", "256"))
+
+# Responses smaller than this are sent uncompressed
+HISTORY_COMPRESS_MIN_BYTES = int(os.getenv("HISTORY_COMPRESS_MIN_BYTES", "1024"))
+
+
+def history_etag(room_id: str, latest_seq: int, generation: int, limit: int,
+                 before_seq: Optional[int], after_seq: Optional[int] = None) -> str:
+    """
+    Build the ETag for a history query
+
+    The latest sequence number changes with every new message and the
+    retention generation with every expiry, which are the only ways the
+    response to the same query can change.
+    """
+    query = hashlib.blake2b(
+        f"{room_id}\0{limit}\0{before_seq}\0{after_seq}".encode("utf-8"), digest_size=8
+    ).hexdigest()
+    return f'"{latest_seq}.{generation}.{query}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported content encoding the client accepts"""
+    if not accept_encoding:
+        return None
+
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class RenderedPage:
+    """A rendered history response and its compressed variants"""
+
+    def __init__(self, etag: str, body: bytes):
+        self.etag = etag
+        self.body = body
+        self.encoded: Dict[str, bytes] = {}
+
+    def content(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """
+        Get the body to send for a negotiated encoding
+
+        Returns:
+            (body, content encoding or None when sent uncompressed)
+        """
+        if encoding is None or len(self.body) < HISTORY_COMPRESS_MIN_BYTES:
+            return self.body, None
+        if encoding not in self.encoded:
+            self.encoded[encoding] = compress(self.body, encoding)
+        return self.encoded[encoding], encoding
+
+
+class HistoryCache:
+    """Latest history pages per room and limit, for the most recently used rooms"""
+
+    def __init__(self, max_rooms: int = HISTORY_CACHE_ROOMS):
+        self.max_rooms = max_rooms
+        self.rooms: "OrderedDict[str, Dict[int, RenderedPage]]" = OrderedDict()
+
+    def get(self, room_id: str, limit: int, etag: str) -> Optional[RenderedPage]:
+        """Get the cached page, if it was rendered for the current ETag"""
+        pages = self.rooms.get(room_id)
+        page = pages.get(limit) if pages else None
+        if page is None or page.etag != etag:
+            return None
+        self.rooms.move_to_end(room_id)
+        return page
+
+    def put(self, room_id: str, limit: int, page: RenderedPage):
+        self.rooms.setdefault(room_id, {})[limit] = page
+        self.rooms.move_to_end(room_id)
+        while len(self.rooms) > self.max_rooms:
+            self.rooms.popitem(last=False)
+
+    def invalidate(self, room_id: str):
+        """Drop a room's cached pages after it receives new messages"""
+        self.rooms.pop(room_id, None)
@@ -0,0 +1,73 @@
+"""
+Run a sharded server as several local worker processes
+
+Starts one uvicorn process per worker on consecutive ports, each with the
+same SHARD_WORKERS list and its own SHARD_SELF, and stops them all on
+Ctrl+C. Intended for development and for testing sharding on one machine.
+
+Usage:
+    python -m server.launch_shards --workers 4 --base-port 8001
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+
+def worker_env(worker_id: str, workers: str) -> dict:
+    env = dict(os.environ)
+    env["SHARD_WORKERS"] = workers
+    env["SHARD_SELF"] = worker_id
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sharded chat server workers locally")
+    parser.add_argument("--workers", type=int, default=2, help="Number of worker processes")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind and advertise")
+    parser.add_argument("--base-port", type=int, default=8001, help="Port of the first worker")
+    args = parser.parse_args()
+
+    ids = [f"w{index + 1}" for index in range(args.workers)]
+    ports = {worker_id: args.base_port + index for index, worker_id in enumerate(ids)}
+    workers = ",".join(f"{worker_id}=http://{args.host}:{ports[worker_id]}" for worker_id in ids)
+
+    print("=" * 60)
+    print(f"Starting {args.workers} shard workers")
+    print(f"SHARD_WORKERS={workers}")
+    print("=" * 60)
+
+    processes = []
+    for worker_id in ids:
+        processes.append(subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "server.main:app",
+                "--host", args.host,
+                "--port", str(ports[worker_id]),
+                "--ws-max-size", os.getenv("WS_MAX_FRAME_BYTES", "16384"),
+            ],
+            env=worker_env(worker_id, workers)
+        ))
+
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(0.5)
+        print("A worker exited; stopping the others")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
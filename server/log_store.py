@@ -0,0 +1,463 @@
+"""
+Append-only, segmented message log with a sparse offset index
+
+Each room is a directory of segment files named after the first sequence
+number they contain. Only the newest segment is written to; once it grows
+past MESSAGE_LOG_SEGMENT_BYTES it is sealed and a new one is started.
+Reads go through read-only memory maps and use a sparse in-memory index
+(one entry every MESSAGE_LOG_INDEX_INTERVAL records) to find a starting
+offset, then scan forward.
+
+Record layout (little endian):
+    crc32 | body length | seq | user_id | timestamp | username length | username | content
+
+Content is the raw ciphertext bytes; logs written before that held base64
+text, which is converted when read.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+import mmap
+import os
+import struct
+import threading
+import zlib
+from dotenv import load_dotenv
+
+from .ciphertext import from_legacy
+from .message_store import MessageStore, NewMessage, StoredMessage
+
+# Load environment variables
+load_dotenv()
+
+MESSAGE_LOG_DIR = os.getenv("MESSAGE_LOG_DIR", "./message_log")
+MESSAGE_LOG_SEGMENT_BYTES = int(os.getenv("MESSAGE_LOG_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+MESSAGE_LOG_INDEX_INTERVAL = int(os.getenv("MESSAGE_LOG_INDEX_INTERVAL", "64"))
+# fsync after every append; off by default, like synchronous=NORMAL
+MESSAGE_LOG_FSYNC = os.getenv("MESSAGE_LOG_FSYNC", "false").lower() == "true"
+
+HEADER = struct.Struct("<IIQqdH")
+INDEX_HEADER = struct.Struct("<QQQ")  # last seq, segment size, record count
+INDEX_ENTRY = struct.Struct("<QQ")  # seq, offset
+EPOCH = datetime(1970, 1, 1)
+
+
+class Segment:
+    """One segment file of a room log"""
+
+    def __init__(self, path: Path, base_seq: int):
+        self.path = path
+        self.index_path = path.with_suffix(".idx")
+        self.base_seq = base_seq
+        self.last_seq = base_seq - 1
+        self.size = 0
+        self.count = 0
+        self.index_seqs: List[int] = []
+        self.index_offsets: List[int] = []
+        self._map: Optional[mmap.mmap] = None
+        self._map_size = 0
+
+    def note_record(self, seq: int, offset: int, length: int, index_interval: int):
+        """Account for a record appended at offset"""
+        if self.count % index_interval == 0:
+            self.index_seqs.append(seq)
+            self.index_offsets.append(offset)
+        self.count += 1
+        self.last_seq = seq
+        self.size = offset + length
+
+    def load(self, index_interval: int, verify: bool):
+        """
+        Rebuild the in-memory state from disk
+
+        Sealed segments load their saved index when it matches the file.
+        Otherwise the file is scanned header by header; with verify, the
+        scan checks CRCs and cuts off a torn record left by a crash.
+        """
+        file_size = self.path.stat().st_size
+
+        if not verify and self.index_path.exists():
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            last_seq, size, count = INDEX_HEADER.unpack_from(data, 0)
+            if size == file_size:
+                self.last_seq, self.size, self.count = last_seq, size, count
+                for i in range(INDEX_HEADER.size, len(data), INDEX_ENTRY.size):
+                    seq, offset = INDEX_ENTRY.unpack_from(data, i)
+                    self.index_seqs.append(seq)
+                    self.index_offsets.append(offset)
+                return
+
+        with open(self.path, "rb") as f:
+            data = f.read() if verify else None
+            offset = 0
+            while offset + HEADER.size <= file_size:
+                if data is None:
+                    f.seek(offset)
+                    header = f.read(HEADER.size)
+                else:
+                    header = data[offset:offset + HEADER.size]
+                crc, body_len, seq = HEADER.unpack(header)[:3]
+                end = offset + HEADER.size + body_len
+                if end > file_size:
+                    break
+                if data is not None and zlib.crc32(data[offset + 4:end]) != crc:
+                    break
+                self.note_record(seq, offset, end - offset, index_interval)
+                offset = end
+
+        if self.size < file_size:
+            # Drop the torn tail so the next append starts on a record boundary
+            with open(self.path, "r+b") as f:
+                f.truncate(self.size)
+
+    def save_index(self):
+        """Persist the sparse index so reopening a sealed segment skips the scan"""
+        with open(self.index_path, "wb") as f:
+            f.write(INDEX_HEADER.pack(self.last_seq, self.size, self.count))
+            for seq, offset in zip(self.index_seqs, self.index_offsets):
+                f.write(INDEX_ENTRY.pack(seq, offset))
+
+    def view(self) -> Optional[mmap.mmap]:
+        """Get a read-only map covering every record written so far"""
+        if self.size == 0:
+            return None
+        if self._map is None or self._map_size < self.size:
+            self.close()
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._map_size = self.size
+        return self._map
+
+    def records(self, from_seq: int):
+        """Yield (seq, offset, length) for records with seq >= from_seq"""
+        data = self.view()
+        if data is None:
+            return
+
+        position = bisect_right(self.index_seqs, from_seq) - 1
+        offset = self.index_offsets[position] if position >= 0 else 0
+
+        while offset < self.size:
+            body_len, seq = HEADER.unpack_from(data, offset)[1:3]
+            length = HEADER.size + body_len
+            if seq >= from_seq:
+                yield seq, offset, length
+            offset += length
+
+    def decode(self, room_id: str, offset: int) -> StoredMessage:
+        """Decode the record at offset"""
+        data = self.view()
+        _, body_len, seq, user_id, timestamp, username_len = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        username = data[start:start + username_len].decode("utf-8")
+        content = from_legacy(data[start + username_len:start + body_len])
+        return StoredMessage(
+            seq, seq, room_id, user_id, username, content,
+            EPOCH + timedelta(seconds=timestamp)
+        )
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._map_size = 0
+
+
+class RoomLog:
+    """The segment files of one room"""
+
+    def __init__(self, room_id: str, directory: Path, segment_bytes: int, index_interval: int, fsync: bool):
+        self.room_id = room_id
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.fsync = fsync
+        self.segments: List[Segment] = []
+        self.writer = None
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        paths = sorted(self.directory.glob("*.log"), key=lambda p: int(p.stem))
+        for position, path in enumerate(paths):
+            segment = Segment(path, int(path.stem))
+            segment.load(index_interval, verify=position == len(paths) - 1)
+            self.segments.append(segment)
+
+    @property
+    def last_seq(self) -> int:
+        for segment in reversed(self.segments):
+            if segment.count:
+                return segment.last_seq
+        return 0
+
+    @property
+    def first_seq(self) -> int:
+        for segment in self.segments:
+            if segment.count:
+                return segment.index_seqs[0]
+        return 0
+
+    def _segment_path(self, base_seq: int) -> Path:
+        return self.directory / f"{base_seq:020d}.log"
+
+    def _rotate(self, base_seq: int):
+        """Seal the active segment and start a new one"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.segments:
+            self.segments[-1].save_index()
+        self.segments.append(Segment(self._segment_path(base_seq), base_seq))
+
+    def append(self, seq: int, user_id: int, username: str, content: bytes, timestamp: datetime,
+               flush: bool = True):
+        if not self.segments or self.segments[-1].size >= self.segment_bytes:
+            self._rotate(seq)
+
+        active = self.segments[-1]
+        if self.writer is None:
+            self.writer = open(active.path, "ab")
+
+        username_bytes = username.encode("utf-8")
+        body = username_bytes + content
+        header = HEADER.pack(
+            0, len(body), seq, user_id,
+            (timestamp - EPOCH).total_seconds(), len(username_bytes)
+        )
+        crc = zlib.crc32(header[4:] + body)
+        record = struct.pack("<I", crc) + header[4:] + body
+
+        self.writer.write(record)
+        if flush:
+            self.flush()
+
+        active.note_record(seq, active.size, len(record), self.index_interval)
+
+    def flush(self):
+        """Push buffered records to the OS (and to disk with fsync enabled)"""
+        if self.writer is None:
+            return
+        self.writer.flush()
+        if self.fsync:
+            os.fsync(self.writer.fileno())
+
+    def read_range(self, after_seq: int, limit: int) -> List[StoredMessage]:
+        messages = []
+        if limit <= 0:
+            return messages
+
+        base_seqs = [segment.base_seq for segment in self.segments]
+        start = max(0, bisect_right(base_seqs, after_seq + 1) - 1)
+
+        for segment in self.segments[start:]:
+            for seq, offset, _ in segment.records(after_seq + 1):
+                messages.append(segment.decode(self.room_id, offset))
+                if len(messages) >= limit:
+                    return messages
+        return messages
+
+    def read_before(self, before_seq: int, limit: int) -> List[StoredMessage]:
+        first_seq = self.first_seq
+        upper = min(before_seq - 1, self.last_seq)
+        messages: List[StoredMessage] = []
+
+        # Sequence numbers are nearly contiguous, so read backwards in
+        # windows sized to the shortfall until enough messages are found
+        while len(messages) < limit and upper >= first_seq > 0:
+            lower = max(first_seq - 1, upper - (limit - len(messages)))
+            window = [m for m in self.read_range(lower, upper - lower) if m.seq <= upper]
+            messages = window + messages
+            upper = lower
+
+        return messages[-limit:] if limit > 0 else []
+
+    def truncate_before(self, seq: int) -> int:
+        """
+        Delete sealed segments whose messages all have a lower sequence number
+
+        Returns:
+            Number of messages removed
+        """
+        removed = 0
+        while len(self.segments) > 1 and self.segments[0].last_seq < seq:
+            segment = self.segments.pop(0)
+            segment.close()
+            removed += segment.count
+            segment.path.unlink(missing_ok=True)
+            segment.index_path.unlink(missing_ok=True)
+        return removed
+
+    def compact(self) -> int:
+        """
+        Merge runs of small sealed segments into full-sized ones
+
+        Frequent restarts or low traffic leave many small segments behind;
+        merging them keeps the file count and per-read segment lookups low.
+
+        Returns:
+            Number of segments removed
+        """
+        sealed = self.segments[:-1]
+        merged: List[Segment] = []
+        removed = 0
+        position = 0
+
+        while position < len(sealed):
+            run = [sealed[position]]
+            total = sealed[position].size
+            while (position + len(run) < len(sealed)
+                   and total + sealed[position + len(run)].size <= self.segment_bytes):
+                total += sealed[position + len(run)].size
+                run.append(sealed[position + len(run)])
+
+            if len(run) == 1:
+                merged.append(run[0])
+            else:
+                merged.append(self._merge(run))
+                removed += len(run) - 1
+            position += len(run)
+
+        self.segments = merged + self.segments[-1:]
+        return removed
+
+    def _merge(self, run: List[Segment]) -> Segment:
+        """Concatenate segments into the first one's file and rebuild its index"""
+        target = run[0].path
+        temp_path = target.with_suffix(".compact")
+
+        with open(temp_path, "wb") as out:
+            for segment in run:
+                data = segment.view()
+                if data is not None:
+                    out.write(data[:segment.size])
+
+        for segment in run:
+            segment.close()
+        os.replace(temp_path, target)
+        for segment in run:
+            segment.index_path.unlink(missing_ok=True)
+        for segment in run[1:]:
+            segment.path.unlink(missing_ok=True)
+
+        # Records were copied verbatim from valid segments, so a header scan suffices
+        merged = Segment(target, run[0].base_seq)
+        merged.load(self.index_interval, verify=False)
+        merged.save_index()
+        return merged
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        for segment in self.segments:
+            segment.close()
+
+
+class LogMessageStore(MessageStore):
+    """
+    Stores messages in per-room append-only segment files
+
+    Message ids are the per-room sequence numbers, since the log has no
+    global row id.
+    """
+
+    compacts = True
+
+    def __init__(self, directory: str = MESSAGE_LOG_DIR,
+                 segment_bytes: int = MESSAGE_LOG_SEGMENT_BYTES,
+                 index_interval: int = MESSAGE_LOG_INDEX_INTERVAL,
+                 fsync: bool = MESSAGE_LOG_FSYNC):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.fsync = fsync
+        self.rooms_open: Dict[str, RoomLog] = {}
+        # Exports read from a worker thread while the event loop appends
+        self.lock = threading.Lock()
+
+    def _room(self, room_id: str) -> RoomLog:
+        room = self.rooms_open.get(room_id)
+        if room is None:
+            room = RoomLog(
+                room_id,
+                self.directory / room_id.encode("utf-8").hex(),
+                self.segment_bytes,
+                self.index_interval,
+                self.fsync
+            )
+            self.rooms_open[room_id] = room
+        return room
+
+    def append(self, room_id: str, seq: int, user_id: int, username: str, content: bytes) -> StoredMessage:
+        timestamp = datetime.utcnow()
+        with self.lock:
+            self._room(room_id).append(seq, user_id, username, content, timestamp)
+        return StoredMessage(seq, seq, room_id, user_id, username, content, timestamp)
+
+    def append_many(self, messages: List[NewMessage]) -> List[StoredMessage]:
+        timestamp = datetime.utcnow()
+        with self.lock:
+            # One flush (and fsync) per room instead of per record
+            touched = {}
+            for msg in messages:
+                room = touched.setdefault(msg.room_id, self._room(msg.room_id))
+                room.append(msg.seq, msg.user_id, msg.username, msg.content, timestamp, flush=False)
+            for room in touched.values():
+                room.flush()
+        return [
+            StoredMessage(msg.seq, msg.seq, msg.room_id, msg.user_id, msg.username, msg.content, timestamp)
+            for msg in messages
+        ]
+
+    def read_range(self, room_id: str, after_seq: int, limit: int) -> List[StoredMessage]:
+        with self.lock:
+            return self._room(room_id).read_range(after_seq, limit)
+
+    def read_before(self, room_id: str, before_seq: int, limit: int) -> List[StoredMessage]:
+        with self.lock:
+            return self._room(room_id).read_before(before_seq, limit)
+
+    def first_seq(self, room_id: str) -> int:
+        with self.lock:
+            return self._room(room_id).first_seq
+
+    def last_seq(self, room_id: str) -> int:
+        with self.lock:
+            return self._room(room_id).last_seq
+
+    def delete_through(self, room_id: str, seq: int) -> int:
+        """Drop whole sealed segments whose messages all have seq <= seq"""
+        with self.lock:
+            return self._room(room_id).truncate_before(seq + 1)
+
+    def rooms(self) -> List[str]:
+        with self.lock:
+            names = set(self.rooms_open)
+            if self.directory.exists():
+                for path in self.directory.iterdir():
+                    if path.is_dir():
+                        try:
+                            names.add(bytes.fromhex(path.name).decode("utf-8"))
+                        except ValueError:
+                            continue
+            return sorted(names)
+
+    def forget(self, room_id: str):
+        """Close a room's log; it is reopened from disk on next use"""
+        with self.lock:
+            room = self.rooms_open.pop(room_id, None)
+            if room is not None:
+                room.close()
+
+    def compact(self, room_id: str) -> int:
+        """Merge small sealed segments of a room"""
+        with self.lock:
+            return self._room(room_id).compact()
+
+    def close(self):
+        with self.lock:
+            for room in self.rooms_open.values():
+                room.close()
+            self.rooms_open.clear()
@@ -0,0 +1,193 @@
+"""
+Event loop lag monitoring and overload admission control
+
+A sampler task measures how late the event loop wakes it up (loop lag).
+A watchdog thread notices when the loop stops turning altogether and
+captures the stack of the loop thread, so the blocking handler - a slow
+query in get_history, bcrypt in login, a long websocket_endpoint step -
+is named in the log. The admission controller uses the measured lag to
+defer or reject new work (WebSocket handshakes, logins) with retry hints
+while the loop is overloaded, so connected users keep low latency.
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+from dotenv import load_dotenv
+
+from .metrics import metrics
+
+# Load environment variables
+load_dotenv()
+
+LOOP_MONITOR_INTERVAL_MS = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+# Loop blocked at least this long gets its stack captured
+LOOP_BLOCKED_THRESHOLD_MS = int(os.getenv("LOOP_BLOCKED_THRESHOLD_MS", "250"))
+
+# Lag above which new work waits for the loop to recover, and above which it is refused
+ADMISSION_DEFER_LAG_MS = int(os.getenv("ADMISSION_DEFER_LAG_MS", "100"))
+ADMISSION_REJECT_LAG_MS = int(os.getenv("ADMISSION_REJECT_LAG_MS", "500"))
+# Longest a deferred request waits before it is refused
+ADMISSION_MAX_DEFER_MS = int(os.getenv("ADMISSION_MAX_DEFER_MS", "1000"))
+# Base retry hint for refused requests; a random extra of up to the same spreads retries
+ADMISSION_RETRY_AFTER_MS = int(os.getenv("ADMISSION_RETRY_AFTER_MS", "2000"))
+
+# Blocked-loop reports kept for /api/admin/loop
+BLOCKED_REPORTS_KEPT = 20
+
+
+class LoopMonitor:
+    """Samples event loop lag and reports what blocked the loop"""
+
+    def __init__(self, interval_ms: int = LOOP_MONITOR_INTERVAL_MS,
+                 blocked_threshold_ms: int = LOOP_BLOCKED_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.blocked_threshold = blocked_threshold_ms / 1000
+        self.samples: Deque[float] = deque(maxlen=max(1, int(1 / self.interval)))
+        self.max_lag_ms = 0.0
+        self.last_tick = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.blocked_reports: Deque[Dict] = deque(maxlen=BLOCKED_REPORTS_KEPT)
+        self.sampler_task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    @property
+    def lag_ms(self) -> float:
+        """
+        Current loop lag: the worst recent sample, or how long the loop has
+        been stuck right now if that is longer
+        """
+        recent = max(self.samples, default=0.0)
+        stuck = (time.monotonic() - self.last_tick - self.interval) * 1000
+        return max(recent, stuck, 0.0)
+
+    def start(self):
+        """Start sampling; call from the running event loop"""
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self.stopped.clear()
+        self.sampler_task = asyncio.create_task(self._sample())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.sampler_task is not None:
+            self.sampler_task.cancel()
+
+    async def _sample(self):
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag_ms = max(0.0, (now - expected) * 1000)
+                self.samples.append(lag_ms)
+                self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+                self.last_tick = now
+        except asyncio.CancelledError:
+            pass
+
+    def _watch(self):
+        """Watchdog thread: capture the loop thread's stack while it is blocked"""
+        reported_tick = None
+        while not self.stopped.wait(self.interval):
+            blocked_for = time.monotonic() - self.last_tick - self.interval
+            # One report per blocking episode
+            if blocked_for < self.blocked_threshold or reported_tick == self.last_tick:
+                continue
+            reported_tick = self.last_tick
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)
+            report = {
+                "blocked_ms": round(blocked_for * 1000),
+                "at": time.time(),
+                "handler": blocking_handler(frame),
+                "stack": [line.rstrip() for line in stack[-12:]],
+            }
+            self.blocked_reports.append(report)
+
+            metrics.increment("loop_blocked")
+            print(f"Event loop blocked for {report['blocked_ms']}ms in {report['handler']}")
+
+    def snapshot(self) -> Dict:
+        return {
+            "lag_ms": round(self.lag_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "blocked": list(self.blocked_reports),
+        }
+
+
+def blocking_handler(frame) -> str:
+    """
+    Name the innermost application function in a stack
+
+    Frames from the standard library and installed packages are skipped so
+    the report names our handler (e.g. server.main.get_history) rather than
+    the socket call it was waiting in - unless no application frame exists.
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    innermost = None
+    while frame is not None:
+        code = frame.f_code
+        if innermost is None:
+            innermost = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        filename = os.path.abspath(code.co_filename)
+        if filename.startswith(package_root) and "site-packages" not in filename:
+            module = os.path.relpath(filename, package_root)[:-3].replace(os.sep, ".")
+            return f"{module}.{code.co_name} (line {frame.f_lineno})"
+        frame = frame.f_back
+    return innermost or "unknown"
+
+
+class AdmissionController:
+    """Defers or refuses new work while the event loop is overloaded"""
+
+    def __init__(self, monitor: LoopMonitor,
+                 defer_lag_ms: int = ADMISSION_DEFER_LAG_MS,
+                 reject_lag_ms: int = ADMISSION_REJECT_LAG_MS,
+                 max_defer_ms: int = ADMISSION_MAX_DEFER_MS,
+                 retry_after_ms: int = ADMISSION_RETRY_AFTER_MS):
+        self.monitor = monitor
+        self.defer_lag_ms = defer_lag_ms
+        self.reject_lag_ms = reject_lag_ms
+        self.max_defer = max_defer_ms / 1000
+        self.retry_after_ms = retry_after_ms
+
+    def retry_hint_ms(self) -> int:
+        return self.retry_after_ms + random.randint(0, self.retry_after_ms)
+
+    async def admit(self) -> Optional[int]:
+        """
+        Wait until new work may start
+
+        Returns:
+            None when admitted, otherwise the suggested retry delay in ms
+        """
+        lag = self.monitor.lag_ms
+        if lag < self.defer_lag_ms:
+            return None
+        if lag >= self.reject_lag_ms:
+            return self.retry_hint_ms()
+
+        # Give the loop a chance to catch up before taking on more work
+        waited = 0.0
+        while waited < self.max_defer:
+            await asyncio.sleep(self.monitor.interval)
+            waited += self.monitor.interval
+            lag = self.monitor.lag_ms
+            if lag < self.defer_lag_ms:
+                return None
+            if lag >= self.reject_lag_ms:
+                break
+        return self.retry_hint_ms()
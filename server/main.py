@@ -2,19 +2,68 @@
 FastAPI application entry point with WebSocket endpoint
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Header, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, Iterator, List, Optional
 import json
 import asyncio
+import cProfile
+import math
+import os
+import threading
 from datetime import datetime
 
-from .database import get_db, init_db
-from .models import User, Message
-from .schemas import UserRegister, UserLogin, Token, MessageResponse
-from .auth import hash_password, verify_password, create_access_token, verify_token
-from .connection_manager import ConnectionManager
+from .database import get_db, init_db, run_write
+from .models import User
+from .schemas import UserRegister, UserLogin, Token, MessageResponse, ShardConfig
+from .auth import hash_password, verify_password, create_access_token, verify_token, verify_admin_token
+from .connection_manager import ConnectionManager, DRAIN_WINDOW_MS
+from .message_store import NewMessage, StoredMessage, create_message_store
+from .ciphertext import InvalidCiphertext, decode_ciphertext, encode_ciphertext
+from .sequencer import RoomSequencer, RESUME_MAX_MESSAGES
+from .retention import MessageArchive, RetentionManager
+from .sharding import ShardRouter, SHARD_MOVE_WINDOW_MS
+from .loop_monitor import AdmissionController, LoopMonitor
+from shared.profiling import SamplingProfiler, cprofile_bytes, phase, phase_timers
+from shared.tracing import tracer, valid_trace_id
+from .history_cache import HistoryCache, RenderedPage, choose_encoding, etag_matches, history_etag
+from .rate_limit import RateLimiter
+from .metrics import metrics
+
+# Largest page /api/history will return in one response
+MAX_HISTORY_LIMIT = 500
+
+# Longest message content accepted, in characters of the encrypted token
+MAX_MESSAGE_LENGTH = 5000
+
+# Limits for one /api/messages/bulk request
+BULK_MAX_MESSAGES = int(os.getenv("BULK_MAX_MESSAGES", "10000"))
+BULK_MAX_BODY_BYTES = int(os.getenv("BULK_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+# Messages per message_batch frame when fanning out a bulk import
+BULK_BROADCAST_BATCH = 500
+
+# Messages fetched per database round trip when exporting a room
+EXPORT_PAGE_SIZE = 1000
+
+# Longest on-demand profile capture, in seconds
+PROFILE_MAX_SECONDS = 120
+
+# Largest inbound WebSocket frame accepted; pass the same value to
+# uvicorn --ws-max-size so oversized frames are cut off while reading
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", "16384"))
+
+
+def frame_too_large(data: str) -> bool:
+    """Check whether a text frame is over WS_MAX_FRAME_BYTES once UTF-8 encoded"""
+    # Every character takes 1 to 4 bytes, so only lengths in between need encoding
+    if len(data) > WS_MAX_FRAME_BYTES:
+        return True
+    if len(data) * 4 <= WS_MAX_FRAME_BYTES:
+        return False
+    return len(data.encode("utf-8")) > WS_MAX_FRAME_BYTES
 
 # Initialize FastAPI app
 app = FastAPI(title="Terminal Chat Server", version="1.0.0")
@@ -22,6 +71,33 @@ app = FastAPI(title="Terminal Chat Server", version="1.0.0")
 # Initialize connection manager
 manager = ConnectionManager()
 
+# Message persistence backend
+message_store = create_message_store()
+
+
+# Rendered latest history pages, invalidated when a room gets new messages
+history_cache = HistoryCache()
+
+# Per-connection and per-user inbound frame limits
+rate_limiter = RateLimiter()
+
+# Which worker owns which room when running sharded
+shard_router = ShardRouter()
+
+# Moves cold messages of this worker's rooms to the archive and reads across both tiers
+retention = RetentionManager(message_store, MessageArchive(), owns_room=shard_router.is_local)
+retention_task = None
+
+# Per-room sequence numbers and replay buffers, seeded from both retention tiers
+sequencer = RoomSequencer(retention)
+
+# Event loop lag, blocked-loop reports and overload admission control
+loop_monitor = LoopMonitor()
+admission = AdmissionController(loop_monitor)
+
+# Only one profile capture runs at a time
+profile_lock = asyncio.Lock()
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,9 +111,27 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
+    global retention_task
+
     init_db()
     print("Database initialized successfully")
 
+    loop_monitor.start()
+
+    if retention.needed:
+        retention_task = asyncio.create_task(retention.run_forever())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background jobs, then flush and close the message store"""
+    loop_monitor.stop()
+    if retention_task is not None:
+        retention_task.cancel()
+    # Writes run in order, so this returns once every queued one has finished
+    await run_write(lambda: None)
+    message_store.close()
+
 
 @app.get("/")
 async def root():
@@ -52,12 +146,191 @@ async def root():
 @app.get("/api/health")
 async def health():
     """API health check endpoint for monitoring"""
+    if manager.draining:
+        # Let load balancers route new clients elsewhere
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "draining", "version": "1.0.0"}
+        )
+
     return {
         "status": "healthy",
         "version": "1.0.0"
     }
 
 
+async def require_admin(x_admin_token: str = Header(None)):
+    """
+    Dependency to restrict an endpoint to operators holding ADMIN_TOKEN
+    """
+    if not verify_admin_token(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required"
+        )
+
+
+async def admission_check():
+    """
+    Dependency to refuse expensive requests while the event loop is overloaded
+
+    Refused requests get 503 with a Retry-After header.
+    """
+    retry_after_ms = await admission.admit()
+    if retry_after_ms is not None:
+        metrics.increment("admission_rejected_http")
+        retry_after = math.ceil(retry_after_ms / 1000)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server is busy - try again in {retry_after} seconds",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+@app.get("/api/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    """Operational counters for monitoring"""
+    return {**metrics.snapshot(), "loop_lag_ms": round(loop_monitor.lag_ms, 1)}
+
+
+@app.get("/api/admin/loop", dependencies=[Depends(require_admin)])
+async def get_loop_status():
+    """Event loop lag and the most recent reports of what blocked the loop"""
+    return loop_monitor.snapshot()
+
+
+@app.post("/api/admin/drain", dependencies=[Depends(require_admin)])
+async def drain(window_ms: int = DRAIN_WINDOW_MS):
+    """
+    Drain the server before a restart
+
+    Refuses new WebSocket connections and tells connected clients to
+    reconnect at staggered times across window_ms, so they do not all
+    hit the next instance at once.
+    """
+    if window_ms < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="window_ms must not be negative"
+        )
+
+    drained = await manager.drain(window_ms)
+
+    return {
+        "status": "draining",
+        "drained_connections": drained,
+        "window_ms": window_ms
+    }
+
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def capture_profile(seconds: float = 10, mode: str = "sample", interval_ms: float = 5):
+    """
+    Profile the event loop thread of this process for a number of seconds
+
+    mode=sample returns folded stacks (text, for flame graphs) from a
+    sampling profiler; mode=cprofile returns a cProfile capture in the
+    pstats format. The process keeps serving while it is being profiled.
+    """
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS}"
+        )
+    if mode not in ("sample", "cprofile"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="mode must be 'sample' or 'cprofile'"
+        )
+    if profile_lock.locked():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile capture is already running"
+        )
+
+    async with profile_lock:
+        if mode == "cprofile":
+            # Enabled from the loop thread, so it records everything the loop runs
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            return Response(
+                content=cprofile_bytes(profiler),
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="server.prof"'}
+            )
+
+        sampler = SamplingProfiler(threading.get_ident(), max(interval_ms, 1) / 1000)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+        return Response(
+            content=sampler.folded(),
+            media_type="text/plain",
+            headers={"Content-Disposition": 'attachment; filename="server.folded"'}
+        )
+
+
+@app.get("/api/admin/phases", dependencies=[Depends(require_admin)])
+async def get_phases():
+    """Phase timer totals (empty unless TERMINAL_CHAT_PHASE_TIMERS is set)"""
+    return phase_timers.snapshot()
+
+
+@app.get("/api/admin/shards", dependencies=[Depends(require_admin)])
+async def get_shards():
+    """Current shard workers and the id of this one"""
+    return {"self": shard_router.self_id, "workers": shard_router.workers}
+
+
+@app.post("/api/admin/shards", dependencies=[Depends(require_admin)])
+async def rebalance_shards(config: ShardConfig, window_ms: int = SHARD_MOVE_WINDOW_MS):
+    """
+    Replace the set of shard workers after one was added or removed
+
+    Post the same worker list to every worker, including one being removed.
+    Rooms this worker no longer owns have their state dropped, and their
+    clients are told to reconnect to the new owner at times spread across
+    window_ms.
+    """
+    if not config.workers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one worker is required"
+        )
+    shard_router.update(config.workers)
+
+    moved = {}
+    for room_id in set(manager.connection_rooms.values()) | set(sequencer.last_seq):
+        if shard_router.is_local(room_id):
+            continue
+        sequencer.forget(room_id)
+        history_cache.invalidate(room_id)
+        moved[room_id] = await manager.move_room(room_id, shard_router.ws_url(room_id), window_ms)
+
+    # The store may also hold state for rooms that were only read, e.g. exported
+    for room_id in await asyncio.to_thread(message_store.rooms):
+        if not shard_router.is_local(room_id):
+            message_store.forget(room_id)
+
+    return {
+        "workers": shard_router.workers,
+        "moved_rooms": sorted(moved),
+        "moved_connections": sum(moved.values())
+    }
+
+
+@app.post("/api/admin/retention/run", dependencies=[Depends(require_admin)])
+async def run_retention():
+    """Apply retention policies and compact the message store now instead of waiting for the next interval"""
+    return await asyncio.to_thread(retention.run_once)
+
+
 @app.post("/api/register", response_model=Token, status_code=status.HTTP_201_CREATED)
 async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     """
@@ -101,14 +374,15 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         )
 
     # Create new user
-    hashed_pw = hash_password(user_data.password)
+    # bcrypt is deliberately slow; keep it off the event loop
+    hashed_pw = await asyncio.to_thread(hash_password, user_data.password)
     new_user = User(
         username=user_data.username,
         password_hash=hashed_pw
     )
 
     db.add(new_user)
-    db.commit()
+    await run_write(db.commit)
     db.refresh(new_user)
 
     # Generate JWT token
@@ -122,7 +396,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     )
 
 
-@app.post("/api/login", response_model=Token)
+@app.post("/api/login", response_model=Token, dependencies=[Depends(admission_check)])
 async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     """
     User login endpoint
@@ -132,7 +406,12 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     # Find user by username
     user = db.query(User).filter(User.username == user_data.username).first()
 
-    if not user or not verify_password(user_data.password, user.password_hash):
+    # bcrypt is deliberately slow; keep it off the event loop
+    with phase("login.verify_password"):
+        verified = user is not None and await asyncio.to_thread(
+            verify_password, user_data.password, user.password_hash
+        )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -179,39 +458,416 @@ async def get_current_user(token: str, db: Session) -> User:
     return user
 
 
+def shard_redirect(request: Request, room_id: str) -> Optional[RedirectResponse]:
+    """Redirect a room request to the worker owning the room, if that is another one"""
+    if shard_router.is_local(room_id):
+        return None
+
+    metrics.increment("http_shard_redirects")
+    url = shard_router.http_url(room_id) + request.url.path
+    if request.url.query:
+        url += "?" + request.url.query
+    return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+
+def render_history(room_id: str, limit: int, before_seq: int, after_seq: Optional[int] = None) -> bytes:
+    """Serialize a history page as the JSON body of /api/history"""
+    if after_seq is not None:
+        messages = retention.read_range(room_id, after_seq, limit)
+    else:
+        messages = retention.read_before(room_id, before_seq, limit)
+
+    return json.dumps([
+        {
+            "id": msg.id,
+            "user_id": msg.user_id,
+            "username": msg.username,
+            "content": encode_ciphertext(msg.content),
+            "timestamp": msg.timestamp.isoformat(),
+            "room_id": msg.room_id,
+            "seq": msg.seq
+        }
+        for msg in messages
+    ]).encode("utf-8")
+
+
 @app.get("/api/history", response_model=List[MessageResponse])
 async def get_history(
+    request: Request,
     limit: int = 100,
     room_id: str = "general",
-    db: Session = Depends(get_db)
+    before_seq: Optional[int] = None,
+    after_seq: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
 ):
     """
     Get message history
 
-    Retrieves recent messages with pagination support
+    Retrieves recent messages with pagination support. Pass the seq of the
+    oldest message received as before_seq to page further back; paging
+    continues into the archive once it passes the hot range. Pass the seq of
+    the newest message a client already has as after_seq to get only the
+    messages after it, oldest first (delta sync from a local cache).
+
+    Responses carry an ETag; a matching If-None-Match gets 304 Not Modified
+    without a database query.
     """
-    messages = db.query(Message).filter(
-        Message.room_id == room_id
-    ).order_by(
-        Message.timestamp.desc()
-    ).limit(limit).all()
+    redirect = shard_redirect(request, room_id)
+    if redirect:
+        return redirect
+
+    if before_seq is not None and after_seq is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pass either before_seq or after_seq, not both"
+        )
+
+    # Bound the response size; use /api/history/export for whole rooms
+    limit = max(1, min(limit, MAX_HISTORY_LIMIT))
 
-    # Reverse to get chronological order
-    messages.reverse()
+    latest_seq = sequencer.current(room_id)
+    etag = history_etag(room_id, latest_seq, retention.generation, limit, before_seq, after_seq)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
 
-    # Format response with username
-    response = []
-    for msg in messages:
-        response.append(MessageResponse(
-            id=msg.id,
-            user_id=msg.user_id,
-            username=msg.user.username,
-            content=msg.content,
-            timestamp=msg.timestamp,
-            room_id=msg.room_id
-        ))
+    if etag_matches(if_none_match, etag):
+        metrics.increment("history_not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    return response
+    # Only the latest page is shared by many clients, so only it is cached
+    latest_page = before_seq is None and after_seq is None
+    page = history_cache.get(room_id, limit, etag) if latest_page else None
+    if page is None:
+        with phase("history.render"):
+            body = render_history(room_id, limit, latest_seq + 1 if before_seq is None else before_seq, after_seq)
+        page = RenderedPage(etag, body)
+        if latest_page:
+            history_cache.put(room_id, limit, page)
+    else:
+        metrics.increment("history_cache_hits")
+
+    content, encoding = page.content(choose_encoding(accept_encoding))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def export_room(room_id: str, after_seq: int = 0, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[bytes]:
+    """
+    Yield a room's messages as NDJSON, one page per chunk
+
+    Pages are read with a keyset cursor on the room sequence number, so
+    only one page is held in memory and no read transaction stays open
+    between pages. Archived messages are read first, then the hot store.
+    """
+    last_seq = after_seq
+    while True:
+        messages = retention.read_range(room_id, last_seq, page_size)
+        if not messages:
+            break
+
+        yield "".join(
+            json.dumps({
+                "id": msg.id,
+                "seq": msg.seq,
+                "user_id": msg.user_id,
+                "username": msg.username,
+                "content": encode_ciphertext(msg.content),
+                "timestamp": msg.timestamp.isoformat(),
+                "room_id": msg.room_id
+            }) + "\n"
+            for msg in messages
+        ).encode("utf-8")
+
+        last_seq = messages[-1].seq
+
+
+@app.get("/api/history/export")
+async def export_history(
+    request: Request,
+    token: str,
+    room_id: str = "general",
+    after_seq: int = 0,
+    db: Session = Depends(get_db)
+):
+    """
+    Export a room's full message history as NDJSON
+
+    Streams messages in sequence order with constant memory use regardless
+    of room size. Pass after_seq to resume an interrupted export.
+    """
+    await get_current_user(token, db)
+
+    redirect = shard_redirect(request, room_id)
+    if redirect:
+        return redirect
+
+    return StreamingResponse(
+        export_room(room_id, after_seq),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{room_id}-export.ndjson"'}
+    )
+
+
+def message_payload(msg: StoredMessage, trace_id: Optional[str] = None) -> str:
+    """Serialize a stored message as a WebSocket chat frame"""
+    frame = {
+        "type": "message",
+        "id": msg.id,
+        "seq": msg.seq,
+        "user_id": msg.user_id,
+        "username": msg.username,
+        "content": encode_ciphertext(msg.content),
+        "timestamp": msg.timestamp.isoformat(),
+        "room_id": msg.room_id
+    }
+    if trace_id:
+        frame["trace_id"] = trace_id
+    return json.dumps(frame)
+
+
+async def read_bulk_items(request: Request) -> List[Any]:
+    """
+    Read the items of a bulk request: a JSON array, or NDJSON with one item per line
+
+    NDJSON is parsed line by line as it arrives; a line that is not valid
+    JSON becomes an item that fails validation instead of failing the request.
+    """
+    content_type = request.headers.get("content-type", "")
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Request body too large (max {BULK_MAX_BODY_BYTES} bytes)"
+    )
+
+    # Refuse a declared oversized body before reading any of it
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        declared = 0
+    if declared > BULK_MAX_BODY_BYTES:
+        raise too_large
+
+    if "ndjson" not in content_type:
+        # The length header is optional (chunked uploads), so count while reading
+        chunks = []
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > BULK_MAX_BODY_BYTES:
+                raise too_large
+            chunks.append(chunk)
+        try:
+            items = json.loads(b"".join(chunks))
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body is not valid JSON")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array")
+        return items
+
+    items = []
+    received = 0
+    pending = b""
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > BULK_MAX_BODY_BYTES:
+            raise too_large
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                items.append(parse_ndjson_line(line))
+    if pending.strip():
+        items.append(parse_ndjson_line(pending))
+    return items
+
+
+def parse_ndjson_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
+
+
+def store_message(room_id: str, user_id: int, username: str, ciphertext: bytes) -> StoredMessage:
+    """Number and persist one message (run on the writer thread with run_write)"""
+    try:
+        return message_store.append(room_id, sequencer.next_seq(room_id), user_id, username, ciphertext)
+    except Exception:
+        # Give the reserved sequence number out again
+        sequencer.resync(room_id)
+        raise
+
+
+def store_messages(messages: List[NewMessage]) -> List[StoredMessage]:
+    """
+    Number and persist several messages at once (run on the writer thread)
+
+    The seq of each given message is ignored and replaced by the room's next one.
+    """
+    numbered = [msg._replace(seq=sequencer.next_seq(msg.room_id)) for msg in messages]
+    try:
+        return message_store.append_many(numbered)
+    except Exception:
+        for room_id in {msg.room_id for msg in numbered}:
+            sequencer.resync(room_id)
+        raise
+
+
+def validate_bulk_item(item: Any, default_room_id: str):
+    """
+    Check one bulk item
+
+    Returns:
+        (room_id, ciphertext bytes)
+
+    Raises:
+        ValueError: With the reason reported for this item
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Item must be a JSON object")
+
+    room_id = item.get("room_id", default_room_id)
+    if not isinstance(room_id, str) or not room_id or len(room_id) > 50:
+        raise ValueError("Invalid room_id")
+
+    content = item.get("content")
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("Missing content")
+    content = content.strip()
+    if len(content) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"Message too long (max {MAX_MESSAGE_LENGTH} characters)")
+
+    if not shard_router.is_local(room_id):
+        raise ValueError(f"Room is served by {shard_router.http_url(room_id)}")
+
+    try:
+        return room_id, decode_ciphertext(content)
+    except InvalidCiphertext:
+        raise ValueError("Content must be an encrypted token")
+
+
+@app.post("/api/messages/bulk")
+async def bulk_messages(
+    request: Request,
+    room_id: str = "general",
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Post many pre-encrypted messages at once
+
+    For bots and bridges. Accepts a JSON array or an NDJSON stream of
+    {"content": ..., "room_id": ...} objects (room_id defaults to the query
+    parameter), stores the valid ones with one batched insert and
+    broadcasts them as message_batch frames. Invalid items are reported
+    and skipped; they do not fail the request.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Bearer token required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_current_user(token, db)
+
+    items = await read_bulk_items(request)
+    if len(items) > BULK_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many messages (max {BULK_MAX_MESSAGES} per request)"
+        )
+
+    results: List[Dict[str, Any]] = []
+    accepted: List[int] = []
+    new_messages: List[NewMessage] = []
+    for index, item in enumerate(items):
+        try:
+            item_room_id, ciphertext = validate_bulk_item(item, room_id)
+        except ValueError as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+            continue
+        accepted.append(len(results))
+        results.append({"index": index, "status": "ok"})
+        new_messages.append(NewMessage(item_room_id, 0, user.id, user.username, ciphertext))
+
+    stored = await run_write(store_messages, new_messages)
+
+    # Group payloads per room so each room gets its messages in order
+    payloads: Dict[str, List[str]] = {}
+    for position, msg in zip(accepted, stored):
+        results[position].update({"id": msg.id, "seq": msg.seq, "room_id": msg.room_id})
+        payload = message_payload(msg)
+        sequencer.record(msg.room_id, msg.seq, payload)
+        payloads.setdefault(msg.room_id, []).append(payload)
+
+    for batch_room_id, room_payloads in payloads.items():
+        history_cache.invalidate(batch_room_id)
+        for start in range(0, len(room_payloads), BULK_BROADCAST_BATCH):
+            # Splice the already serialized payloads instead of re-encoding them
+            await manager.broadcast(
+                '{"type": "message_batch", "room_id": ' + json.dumps(batch_room_id)
+                + ', "messages": [' + ", ".join(room_payloads[start:start + BULK_BROADCAST_BATCH]) + "]}",
+                batch_room_id
+            )
+
+    metrics.increment("bulk_messages_accepted", len(stored))
+    metrics.increment("bulk_messages_rejected", len(results) - len(stored))
+
+    return {
+        "accepted": len(stored),
+        "rejected": len(results) - len(stored),
+        "results": results
+    }
+
+
+async def resume_room(websocket: WebSocket, room_id: str, last_seq: int):
+    """
+    Replay messages a reconnecting client missed in a room
+
+    Replays from the in-memory buffer when it still covers the gap and
+    falls back to the message store otherwise. Replayed frames are marked
+    with "replay" so the client can order them before live traffic.
+    """
+    current_seq = sequencer.current(room_id)
+    truncated = False
+
+    payloads = sequencer.replay(room_id, last_seq)
+    if payloads is None:
+        # Only the most recent RESUME_MAX_MESSAGES are replayed
+        if current_seq - last_seq > RESUME_MAX_MESSAGES:
+            last_seq = current_seq - RESUME_MAX_MESSAGES
+            truncated = True
+        missed = retention.read_range(room_id, last_seq, RESUME_MAX_MESSAGES)
+        payloads = [message_payload(msg) for msg in missed]
+    elif len(payloads) > RESUME_MAX_MESSAGES:
+        payloads = payloads[-RESUME_MAX_MESSAGES:]
+        truncated = True
+
+    for payload in payloads:
+        # Mark as replayed without re-serializing the whole frame
+        await websocket.send_text(payload[:-1] + ', "replay": true}')
+
+    await websocket.send_text(json.dumps({
+        "type": "resume_complete",
+        "room_id": room_id,
+        "seq": current_seq,
+        "replayed": len(payloads),
+        "truncated": truncated
+    }))
+
+
+async def send_wrong_shard(user_id: int, room_id: str):
+    """Tell a client that a room it addressed is served by another worker"""
+    error_msg = json.dumps({
+        "type": "error",
+        "code": "wrong_shard",
+        "room_id": room_id,
+        "url": shard_router.ws_url(room_id),
+        "message": "Room is served by another worker"
+    })
+    await manager.send_personal_message(error_msg, str(user_id))
 
 
 @app.websocket("/ws/{user_id}")
@@ -219,6 +875,7 @@ async def websocket_endpoint(
     websocket: WebSocket,
     user_id: int,
     token: str = None,
+    room_id: str = "general",
     db: Session = Depends(get_db)
 ):
     """
@@ -226,6 +883,34 @@ async def websocket_endpoint(
 
     Handles connection lifecycle, message broadcasting, and heartbeat
     """
+    # Refuse new connections while draining for a restart
+    if manager.draining:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    # When sharded, send the client to the worker owning its room
+    if not shard_router.is_local(room_id):
+        metrics.increment("ws_shard_redirects")
+        await websocket.accept()
+        await manager.send_reconnect(
+            [(str(user_id), websocket)], 0, "shard_redirect", shard_router.ws_url(room_id)
+        )
+        return
+
+    # Shed new connections while the loop is overloaded so connected users
+    # keep low latency; clients come back after the retry hint
+    retry_after_ms = await admission.admit()
+    if retry_after_ms is not None:
+        metrics.increment("admission_rejected_ws")
+        await websocket.accept()
+        await websocket.send_text(json.dumps({
+            "type": "reconnect",
+            "after_ms": retry_after_ms,
+            "reason": "overloaded"
+        }))
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
     # Validate user exists
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
@@ -233,7 +918,7 @@ async def websocket_endpoint(
         return
 
     # Accept connection and add to manager
-    await manager.connect(str(user_id), websocket)
+    await manager.connect(str(user_id), websocket, room_id)
 
     # Broadcast user joined message
     join_message = json.dumps({
@@ -242,18 +927,20 @@ async def websocket_endpoint(
         "user_id": user_id,
         "timestamp": datetime.utcnow().isoformat()
     })
-    await manager.broadcast(join_message, exclude_user=str(user_id))
+    await manager.broadcast(join_message, room_id, exclude_user=str(user_id))
 
     # Broadcast updated active users count and list to ALL users
-    active_users = manager.get_active_users()
-    active_user_info = manager.get_active_user_info(db)
+    active_users = manager.get_active_users(room_id)
+    active_user_info = manager.get_active_user_info(db, room_id)
     active_users_message = json.dumps({
         "type": "active_users",
         "users": active_users,
         "user_info": active_user_info,
         "count": len(active_users)
     })
-    await manager.broadcast(active_users_message)
+    await manager.broadcast(active_users_message, room_id)
+
+    limiter = rate_limiter.open(str(user_id))
 
     try:
         # Start heartbeat task
@@ -262,10 +949,69 @@ async def websocket_endpoint(
         # Message receive loop
         while True:
             data = await websocket.receive_text()
-            message_data = json.loads(data)
+
+            # Reject oversized frames before spending time parsing them. The
+            # frame is already in memory by now, so this is only a backstop:
+            # uvicorn's --ws-max-size cuts frames off while reading them.
+            if frame_too_large(data):
+                if limiter.record_violation():
+                    metrics.increment("ws_connections_closed_flooding")
+                    await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+                    # Counted as an oversized frame below
+                    raise WebSocketDisconnect(code=status.WS_1009_MESSAGE_TOO_BIG)
+                metrics.increment("ws_frames_rejected_oversize")
+
+                error_msg = json.dumps({
+                    "type": "error",
+                    "code": "frame_too_large",
+                    "max_bytes": WS_MAX_FRAME_BYTES,
+                    "message": f"Frame too large (max {WS_MAX_FRAME_BYTES} bytes)"
+                })
+                await manager.send_personal_message(error_msg, str(user_id))
+                continue
+
+            try:
+                message_data = json.loads(data)
+            except json.JSONDecodeError:
+                metrics.increment("ws_frames_rejected_invalid_json")
+                continue
+            if not isinstance(message_data, dict):
+                metrics.increment("ws_frames_rejected_invalid_json")
+                continue
+            frame_type = message_data.get("type")
+
+            # Enforce per-connection and per-user rate limits
+            retry_after = limiter.check(frame_type)
+            if retry_after:
+                metrics.increment("ws_frames_rate_limited")
+                if limiter.record_violation():
+                    # Kept flooding after being told to slow down
+                    metrics.increment("ws_connections_closed_flooding")
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                    raise WebSocketDisconnect(code=status.WS_1008_POLICY_VIOLATION)
+
+                # Dropped typing frames are harmless, so only report the rest
+                if frame_type != "typing":
+                    error_msg = json.dumps({
+                        "type": "error",
+                        "code": "rate_limited",
+                        "frame_type": frame_type,
+                        "retry_after_ms": int(retry_after * 1000),
+                        "message": "Rate limit exceeded - slow down"
+                    })
+                    await manager.send_personal_message(error_msg, str(user_id))
+                continue
 
             # Handle different message types
             if message_data.get("type") == "message":
+                trace_id = valid_trace_id(message_data.get("trace_id"))
+                tracer.mark(trace_id, "server_receive")
+
+                message_room_id = message_data.get("room_id", room_id)
+                if not shard_router.is_local(message_room_id):
+                    await send_wrong_shard(user_id, message_room_id)
+                    continue
+
                 # Validate message content
                 content = message_data.get("content", "").strip()
 
@@ -273,36 +1019,56 @@ async def websocket_endpoint(
                     # Ignore empty messages
                     continue
 
-                if len(content) > 5000:
+                if len(content) > MAX_MESSAGE_LENGTH:
                     # Message too long, send error to user
                     error_msg = json.dumps({
                         "type": "error",
-                        "message": "Message too long (max 5000 characters)"
+                        "message": f"Message too long (max {MAX_MESSAGE_LENGTH} characters)"
                     })
                     await manager.send_personal_message(error_msg, str(user_id))
                     continue
 
-                # Save message to database
-                new_message = Message(
-                    user_id=user_id,
-                    content=content,
-                    room_id=message_data.get("room_id", "general")
+                # Store the ciphertext as raw bytes; the server cannot decrypt
+                # it, but malformed tokens would break every reader
+                try:
+                    ciphertext = decode_ciphertext(content)
+                except InvalidCiphertext:
+                    error_msg = json.dumps({
+                        "type": "error",
+                        "code": "invalid_ciphertext",
+                        "message": "Message content must be an encrypted token"
+                    })
+                    await manager.send_personal_message(error_msg, str(user_id))
+                    continue
+
+                # Persist message with the next room sequence number; writes
+                # complete in order, so broadcasts go out in seq order
+                new_message = await run_write(
+                    store_message, message_room_id, user_id, user.username, ciphertext
                 )
-                db.add(new_message)
-                db.commit()
-                db.refresh(new_message)
+                tracer.mark(trace_id, "db_commit")
 
                 # Broadcast to all connected clients
-                broadcast_data = json.dumps({
-                    "type": "message",
-                    "id": new_message.id,
-                    "user_id": user_id,
-                    "username": user.username,
-                    "content": new_message.content,
-                    "timestamp": new_message.timestamp.isoformat(),
-                    "room_id": new_message.room_id
-                })
-                await manager.broadcast(broadcast_data)
+                broadcast_data = message_payload(new_message)
+                sequencer.record(message_room_id, new_message.seq, broadcast_data)
+                history_cache.invalidate(message_room_id)
+                if trace_id:
+                    # Replays stay untraced; only the live frame carries the id
+                    broadcast_data = message_payload(new_message, trace_id)
+                tracer.mark(trace_id, "broadcast_enqueue")
+                await manager.broadcast(broadcast_data, message_room_id, trace_id=trace_id)
+
+            elif message_data.get("type") == "resume":
+                # Reconnecting client asks for messages after its last seen sequence
+                try:
+                    last_seq = int(message_data.get("last_seq", 0))
+                except (TypeError, ValueError):
+                    last_seq = 0
+                resume_room_id = message_data.get("room_id", room_id)
+                if not shard_router.is_local(resume_room_id):
+                    await send_wrong_shard(user_id, resume_room_id)
+                    continue
+                await resume_room(websocket, resume_room_id, last_seq)
 
             elif message_data.get("type") == "pong":
                 # Heartbeat response - connection is alive
@@ -314,33 +1080,44 @@ async def websocket_endpoint(
                 await manager.broadcast_typing_indicator(
                     str(user_id),
                     user.username,
-                    is_typing
+                    is_typing,
+                    room_id
                 )
 
-    except WebSocketDisconnect:
+    except WebSocketDisconnect as disconnect:
+        if disconnect.code == status.WS_1009_MESSAGE_TOO_BIG:
+            # Closed above, or cut off by uvicorn's --ws-max-size
+            metrics.increment("ws_frames_rejected_oversize")
+
         # Remove connection and broadcast user left
         manager.disconnect(str(user_id))
+        rate_limiter.close(str(user_id))
+
+        # Cancel heartbeat task
+        heartbeat_task.cancel()
+
+        # Everyone is leaving during a drain - skip the presence storm
+        if manager.draining:
+            return
+
         leave_message = json.dumps({
             "type": "user_left",
             "username": user.username,
             "user_id": user_id,
             "timestamp": datetime.utcnow().isoformat()
         })
-        await manager.broadcast(leave_message)
+        await manager.broadcast(leave_message, room_id)
 
         # Broadcast updated active users count and list to remaining users
-        active_users = manager.get_active_users()
-        active_user_info = manager.get_active_user_info(db)
+        active_users = manager.get_active_users(room_id)
+        active_user_info = manager.get_active_user_info(db, room_id)
         active_users_message = json.dumps({
             "type": "active_users",
             "users": active_users,
             "user_info": active_user_info,
             "count": len(active_users)
         })
-        await manager.broadcast(active_users_message)
-
-        # Cancel heartbeat task
-        heartbeat_task.cancel()
+        await manager.broadcast(active_users_message, room_id)
 
 
 async def heartbeat_loop(websocket: WebSocket, user_id: int):
@@ -365,4 +1142,4 @@ async def heartbeat_loop(websocket: WebSocket, user_id: int):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_max_size=WS_MAX_FRAME_BYTES)
@@ -0,0 +1,256 @@
+"""
+Message persistence behind a small storage interface
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, NamedTuple
+import os
+from dotenv import load_dotenv
+
+from sqlalchemy import delete, func, insert, select
+
+from .database import SessionLocal
+from .models import Message, User
+
+# Load environment variables
+load_dotenv()
+
+# Storage backend: "sql" (messages table) or "log" (append-only segment files)
+MESSAGE_STORE = os.getenv("MESSAGE_STORE", "sql")
+
+
+class StoredMessage(NamedTuple):
+    """A persisted chat message; content is the raw ciphertext bytes"""
+    id: int
+    seq: int
+    room_id: str
+    user_id: int
+    username: str
+    content: bytes
+    timestamp: datetime
+
+
+class NewMessage(NamedTuple):
+    """A message to persist with an already assigned sequence number"""
+    room_id: str
+    seq: int
+    user_id: int
+    username: str
+    content: bytes
+
+
+class MessageStore(ABC):
+    """
+    Storage for chat messages, addressed by room and per-room sequence number
+
+    Chat traffic is write-once and read-recent, so the interface is limited
+    to appending, reading forward or backward from a sequence number and
+    dropping the oldest messages once they have been archived.
+    """
+
+    # Whether compact() does anything, so the maintenance job is worth running
+    compacts = False
+
+    @abstractmethod
+    def append(self, room_id: str, seq: int, user_id: int, username: str, content: bytes) -> StoredMessage:
+        """Persist a message with an already assigned sequence number"""
+
+    def append_many(self, messages: List[NewMessage]) -> List[StoredMessage]:
+        """Persist several messages at once, returning them in the same order"""
+        return [self.append(*msg) for msg in messages]
+
+    @abstractmethod
+    def read_range(self, room_id: str, after_seq: int, limit: int) -> List[StoredMessage]:
+        """Get up to limit messages with seq greater than after_seq, oldest first"""
+
+    @abstractmethod
+    def read_before(self, room_id: str, before_seq: int, limit: int) -> List[StoredMessage]:
+        """Get the latest limit messages with seq lower than before_seq, oldest first"""
+
+    def tail(self, room_id: str, limit: int) -> List[StoredMessage]:
+        """Get the latest limit messages of a room, oldest first"""
+        return self.read_before(room_id, self.last_seq(room_id) + 1, limit)
+
+    @abstractmethod
+    def first_seq(self, room_id: str) -> int:
+        """Get the lowest sequence number stored for a room (0 if empty)"""
+
+    @abstractmethod
+    def last_seq(self, room_id: str) -> int:
+        """Get the highest sequence number stored for a room (0 if empty)"""
+
+    @abstractmethod
+    def delete_through(self, room_id: str, seq: int) -> int:
+        """
+        Remove messages with seq up to and including seq
+
+        Backends may remove less (e.g. only whole segments); readers must
+        treat first_seq() as the start of the stored range.
+
+        Returns:
+            Number of messages removed
+        """
+
+    @abstractmethod
+    def rooms(self) -> List[str]:
+        """Get the ids of all rooms with stored messages"""
+
+    def compact(self, room_id: str) -> int:
+        """
+        Reclaim storage of a room (e.g. merge small files); run by the retention job
+
+        Returns:
+            Number of files removed
+        """
+        return 0
+
+    def forget(self, room_id: str):
+        """Drop any state cached for a room, e.g. after another worker took ownership of it"""
+
+    def close(self):
+        """Release any resources held by the store"""
+
+
+class SQLMessageStore(MessageStore):
+    """Stores messages as rows of the messages table"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def _select(self):
+        return select(
+            Message.id, Message.seq, Message.room_id, Message.user_id,
+            User.username, Message.content, Message.timestamp
+        ).join(User, Message.user_id == User.id)
+
+    def _rows(self, statement) -> List[StoredMessage]:
+        db = self.session_factory()
+        try:
+            return [StoredMessage(*row) for row in db.execute(statement).all()]
+        finally:
+            db.close()
+
+    def append(self, room_id: str, seq: int, user_id: int, username: str, content: bytes) -> StoredMessage:
+        # Setting the timestamp here saves a refresh round trip after commit
+        new_message = Message(
+            user_id=user_id,
+            content=content,
+            room_id=room_id,
+            seq=seq,
+            timestamp=datetime.utcnow()
+        )
+
+        db = self.session_factory()
+        try:
+            db.add(new_message)
+            db.commit()
+            return StoredMessage(
+                new_message.id, seq, room_id, user_id, username, content, new_message.timestamp
+            )
+        finally:
+            db.close()
+
+    def append_many(self, messages: List[NewMessage]) -> List[StoredMessage]:
+        if not messages:
+            return []
+
+        timestamp = datetime.utcnow()
+        rows = [
+            {
+                "user_id": msg.user_id,
+                "content": msg.content,
+                "room_id": msg.room_id,
+                "seq": msg.seq,
+                "timestamp": timestamp
+            }
+            for msg in messages
+        ]
+
+        # A single executemany INSERT in one transaction
+        db = self.session_factory()
+        try:
+            ids = db.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                rows
+            ).scalars().all()
+            db.commit()
+        finally:
+            db.close()
+
+        return [
+            StoredMessage(message_id, msg.seq, msg.room_id, msg.user_id, msg.username, msg.content, timestamp)
+            for message_id, msg in zip(ids, messages)
+        ]
+
+    def read_range(self, room_id: str, after_seq: int, limit: int) -> List[StoredMessage]:
+        return self._rows(
+            self._select().where(
+                Message.room_id == room_id,
+                Message.seq > after_seq
+            ).order_by(Message.seq).limit(limit)
+        )
+
+    def read_before(self, room_id: str, before_seq: int, limit: int) -> List[StoredMessage]:
+        messages = self._rows(
+            self._select().where(
+                Message.room_id == room_id,
+                Message.seq < before_seq
+            ).order_by(Message.seq.desc()).limit(limit)
+        )
+        messages.reverse()
+        return messages
+
+    def tail(self, room_id: str, limit: int) -> List[StoredMessage]:
+        messages = self._rows(
+            self._select().where(
+                Message.room_id == room_id
+            ).order_by(Message.seq.desc()).limit(limit)
+        )
+        messages.reverse()
+        return messages
+
+    def _scalar(self, statement) -> int:
+        db = self.session_factory()
+        try:
+            return db.execute(statement).scalar() or 0
+        finally:
+            db.close()
+
+    def first_seq(self, room_id: str) -> int:
+        return self._scalar(select(func.min(Message.seq)).where(Message.room_id == room_id))
+
+    def last_seq(self, room_id: str) -> int:
+        return self._scalar(select(func.max(Message.seq)).where(Message.room_id == room_id))
+
+    def delete_through(self, room_id: str, seq: int) -> int:
+        # A range delete on the (room_id, seq) index, never a table scan
+        db = self.session_factory()
+        try:
+            removed = db.execute(
+                delete(Message).where(
+                    Message.room_id == room_id,
+                    Message.seq <= seq
+                )
+            ).rowcount
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def rooms(self) -> List[str]:
+        db = self.session_factory()
+        try:
+            return [row[0] for row in db.execute(select(Message.room_id).distinct()).all()]
+        finally:
+            db.close()
+
+
+def create_message_store(backend: str = MESSAGE_STORE) -> MessageStore:
+    """Create the configured message store"""
+    if backend == "sql":
+        return SQLMessageStore()
+    if backend == "log":
+        from .log_store import LogMessageStore
+        return LogMessageStore()
+    raise ValueError(f"Unknown MESSAGE_STORE backend: {backend}")
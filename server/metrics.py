@@ -0,0 +1,25 @@
+"""
+In-process counters for operational metrics
+"""
+
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """Simple monotonically increasing counters keyed by name"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def increment(self, name: str, value: int = 1):
+        """Increase a counter"""
+        self.counters[name] += value
+
+    def snapshot(self) -> Dict[str, int]:
+        """Get a copy of all counters"""
+        return dict(self.counters)
+
+
+# Global metrics instance
+metrics = Metrics()
@@ -2,7 +2,7 @@
 SQLAlchemy database models
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -28,9 +28,41 @@ class Message(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    content = Column(Text, nullable=False)  # Encrypted content
+    content = Column(LargeBinary, nullable=False)  # Raw Fernet token bytes
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     room_id = Column(String(50), default="general")  # For future multi-room support
+    seq = Column(Integer, nullable=True)  # Per-room sequence number for resume
 
     # Relationship to user
     user = relationship("User", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_messages_room_seq", "room_id", "seq"),
+    )
+
+
+class ArchiveSegment(Base):
+    """Index entry for a compressed file of archived messages"""
+    __tablename__ = "archive_segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(String(50), nullable=False)
+    bucket = Column(String(10), nullable=False)  # UTC day (YYYY-MM-DD) of the messages
+    min_seq = Column(Integer, nullable=False)
+    max_seq = Column(Integer, nullable=False)
+    min_timestamp = Column(DateTime(timezone=True), nullable=False)
+    max_timestamp = Column(DateTime(timezone=True), nullable=False)
+    message_count = Column(Integer, nullable=False)
+    path = Column(String(255), nullable=False)  # Relative to ARCHIVE_DIR
+
+    __table_args__ = (
+        Index("ix_archive_segments_room_seq", "room_id", "max_seq"),
+    )
+
+
+class ArchivedRoom(Base):
+    """Highest sequence number archived in a room, kept after its segments expire"""
+    __tablename__ = "archived_rooms"
+
+    room_id = Column(String(50), primary_key=True)
+    last_seq = Column(Integer, nullable=False)
@@ -0,0 +1,180 @@
+"""
+Token-bucket rate limiting for inbound WebSocket frames
+"""
+
+from typing import Dict, Tuple
+import os
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+
+def _limit(name: str, rate: float, burst: float) -> Tuple[float, float]:
+    """Read a (tokens per second, burst) pair from RATE_LIMIT_<NAME>_RATE/_BURST"""
+    limit = (
+        float(os.getenv(f"RATE_LIMIT_{name}_RATE", str(rate))),
+        float(os.getenv(f"RATE_LIMIT_{name}_BURST", str(burst)))
+    )
+    check_limit(f"RATE_LIMIT_{name}", limit)
+    return limit
+
+
+def check_limit(name: str, limit: Tuple[float, float]):
+    """Reject a limit whose bucket would never refill or never allow a frame"""
+    rate, burst = limit
+    if rate <= 0:
+        raise ValueError(f"{name} rate must be greater than 0, got {rate}")
+    if burst < 1:
+        raise ValueError(f"{name} burst must be at least 1, got {burst}")
+
+
+# Bucket for every frame type without one of its own (pong, unknown types)
+OTHER_FRAMES = "other"
+
+# Limits for a single connection, per frame type
+CONNECTION_LIMITS: Dict[str, Tuple[float, float]] = {
+    "message": _limit("MESSAGE", 5, 20),
+    "typing": _limit("TYPING", 2, 5),
+    "resume": _limit("RESUME", 1, 3),
+    OTHER_FRAMES: _limit("OTHER", 5, 20),
+}
+
+# Limits shared by all connections of the same user, per frame type
+USER_LIMITS: Dict[str, Tuple[float, float]] = {
+    "message": _limit("USER_MESSAGE", 10, 40),
+    "typing": _limit("USER_TYPING", 4, 10),
+    "resume": _limit("USER_RESUME", 2, 6),
+    OTHER_FRAMES: _limit("USER_OTHER", 10, 40),
+}
+
+# Rejected frames a connection may accumulate (refilling at one per second)
+# before it is disconnected for flooding
+RATE_LIMIT_MAX_VIOLATIONS = float(os.getenv("RATE_LIMIT_MAX_VIOLATIONS", "20"))
+
+
+class TokenBucket:
+    """
+    Classic token bucket
+
+    Refills lazily from the elapsed time on each check, so it needs no timer
+    and allocates nothing per call.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        """Add tokens for the time elapsed since the last refill"""
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (call after refill)"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def try_consume(self, now: float) -> bool:
+        """Take one token if available"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ConnectionLimiter:
+    """Rate limiter state for one WebSocket connection"""
+
+    __slots__ = ("buckets", "user_buckets", "violations")
+
+    def __init__(self, buckets: Dict[str, TokenBucket], user_buckets: Dict[str, TokenBucket]):
+        self.buckets = buckets
+        self.user_buckets = user_buckets
+        self.violations = TokenBucket(1, RATE_LIMIT_MAX_VIOLATIONS)
+
+    def check(self, frame_type: str) -> float:
+        """
+        Charge one frame of the given type against the connection and user limits
+
+        Returns:
+            0.0 if the frame is allowed, otherwise the seconds to wait
+            before the next frame of this type will be accepted
+        """
+        if not isinstance(frame_type, str) or frame_type not in self.buckets:
+            frame_type = OTHER_FRAMES
+        bucket = self.buckets[frame_type]
+        user_bucket = self.user_buckets[frame_type]
+
+        now = time.monotonic()
+        bucket.refill(now)
+        user_bucket.refill(now)
+
+        # Only charge when both buckets allow it, so a rejection by one
+        # does not drain the other
+        if bucket.tokens >= 1 and user_bucket.tokens >= 1:
+            bucket.tokens -= 1
+            user_bucket.tokens -= 1
+            return 0.0
+
+        return max(bucket.wait_time(), user_bucket.wait_time())
+
+    def record_violation(self) -> bool:
+        """
+        Record a rejected frame
+
+        Returns:
+            True if the connection has kept flooding and should be closed
+        """
+        return not self.violations.try_consume(time.monotonic())
+
+
+class RateLimiter:
+    """Creates per-connection limiters that share per-user buckets"""
+
+    def __init__(self, connection_limits: Dict[str, Tuple[float, float]] = None,
+                 user_limits: Dict[str, Tuple[float, float]] = None):
+        self.connection_limits = connection_limits or CONNECTION_LIMITS
+        self.user_limits = user_limits or USER_LIMITS
+        if set(self.connection_limits) != set(self.user_limits):
+            raise ValueError("Connection and user limits must cover the same frame types")
+        if OTHER_FRAMES not in self.connection_limits:
+            raise ValueError(f"Limits must include the {OTHER_FRAMES!r} frame type")
+        for limits in (self.connection_limits, self.user_limits):
+            for frame_type, limit in limits.items():
+                check_limit(frame_type, limit)
+        self.user_buckets: Dict[str, Dict[str, TokenBucket]] = {}
+        self.user_connections: Dict[str, int] = {}
+
+    def open(self, user_id: str) -> ConnectionLimiter:
+        """Create the limiter for a new connection of a user"""
+        if user_id not in self.user_buckets:
+            self.user_buckets[user_id] = {
+                frame_type: TokenBucket(rate, burst)
+                for frame_type, (rate, burst) in self.user_limits.items()
+            }
+        self.user_connections[user_id] = self.user_connections.get(user_id, 0) + 1
+
+        buckets = {
+            frame_type: TokenBucket(rate, burst)
+            for frame_type, (rate, burst) in self.connection_limits.items()
+        }
+        return ConnectionLimiter(buckets, self.user_buckets[user_id])
+
+    def close(self, user_id: str):
+        """Release user buckets once the user's last connection is gone"""
+        remaining = self.user_connections.get(user_id, 0) - 1
+        if remaining > 0:
+            self.user_connections[user_id] = remaining
+        else:
+            self.user_connections.pop(user_id, None)
+            self.user_buckets.pop(user_id, None)
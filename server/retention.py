@@ -0,0 +1,431 @@
+"""
+Tiered message retention: a small hot store plus compressed archive segments
+
+Messages older than a room's hot window (or beyond its hot size limit) are
+moved out of the message store into immutable, gzip-compressed NDJSON
+segments (content as Fernet token text), one or more per room and UTC day.
+The archive_segments table indexes them by sequence range, so history reads
+that page past the hot range continue into the archive, and expiry removes
+whole day buckets instead of scanning the messages table.
+
+Layout:
+    ARCHIVE_DIR/<room id hex>/<YYYY-MM-DD>/<min seq>-<max seq>.ndjson.gz
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import base64
+import gzip
+import json
+import os
+import shutil
+import threading
+from dotenv import load_dotenv
+
+from sqlalchemy import delete, func, select
+
+from .ciphertext import encode_ciphertext
+from .database import SessionLocal
+from .message_store import MessageStore, StoredMessage
+from .models import ArchivedRoom, ArchiveSegment
+
+# Load environment variables
+load_dotenv()
+
+# Defaults for every room; 0 disables the corresponding rule
+RETENTION_HOT_DAYS = int(os.getenv("RETENTION_HOT_DAYS", "0"))
+RETENTION_TTL_DAYS = int(os.getenv("RETENTION_TTL_DAYS", "0"))
+RETENTION_MAX_HOT_MESSAGES = int(os.getenv("RETENTION_MAX_HOT_MESSAGES", "0"))
+
+# Per-room overrides as JSON, e.g. {"support": {"hot_days": 7, "ttl_days": 365}}
+RETENTION_POLICIES = os.getenv("RETENTION_POLICIES", "")
+
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+# Largest number of messages written to one archive segment
+ARCHIVE_SEGMENT_MESSAGES = int(os.getenv("ARCHIVE_SEGMENT_MESSAGES", "10000"))
+# Decompressed segments kept in memory for history reads
+ARCHIVE_CACHE_SEGMENTS = int(os.getenv("ARCHIVE_CACHE_SEGMENTS", "16"))
+
+
+class RetentionPolicy(NamedTuple):
+    """How long a room's messages stay hot and how long they are kept at all"""
+    hot_days: int = RETENTION_HOT_DAYS
+    ttl_days: int = RETENTION_TTL_DAYS
+    max_hot_messages: int = RETENTION_MAX_HOT_MESSAGES
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.hot_days or self.ttl_days or self.max_hot_messages)
+
+
+def load_policies(raw: str = RETENTION_POLICIES) -> Dict[str, RetentionPolicy]:
+    """Parse per-room policy overrides; unset fields fall back to the defaults"""
+    if not raw:
+        return {}
+
+    policies = {}
+    for room_id, fields in json.loads(raw).items():
+        policies[room_id] = RetentionPolicy(**{
+            name: int(value) for name, value in fields.items()
+            if name in RetentionPolicy._fields
+        })
+    return policies
+
+
+def utc_naive(timestamp: datetime) -> datetime:
+    """Normalize a timestamp to naive UTC, as stored by SQLite and the log store"""
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+class MessageArchive:
+    """Immutable compressed segments of archived messages and their index"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, session_factory=SessionLocal,
+                 cache_segments: int = ARCHIVE_CACHE_SEGMENTS):
+        self.directory = Path(directory)
+        self.session_factory = session_factory
+        self.cache_segments = cache_segments
+        self.cache: "OrderedDict[str, Tuple[StoredMessage, ...]]" = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    def _room_dir(self, room_id: str) -> Path:
+        return self.directory / room_id.encode("utf-8").hex()
+
+    def write_segment(self, room_id: str, bucket: str, messages: List[StoredMessage]):
+        """Write messages from one day bucket to a new segment and index it"""
+        relative = Path(room_id.encode("utf-8").hex()) / bucket / (
+            f"{messages[0].seq:020d}-{messages[-1].seq:020d}.ndjson.gz"
+        )
+        path = self.directory / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first so a crash never leaves a partial segment
+        temporary = path.with_suffix(".tmp")
+        with gzip.open(temporary, "wt", encoding="utf-8") as archive_file:
+            for msg in messages:
+                archive_file.write(json.dumps({
+                    "id": msg.id,
+                    "seq": msg.seq,
+                    "user_id": msg.user_id,
+                    "username": msg.username,
+                    "content": encode_ciphertext(msg.content),
+                    "timestamp": msg.timestamp.isoformat()
+                }) + "\n")
+        os.replace(temporary, path)
+
+        db = self.session_factory()
+        try:
+            db.add(ArchiveSegment(
+                room_id=room_id,
+                bucket=bucket,
+                min_seq=messages[0].seq,
+                max_seq=messages[-1].seq,
+                min_timestamp=min(msg.timestamp for msg in messages),
+                max_timestamp=max(msg.timestamp for msg in messages),
+                message_count=len(messages),
+                path=relative.as_posix()
+            ))
+            mark = db.get(ArchivedRoom, room_id)
+            if mark is None:
+                db.add(ArchivedRoom(room_id=room_id, last_seq=messages[-1].seq))
+            else:
+                mark.last_seq = max(mark.last_seq, messages[-1].seq)
+            db.commit()
+        finally:
+            db.close()
+
+    def _load(self, room_id: str, relative: str) -> Tuple[StoredMessage, ...]:
+        """Read a segment, keeping recently used ones decompressed in memory"""
+        with self.cache_lock:
+            if relative in self.cache:
+                self.cache.move_to_end(relative)
+                return self.cache[relative]
+
+        messages = []
+        with gzip.open(self.directory / relative, "rt", encoding="utf-8") as archive_file:
+            for line in archive_file:
+                record = json.loads(line)
+                messages.append(StoredMessage(
+                    record["id"], record["seq"], room_id, record["user_id"],
+                    record["username"], base64.urlsafe_b64decode(record["content"]),
+                    datetime.fromisoformat(record["timestamp"])
+                ))
+        messages = tuple(messages)
+
+        with self.cache_lock:
+            self.cache[relative] = messages
+            while len(self.cache) > self.cache_segments:
+                self.cache.popitem(last=False)
+        return messages
+
+    def _segments(self, statement) -> List[tuple]:
+        db = self.session_factory()
+        try:
+            return db.execute(statement).all()
+        finally:
+            db.close()
+
+    def last_seq(self, room_id: str) -> int:
+        """
+        Get the highest sequence number ever archived in a room (0 if none)
+
+        Still counts segments that have since expired, so a room whose
+        messages all left both tiers never hands out their numbers again.
+        """
+        db = self.session_factory()
+        try:
+            mark = db.execute(
+                select(ArchivedRoom.last_seq).where(ArchivedRoom.room_id == room_id)
+            ).scalar()
+            # Segments archived before the high-water mark was kept
+            indexed = db.execute(
+                select(func.max(ArchiveSegment.max_seq)).where(ArchiveSegment.room_id == room_id)
+            ).scalar()
+            return max(mark or 0, indexed or 0)
+        finally:
+            db.close()
+
+    def read_before(self, room_id: str, before_seq: int, limit: int) -> List[StoredMessage]:
+        """Get the latest limit archived messages with seq lower than before_seq, oldest first"""
+        messages: List[StoredMessage] = []
+        segments = self._segments(
+            select(ArchiveSegment.path).where(
+                ArchiveSegment.room_id == room_id,
+                ArchiveSegment.min_seq < before_seq
+            ).order_by(ArchiveSegment.max_seq.desc())
+        )
+
+        for (relative,) in segments:
+            messages = [m for m in self._load(room_id, relative) if m.seq < before_seq] + messages
+            if len(messages) >= limit:
+                break
+
+        return messages[-limit:] if limit > 0 else []
+
+    def read_range(self, room_id: str, after_seq: int, limit: int) -> List[StoredMessage]:
+        """Get up to limit archived messages with seq greater than after_seq, oldest first"""
+        messages: List[StoredMessage] = []
+        segments = self._segments(
+            select(ArchiveSegment.path).where(
+                ArchiveSegment.room_id == room_id,
+                ArchiveSegment.max_seq > after_seq
+            ).order_by(ArchiveSegment.min_seq)
+        )
+
+        for (relative,) in segments:
+            messages.extend(m for m in self._load(room_id, relative) if m.seq > after_seq)
+            if len(messages) >= limit:
+                break
+
+        return messages[:limit]
+
+    def rooms(self) -> List[str]:
+        """Get the ids of all rooms with archived messages"""
+        return [row[0] for row in self._segments(select(ArchiveSegment.room_id).distinct())]
+
+    def expire(self, room_id: str, cutoff: datetime) -> int:
+        """
+        Drop every segment whose newest message is older than cutoff
+
+        Segments are grouped in day directories, so a day that has fully
+        expired is removed with a single directory delete.
+
+        Returns:
+            Number of segments removed
+        """
+        db = self.session_factory()
+        try:
+            expired = db.execute(
+                select(ArchiveSegment.id, ArchiveSegment.bucket, ArchiveSegment.path).where(
+                    ArchiveSegment.room_id == room_id,
+                    ArchiveSegment.max_timestamp < cutoff
+                )
+            ).all()
+            if not expired:
+                return 0
+
+            db.execute(delete(ArchiveSegment).where(
+                ArchiveSegment.id.in_([segment_id for segment_id, _, _ in expired])
+            ))
+            remaining_buckets = {row[0] for row in db.execute(
+                select(ArchiveSegment.bucket).where(
+                    ArchiveSegment.room_id == room_id,
+                    ArchiveSegment.bucket.in_({bucket for _, bucket, _ in expired})
+                ).distinct()
+            ).all()}
+            db.commit()
+        finally:
+            db.close()
+
+        # Index rows go first, so a crash here only leaves unreferenced files
+        room_dir = self._room_dir(room_id)
+        for _, bucket, relative in expired:
+            if bucket in remaining_buckets:
+                (self.directory / relative).unlink(missing_ok=True)
+            else:
+                shutil.rmtree(room_dir / bucket, ignore_errors=True)
+            with self.cache_lock:
+                self.cache.pop(relative, None)
+
+        return len(expired)
+
+
+class RetentionManager:
+    """Applies retention policies and reads history across the hot and archive tiers"""
+
+    def __init__(self, store: MessageStore, archive: MessageArchive,
+                 policies: Optional[Dict[str, RetentionPolicy]] = None,
+                 default_policy: RetentionPolicy = RetentionPolicy(),
+                 interval_seconds: int = RETENTION_INTERVAL_SECONDS,
+                 owns_room: Optional[Callable[[str], bool]] = None):
+        self.store = store
+        self.archive = archive
+        self.policies = load_policies() if policies is None else policies
+        self.default_policy = default_policy
+        self.interval_seconds = interval_seconds
+        # Rooms another worker owns are left to that worker (None: every room)
+        self.owns_room = owns_room
+        # Bumped whenever retained messages disappear, for history ETags
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.default_policy.enabled or any(p.enabled for p in self.policies.values())
+
+    def policy_for(self, room_id: str) -> RetentionPolicy:
+        return self.policies.get(room_id, self.default_policy)
+
+    def last_seq(self, room_id: str) -> int:
+        """
+        Get the highest sequence number used in a room across both tiers
+
+        Archiving can empty a room's hot store, so new sequence numbers must
+        be seeded from here rather than from the store alone.
+        """
+        return max(self.store.last_seq(room_id), self.archive.last_seq(room_id))
+
+    def read_before(self, room_id: str, before_seq: int, limit: int) -> List[StoredMessage]:
+        """Get the latest limit messages with seq lower than before_seq from either tier"""
+        messages = self.store.read_before(room_id, before_seq, limit)
+        if len(messages) < limit:
+            # The hot store has nothing older than its first returned message
+            boundary = messages[0].seq if messages else before_seq
+            messages = self.archive.read_before(room_id, boundary, limit - len(messages)) + messages
+        return messages
+
+    def read_range(self, room_id: str, after_seq: int, limit: int) -> List[StoredMessage]:
+        """Get up to limit messages with seq greater than after_seq from either tier"""
+        archived = self.archive.read_range(room_id, after_seq, limit)
+        if len(archived) < limit:
+            # The archive ends before the hot store begins, so continue there
+            boundary = archived[-1].seq if archived else after_seq
+            archived += self.store.read_range(room_id, boundary, limit - len(archived))
+        return archived
+
+    def archive_room(self, room_id: str, policy: RetentionPolicy, now: datetime) -> int:
+        """
+        Move a room's messages that fall outside its hot window to the archive
+
+        Returns:
+            Number of messages archived
+        """
+        last_seq = self.store.last_seq(room_id)
+        if not last_seq:
+            return 0
+
+        # Messages past their TTL are archived first and then expired with
+        # their bucket. Cutting at midnight archives whole days, so each day
+        # bucket usually ends up in a single segment.
+        windows = [days for days in (policy.hot_days, policy.ttl_days) if days]
+        cutoff_time = None
+        if windows:
+            cutoff_time = (now - timedelta(days=min(windows))).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+        cutoff_seq = last_seq - policy.max_hot_messages if policy.max_hot_messages else 0
+
+        def is_cold(msg: StoredMessage) -> bool:
+            return msg.seq <= cutoff_seq or (
+                cutoff_time is not None and utc_naive(msg.timestamp) < cutoff_time
+            )
+
+        # Stores that delete coarsely may still hold already archived messages
+        after_seq = max(self.archive.last_seq(room_id), self.store.first_seq(room_id) - 1)
+        archived = 0
+
+        while True:
+            batch = self.store.read_range(room_id, after_seq, ARCHIVE_SEGMENT_MESSAGES)
+            cold = []
+            for msg in batch:
+                if not is_cold(msg):
+                    break
+                cold.append(msg)
+            if not cold:
+                break
+
+            for bucket, messages in groupby(cold, key=lambda m: utc_naive(m.timestamp).strftime("%Y-%m-%d")):
+                self.archive.write_segment(room_id, bucket, list(messages))
+
+            # Only delete once the segments are durable and indexed
+            self.store.delete_through(room_id, cold[-1].seq)
+            after_seq = cold[-1].seq
+            archived += len(cold)
+
+            if len(cold) < len(batch) or len(batch) < ARCHIVE_SEGMENT_MESSAGES:
+                break
+
+        return archived
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Archive, expire and compact every room this worker owns once"""
+        now = now or datetime.utcnow()
+        archived = 0
+        expired = 0
+        compacted = 0
+
+        stored_rooms = set(self.store.rooms())
+        for room_id in sorted(stored_rooms | set(self.archive.rooms())):
+            if self.owns_room is not None and not self.owns_room(room_id):
+                continue
+
+            policy = self.policy_for(room_id)
+            if policy.enabled:
+                archived += self.archive_room(room_id, policy, now)
+                if policy.ttl_days:
+                    expired += self.archive.expire(room_id, now - timedelta(days=policy.ttl_days))
+
+            # Archiving drops whole segments, and restarts leave small ones behind
+            if room_id in stored_rooms:
+                compacted += self.store.compact(room_id)
+
+        if expired:
+            self.generation += 1
+
+        return {"archived_messages": archived, "expired_segments": expired, "compacted_segments": compacted}
+
+    @property
+    def needed(self) -> bool:
+        """Whether the background job has anything to do"""
+        return self.enabled or self.store.compacts
+
+    async def run_forever(self):
+        """Apply retention every interval without blocking the event loop"""
+        try:
+            while True:
+                try:
+                    result = await asyncio.to_thread(self.run_once)
+                    if any(result.values()):
+                        print(f"Retention: {result}")
+                except Exception as e:
+                    print(f"Retention error: {e}")
+                await asyncio.sleep(self.interval_seconds)
+        except asyncio.CancelledError:
+            pass
+
@@ -4,7 +4,7 @@ Pydantic schemas for request/response validation
 
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
 
 
 class UserRegister(BaseModel):
@@ -41,6 +41,7 @@ class MessageResponse(BaseModel):
     content: str
     timestamp: datetime
     room_id: str
+    seq: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -53,3 +54,8 @@ class WebSocketMessage(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
     timestamp: Optional[str] = None
+
+
+class ShardConfig(BaseModel):
+    """Schema for replacing the set of shard workers"""
+    workers: Dict[str, str]  # Worker id -> base URL
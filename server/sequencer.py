@@ -0,0 +1,97 @@
+"""
+Per-room sequence numbers and replay buffers for gap-free resume
+
+Sequence numbers come from an in-memory counter per room, seeded from the
+highest number in the message store or the archive, so exactly one process may serve a room. Multi-process
+deployments must shard rooms across workers (see sharding.py).
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import os
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Number of recent broadcasts kept in memory per room for replay
+RESUME_BUFFER_SIZE = int(os.getenv("RESUME_BUFFER_SIZE", "1000"))
+
+# Maximum number of messages replayed for a single resume request
+RESUME_MAX_MESSAGES = int(os.getenv("RESUME_MAX_MESSAGES", "500"))
+
+
+class RoomSequencer:
+    """Assigns monotonically increasing sequence numbers to messages per room"""
+
+    def __init__(self, store, buffer_size: int = RESUME_BUFFER_SIZE):
+        # Anything with last_seq(room_id); the retention manager in the server
+        self.store = store
+        self.buffer_size = buffer_size
+        self.last_seq: Dict[str, int] = {}
+        self.buffers: Dict[str, Deque[Tuple[int, str]]] = {}
+        # Numbers are reserved on the database writer thread and read on the event loop
+        self.lock = threading.Lock()
+
+    def _ensure_room(self, room_id: str):
+        """Load the last persisted sequence number for a room on first use (lock held)"""
+        if room_id in self.last_seq:
+            return
+
+        self.last_seq[room_id] = self.store.last_seq(room_id)
+        self.buffers[room_id] = deque(maxlen=self.buffer_size)
+
+    def next_seq(self, room_id: str) -> int:
+        """Reserve the next sequence number for a room"""
+        with self.lock:
+            self._ensure_room(room_id)
+            self.last_seq[room_id] += 1
+            return self.last_seq[room_id]
+
+    def current(self, room_id: str) -> int:
+        """Get the latest sequence number assigned in a room"""
+        with self.lock:
+            self._ensure_room(room_id)
+            return self.last_seq[room_id]
+
+    def resync(self, room_id: str):
+        """
+        Reload a room's last sequence number from the store
+
+        Called when a write fails, so the numbers reserved for it are given
+        out again instead of leaving a gap that looks like lost messages.
+        """
+        with self.lock:
+            if room_id in self.last_seq:
+                self.last_seq[room_id] = self.store.last_seq(room_id)
+
+    def forget(self, room_id: str):
+        """Drop a room's state, e.g. after another worker took ownership of it"""
+        with self.lock:
+            self.last_seq.pop(room_id, None)
+            self.buffers.pop(room_id, None)
+
+    def record(self, room_id: str, seq: int, payload: str):
+        """Remember a broadcast payload so it can be replayed later"""
+        buffer = self.buffers.get(room_id)
+        if buffer is not None:
+            buffer.append((seq, payload))
+
+    def replay(self, room_id: str, last_seq: int) -> Optional[List[str]]:
+        """
+        Get buffered payloads newer than last_seq
+
+        Returns:
+            List of payloads in sequence order, or None if the buffer no
+            longer covers the requested range and the caller must fall
+            back to the database
+        """
+        if last_seq >= self.last_seq.get(room_id, 0):
+            return []
+
+        buffer = self.buffers.get(room_id)
+        if not buffer or buffer[0][0] > last_seq + 1:
+            return None
+
+        return [payload for seq, payload in buffer if seq > last_seq]
@@ -0,0 +1,115 @@
+"""
+Room-to-worker sharding with consistent hashing
+
+In sharding mode every room is owned by exactly one worker process, so
+broadcast, sequencing and replay state for a room live in one place. The
+owner is picked with a consistent hash ring (with virtual nodes), so
+adding or removing a worker only moves the rooms between that worker and
+its ring neighbours. Requests that reach the wrong worker are redirected
+to the owner.
+
+Configuration:
+    SHARD_WORKERS - comma separated id=base URL pairs, e.g.
+        "w1=http://127.0.0.1:8001,w2=http://127.0.0.1:8002"
+    SHARD_SELF - id of this worker in SHARD_WORKERS
+Sharding is off when SHARD_WORKERS is empty.
+"""
+
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+SHARD_WORKERS = os.getenv("SHARD_WORKERS", "")
+SHARD_SELF = os.getenv("SHARD_SELF", "")
+# Points per worker on the ring; more points give a more even spread
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "128"))
+# Window over which clients of a room that moved are sent to its new owner
+SHARD_MOVE_WINDOW_MS = int(os.getenv("SHARD_MOVE_WINDOW_MS", "5000"))
+
+
+def parse_workers(raw: str) -> Dict[str, str]:
+    """Parse "id=url,id=url" into a dict of worker id to base URL"""
+    workers = {}
+    for entry in raw.split(","):
+        if not entry.strip():
+            continue
+        worker_id, separator, url = entry.partition("=")
+        if not separator or not worker_id.strip() or not url.strip():
+            raise ValueError(f"Invalid SHARD_WORKERS entry: {entry!r}")
+        workers[worker_id.strip()] = url.strip().rstrip("/")
+    return workers
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes"""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = SHARD_VNODES):
+        points: List[Tuple[int, str]] = sorted(
+            (hash_key(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(vnodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Get the node owning key: the first ring point clockwise from its hash"""
+        if not self.hashes:
+            return None
+        position = bisect_right(self.hashes, hash_key(key)) % len(self.hashes)
+        return self.nodes[position]
+
+
+class ShardRouter:
+    """Decides which worker owns a room and where to send clients that are on the wrong one"""
+
+    def __init__(self, workers: Optional[Dict[str, str]] = None, self_id: str = SHARD_SELF,
+                 vnodes: int = SHARD_VNODES):
+        self.self_id = self_id
+        self.vnodes = vnodes
+        workers = parse_workers(SHARD_WORKERS) if workers is None else workers
+        if workers and self_id not in workers:
+            raise ValueError(f"SHARD_SELF {self_id!r} is not one of the shard workers")
+        self.update(workers)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.workers)
+
+    def update(self, workers: Dict[str, str]):
+        """
+        Replace the set of workers, e.g. after one was added or removed
+
+        A worker that is left out no longer owns any room.
+        """
+        self.workers = dict(workers)
+        self.ring = HashRing(self.workers, self.vnodes)
+
+    def owner(self, room_id: str) -> Optional[str]:
+        return self.ring.owner(room_id)
+
+    def is_local(self, room_id: str) -> bool:
+        """Check whether this worker serves a room (always true without sharding)"""
+        return not self.enabled or self.owner(room_id) == self.self_id
+
+    def http_url(self, room_id: str) -> str:
+        """Base HTTP URL of the worker owning a room"""
+        return self.workers[self.owner(room_id)]
+
+    def ws_url(self, room_id: str) -> str:
+        """Base WebSocket URL of the worker owning a room"""
+        url = self.http_url(room_id)
+        if url.startswith("https://"):
+            return "wss://" + url[len("https://"):]
+        if url.startswith("http://"):
+            return "ws://" + url[len("http://"):]
+        return url
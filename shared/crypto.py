@@ -2,10 +2,31 @@
 Encryption utilities for end-to-end encrypted messaging
 """
 
+from concurrent.futures import Executor, ThreadPoolExecutor
 from cryptography.fernet import Fernet
+import asyncio
 import os
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Sequence
+
+# Messages per chunk when decrypting a batch on the worker pool
+DECRYPT_CHUNK_SIZE = 50
+
+_decrypt_pool: Optional[ThreadPoolExecutor] = None
+_decrypt_pool_lock = threading.Lock()
+
+
+def decrypt_pool() -> ThreadPoolExecutor:
+    """Get the shared worker pool for batch decryption, creating it on first use"""
+    global _decrypt_pool
+    with _decrypt_pool_lock:
+        if _decrypt_pool is None:
+            _decrypt_pool = ThreadPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                thread_name_prefix="decrypt"
+            )
+        return _decrypt_pool
 
 
 class MessageEncryption:
@@ -32,6 +53,45 @@ class MessageEncryption:
         decrypted = self.cipher.decrypt(encrypted_message.encode())
         return decrypted.decode()
 
+    def decrypt_batch(self, encrypted_messages: Sequence[str]) -> List[Optional[str]]:
+        """
+        Decrypt several messages with this instance's cipher
+
+        Returns:
+            The plaintexts in the same order, with None for any message
+            that could not be decrypted
+        """
+        decrypt = self.cipher.decrypt
+        results: List[Optional[str]] = []
+        for encrypted_message in encrypted_messages:
+            try:
+                results.append(decrypt(encrypted_message.encode()).decode())
+            except Exception:
+                results.append(None)
+        return results
+
+    async def decrypt_stream(self, encrypted_messages: Sequence[str], chunk_size: int = DECRYPT_CHUNK_SIZE,
+                             executor: Optional[Executor] = None) -> AsyncIterator[List[Optional[str]]]:
+        """
+        Decrypt messages in chunks on a worker pool, yielding each chunk in order
+
+        All chunks are queued at once, so later chunks decrypt while the
+        caller renders earlier ones; the event loop is never blocked by
+        decryption. Results follow decrypt_batch (None for failures).
+        """
+        loop = asyncio.get_event_loop()
+        pool = executor or decrypt_pool()
+        futures = [
+            loop.run_in_executor(pool, self.decrypt_batch, encrypted_messages[start:start + chunk_size])
+            for start in range(0, len(encrypted_messages), chunk_size)
+        ]
+        try:
+            for future in futures:
+                yield await future
+        finally:
+            for future in futures:
+                future.cancel()
+
     def get_key(self) -> bytes:
         """Get the encryption key"""
         return self.key
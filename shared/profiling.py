@@ -0,0 +1,140 @@
+"""
+Profiling helpers shared by the server and the client
+
+Two capture formats are supported, both readable by standard tools:
+    - cProfile statistics (the pstats/.prof format; open with pstats,
+      snakeviz or tuna)
+    - folded stacks from a sampling profiler, one "frame;frame;frame count"
+      line per distinct stack (open with flamegraph.pl or speedscope)
+
+Phase timers measure named steps such as login, history load, decrypt and
+render. They are off unless TERMINAL_CHAT_PHASE_TIMERS is set, and cost one
+attribute check per phase when off.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+
+PHASE_TIMERS_ENV = "TERMINAL_CHAT_PHASE_TIMERS"
+
+
+class PhaseTimers:
+    """Accumulates wall-clock durations of named phases"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.durations: Dict[str, List[float]] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the body of a with block as one occurrence of a phase"""
+        if not self.enabled:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        with self.lock:
+            self.durations.setdefault(name, []).append(seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Get count, total, mean and max per phase, in milliseconds"""
+        with self.lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+
+        return {
+            name: {
+                "count": len(values),
+                "total_ms": round(sum(values) * 1000, 3),
+                "avg_ms": round(sum(values) / len(values) * 1000, 3),
+                "max_ms": round(max(values) * 1000, 3),
+            }
+            for name, values in durations.items()
+        }
+
+    def report(self) -> str:
+        """Format the snapshot as a text table"""
+        lines = [f"{'Phase':<28} {'Count':>7} {'Total ms':>11} {'Avg ms':>9} {'Max ms':>9}"]
+        for name, stats in sorted(self.snapshot().items()):
+            lines.append(
+                f"{name:<28} {stats['count']:>7} {stats['total_ms']:>11.1f} "
+                f"{stats['avg_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+            )
+        return "\n".join(lines)
+
+
+# Global phase timers, enabled through the environment
+phase_timers = PhaseTimers(
+    enabled=os.getenv(PHASE_TIMERS_ENV, "").lower() in ("1", "true", "yes")
+)
+
+
+def phase(name: str):
+    """Time a phase with the global phase timers"""
+    return phase_timers.phase(name)
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's call stack at a fixed interval
+
+    Sampling runs in a separate thread and only reads frames, so the
+    profiled code runs at full speed apart from the GIL hand-offs.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Get the samples in folded-stack format, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def cprofile_bytes(profiler: cProfile.Profile) -> bytes:
+    """Serialize a cProfile capture exactly as Profile.dump_stats() writes it"""
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
@@ -0,0 +1,214 @@
+"""
+Per-message latency tracing from client send to remote render
+
+A traced chat message carries a trace id in its frames. Each process that
+handles it records a span - trace id, stage and wall-clock timestamp - at
+fixed points along the way:
+
+    client_encrypt     sender starts encrypting (Enter was pressed)
+    client_send        frame handed to the WebSocket
+    server_receive     server parsed the frame
+    db_commit          message stored
+    broadcast_enqueue  broadcast to connected clients starts
+    socket_write       frame written to one recipient's socket
+    remote_decrypt     recipient decrypted the message
+    remote_render      recipient added it to the message view
+
+Spans are appended as JSON lines to the file named by
+TERMINAL_CHAT_TRACE_FILE (tracing is off when it is unset). Run the
+analyzer over the files of all processes to get a per-stage breakdown:
+
+    python -m shared.tracing server-trace.jsonl client-*.jsonl
+
+Timestamps come from each machine's clock, so stages that cross machines
+are only as accurate as their clock synchronisation.
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+import json
+import os
+import threading
+import time
+import uuid
+
+TRACE_FILE_ENV = "TERMINAL_CHAT_TRACE_FILE"
+
+STAGES = [
+    "client_encrypt",
+    "client_send",
+    "server_receive",
+    "db_commit",
+    "broadcast_enqueue",
+    "socket_write",
+    "remote_decrypt",
+    "remote_render",
+]
+
+# Stages recorded once per recipient rather than once per message
+RECIPIENT_STAGES = ("socket_write", "remote_decrypt", "remote_render")
+
+# Longest trace id accepted from a client frame
+MAX_TRACE_ID_LENGTH = 64
+
+
+class Tracer:
+    """Records trace spans to a JSON lines file"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def open(self, path: str):
+        """Start writing spans to path"""
+        self.close()
+        self.path = path
+
+    def new_trace_id(self) -> Optional[str]:
+        """Get an id for a new trace, or None when tracing is off"""
+        if not self.enabled:
+            return None
+        return uuid.uuid4().hex[:16]
+
+    def mark(self, trace_id: Optional[str], stage: str, peer: Optional[str] = None):
+        """
+        Record that a traced message reached a stage
+
+        Args:
+            trace_id: Trace id from the frame; untraced messages pass None
+            stage: One of STAGES
+            peer: Recipient the span belongs to, for per-recipient stages
+        """
+        if not trace_id or not self.enabled:
+            return
+
+        span = {"trace_id": trace_id, "stage": stage, "ts": time.time()}
+        if peer is not None:
+            span["peer"] = str(peer)
+        line = json.dumps(span) + "\n"
+
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a", buffering=1)
+            self.file.write(line)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def valid_trace_id(value) -> Optional[str]:
+    """Get a trace id from an untrusted frame field, or None if it is not usable"""
+    if isinstance(value, str) and 0 < len(value) <= MAX_TRACE_ID_LENGTH:
+        return value
+    return None
+
+
+# Global tracer, enabled through the environment
+tracer = Tracer(os.getenv(TRACE_FILE_ENV) or None)
+
+
+def load_spans(paths: Iterable[str]) -> Dict[str, List[Dict]]:
+    """Read span files and group the spans by trace id"""
+    traces: Dict[str, List[Dict]] = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def trace_paths(spans: List[Dict]) -> List[List[Dict]]:
+    """
+    Split a trace into one path per recipient
+
+    Each path is the shared stages (sender and server) followed by the
+    stages recorded for one recipient, ordered by STAGES.
+    """
+    shared = {}
+    per_peer: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+    for span in spans:
+        if span["stage"] in RECIPIENT_STAGES:
+            per_peer[span.get("peer", "")][span["stage"]] = span
+        else:
+            shared[span["stage"]] = span
+
+    order = {stage: index for index, stage in enumerate(STAGES)}
+    if not per_peer:
+        return [sorted(shared.values(), key=lambda s: order.get(s["stage"], len(STAGES)))]
+    return [
+        sorted(list(shared.values()) + list(stages.values()), key=lambda s: order.get(s["stage"], len(STAGES)))
+        for stages in per_peer.values()
+    ]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def breakdown(traces: Dict[str, List[Dict]]) -> Dict[str, List[float]]:
+    """
+    Get the time spent reaching each stage from the stage before it, in ms
+
+    The result maps "previous -> stage" to one duration per path, plus
+    "total" from the first to the last stage of each complete path.
+    """
+    durations: Dict[str, List[float]] = defaultdict(list)
+    for spans in traces.values():
+        for path in trace_paths(spans):
+            for previous, span in zip(path, path[1:]):
+                durations[f"{previous['stage']} -> {span['stage']}"].append((span["ts"] - previous["ts"]) * 1000)
+            if len(path) > 1 and path[0]["stage"] == STAGES[0] and path[-1]["stage"] == STAGES[-1]:
+                durations["total"].append((path[-1]["ts"] - path[0]["ts"]) * 1000)
+    return durations
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print a per-stage latency breakdown of message traces")
+    parser.add_argument("files", nargs="+", help="Span files written by the clients and the server")
+    args = parser.parse_args()
+
+    traces = load_spans(args.files)
+    durations = breakdown(traces)
+
+    print("=" * 72)
+    print(f"MESSAGE LATENCY BREAKDOWN ({len(traces)} traces)")
+    print("=" * 72)
+    print(f"{'Stage':<38} {'Count':>6} {'p50 ms':>8} {'p95 ms':>8} {'Max ms':>8}")
+
+    order = {stage: index for index, stage in enumerate(STAGES)}
+
+    def stage_order(key: str):
+        if key == "total":
+            return (len(STAGES), len(STAGES))
+        previous, stage = key.split(" -> ")
+        return (order.get(stage, len(STAGES)), order.get(previous, len(STAGES)))
+
+    for key in sorted(durations, key=stage_order):
+        values = durations[key]
+        if key == "total":
+            print("-" * 72)
+        print(f"{key:<38} {len(values):>6} {percentile(values, 0.5):>8.2f} "
+              f"{percentile(values, 0.95):>8.2f} {max(values):>8.2f}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
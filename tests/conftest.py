@@ -0,0 +1,73 @@
+"""
+Shared fixtures for the server and client tests
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The server reads its configuration on import; keep its files out of the tree
+TEST_DIR = tempfile.mkdtemp(prefix="terminal-chat-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DIR}/server.db"
+os.environ["ARCHIVE_DIR"] = f"{TEST_DIR}/archive"
+os.environ["MESSAGE_LOG_DIR"] = f"{TEST_DIR}/message_log"
+
+from server.database import Base
+from server.models import User
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Engine on a fresh SQLite database with every table created"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def user_id(session_factory):
+    """Id of a user that test messages are sent as"""
+    db = session_factory()
+    try:
+        user = User(username="alice", password_hash="x")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+
+@pytest.fixture
+def client():
+    """HTTP client for the server app, with startup and shutdown run"""
+    from fastapi.testclient import TestClient
+    from server.main import app
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        yield client
+
+
+@pytest.fixture
+def token(client):
+    """Access token of a newly registered user"""
+    response = client.post("/api/register", json={
+        "username": f"user{uuid.uuid4().hex[:8]}",
+        "password": "secret123"
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["access_token"]
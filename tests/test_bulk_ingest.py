@@ -0,0 +1,83 @@
+"""
+Tests for POST /api/messages/bulk
+"""
+
+import json
+
+import pytest
+
+import server.main
+from shared.crypto import MessageEncryption
+
+
+@pytest.fixture
+def encryption():
+    return MessageEncryption()
+
+
+def post_bulk(client, token, body, **kwargs):
+    return client.post(
+        "/api/messages/bulk?room_id=bulk-tests",
+        headers={"Authorization": f"Bearer {token}", **kwargs.pop("headers", {})},
+        content=body,
+        **kwargs
+    )
+
+
+def test_valid_items_are_stored_and_invalid_ones_reported(client, token, encryption):
+    items = [{"content": encryption.encrypt("one")}, {"content": "not a token"}, {"content": encryption.encrypt("two")}]
+
+    response = post_bulk(client, token, json.dumps(items))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["accepted"], body["rejected"]) == (2, 1)
+    assert [result["status"] for result in body["results"]] == ["ok", "error", "ok"]
+    first, _, second = body["results"]
+    assert second["seq"] == first["seq"] + 1
+
+
+def test_ndjson_lines_are_items(client, token, encryption):
+    body = "\n".join(json.dumps({"content": encryption.encrypt(f"line {i}")}) for i in range(3)) + "\n{broken"
+
+    response = post_bulk(client, token, body, headers={"Content-Type": "application/x-ndjson"})
+
+    assert response.json()["accepted"] == 3
+    assert response.json()["rejected"] == 1
+
+
+def test_declared_oversized_body_is_refused(client, token, monkeypatch):
+    monkeypatch.setattr(server.main, "BULK_MAX_BODY_BYTES", 100)
+
+    response = post_bulk(client, token, "[" + " " * 200 + "]")
+
+    assert response.status_code == 413
+
+
+def test_chunked_json_body_is_limited_while_reading(client, token, monkeypatch):
+    monkeypatch.setattr(server.main, "BULK_MAX_BODY_BYTES", 100)
+
+    def chunks():
+        yield b"["
+        for _ in range(50):
+            yield b" " * 10
+        yield b"]"
+
+    response = post_bulk(client, token, chunks())
+
+    assert response.status_code == 413
+
+
+def test_failed_write_does_not_use_up_sequence_numbers(client, token, encryption, monkeypatch):
+    item = json.dumps([{"content": encryption.encrypt("before")}])
+    before = post_bulk(client, token, item).json()["results"][0]["seq"]
+
+    def fail(messages):
+        raise RuntimeError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(server.main.message_store, "append_many", fail)
+        assert post_bulk(client, token, item).status_code == 500
+
+    after = post_bulk(client, token, item).json()["results"][0]["seq"]
+    assert after == before + 1
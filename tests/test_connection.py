@@ -0,0 +1,92 @@
+"""
+Tests for the client's resume and frame queueing logic
+"""
+
+import asyncio
+import json
+
+from client.connection import CHAT_QUEUE_LIMIT, ChatConnection
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(json.loads(data))
+
+
+def make_connection():
+    connection = ChatConnection("ws://test", 1, "token")
+    connection.websocket = FakeWebSocket()
+    connection.delivered = []
+    connection.message_callback = connection.delivered.append
+    return connection
+
+
+def chat(seq, replay=False, room_id="general"):
+    frame = {"type": "message", "seq": seq, "room_id": room_id}
+    if replay:
+        frame["replay"] = True
+    return frame
+
+
+def test_first_connect_resumes_only_rooms_with_known_seqs():
+    connection = make_connection()
+    connection.note_seq("general", 7)
+
+    asyncio.run(connection.send_resume())
+
+    assert connection.websocket.sent == [{"type": "resume", "room_id": "general", "last_seq": 7}]
+
+
+def test_reconnect_resumes_joined_rooms_without_messages_from_the_start():
+    connection = make_connection()
+    connection.has_connected = True
+    connection.note_seq("other", 3)
+
+    asyncio.run(connection.send_resume())
+
+    assert sorted(connection.websocket.sent, key=lambda frame: frame["room_id"]) == [
+        {"type": "resume", "room_id": "general", "last_seq": 0},
+        {"type": "resume", "room_id": "other", "last_seq": 3},
+    ]
+    assert connection.resuming_rooms == {"general", "other"}
+
+
+def test_live_messages_wait_for_the_replay_and_duplicates_are_dropped():
+    connection = make_connection()
+    connection.note_seq("general", 1)
+    asyncio.run(connection.send_resume())
+
+    async def receive():
+        for frame in [chat(4), chat(2, replay=True), chat(3, replay=True), chat(3),
+                      {"type": "resume_complete", "room_id": "general"}, chat(4), chat(5)]:
+            await connection.handle_message(frame)
+
+    asyncio.run(receive())
+
+    seqs = [frame["seq"] for frame in connection.delivered if frame["type"] == "message"]
+    assert seqs == [2, 3, 4, 5]
+
+
+def test_chat_queue_overflow_asks_for_a_resync():
+    connection = make_connection()
+    for seq in range(CHAT_QUEUE_LIMIT + 5):
+        connection.queue_frame(chat(seq + 1))
+
+    assert len(connection.chat_frames) == CHAT_QUEUE_LIMIT
+    assert connection.resync_needed
+
+
+def test_status_frames_keep_only_the_latest_state_per_user():
+    connection = make_connection()
+    connection.queue_frame({"type": "typing", "user_id": "2", "is_typing": True})
+    connection.queue_frame({"type": "typing", "user_id": "2", "is_typing": False})
+    connection.queue_frame({"type": "user_joined", "user_id": 3})
+    connection.queue_frame({"type": "user_left", "user_id": 3})
+
+    assert list(connection.status_frames.values()) == [
+        {"type": "typing", "user_id": "2", "is_typing": False},
+        {"type": "user_left", "user_id": 3},
+    ]
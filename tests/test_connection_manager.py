@@ -0,0 +1,57 @@
+"""
+Tests for routing WebSocket traffic to the clients of a room
+"""
+
+import asyncio
+import json
+
+from server.connection_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.sent.append(json.loads(data))
+
+
+def connect(manager, rooms):
+    sockets = {}
+    for user_id, room_id in rooms.items():
+        sockets[user_id] = FakeWebSocket()
+        asyncio.run(manager.connect(user_id, sockets[user_id], room_id))
+    return sockets
+
+
+def test_broadcast_reaches_only_the_room():
+    manager = ConnectionManager()
+    sockets = connect(manager, {"1": "a", "2": "a", "3": "b"})
+
+    asyncio.run(manager.broadcast('{"type": "message", "room_id": "a"}', "a", exclude_user="2"))
+
+    assert [len(sockets[user_id].sent) for user_id in "123"] == [1, 0, 0]
+
+
+def test_broadcast_without_a_room_reaches_everyone():
+    manager = ConnectionManager()
+    sockets = connect(manager, {"1": "a", "2": "b"})
+
+    asyncio.run(manager.broadcast('{"type": "notice"}'))
+
+    assert [len(sockets[user_id].sent) for user_id in "12"] == [1, 1]
+
+
+def test_typing_and_presence_are_per_room():
+    manager = ConnectionManager()
+    sockets = connect(manager, {"1": "a", "2": "a", "3": "b"})
+
+    asyncio.run(manager.broadcast_typing_indicator("1", "alice", True, "a"))
+
+    assert sockets["2"].sent == [{"type": "typing", "user_id": "1", "username": "alice", "is_typing": True}]
+    assert sockets["1"].sent == sockets["3"].sent == []
+    assert manager.get_active_users("a") == ["1", "2"]
+    assert manager.get_active_users() == ["1", "2", "3"]
@@ -0,0 +1,78 @@
+"""
+Tests for the writer thread and the startup migrations of older databases
+"""
+
+import asyncio
+import threading
+import time
+
+from sqlalchemy import text
+
+import server.database
+from server.ciphertext import decode_ciphertext
+from server.database import CONTENT_BYTES_VERSION, backfill_message_seq, migrate_message_content, run_write
+from shared.crypto import MessageEncryption
+
+
+def insert_messages(engine, user_id, values):
+    """Insert (room_id, content) rows the way older versions stored them, without seq"""
+    with engine.begin() as conn:
+        for room_id, content in values:
+            conn.execute(text(
+                "INSERT INTO messages (user_id, content, room_id, timestamp) "
+                "VALUES (:user_id, :content, :room_id, CURRENT_TIMESTAMP)"
+            ), {"user_id": user_id, "content": content, "room_id": room_id})
+
+
+def test_base64_content_is_converted_to_raw_bytes(engine, user_id, monkeypatch):
+    monkeypatch.setattr(server.database, "engine", engine)
+    tokens = [MessageEncryption().encrypt(f"message {i}") for i in range(7)]
+    # Rows already stored as bytes are interleaved with legacy text ones
+    insert_messages(engine, user_id, [
+        ("general", decode_ciphertext(token) if i % 3 == 0 else token)
+        for i, token in enumerate(tokens)
+    ])
+
+    migrate_message_content(batch_size=2)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT typeof(content), content FROM messages ORDER BY id")).all()
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+    assert [storage_class for storage_class, _ in rows] == ["blob"] * len(tokens)
+    assert [bytes(content) for _, content in rows] == [decode_ciphertext(token) for token in tokens]
+    assert version == CONTENT_BYTES_VERSION
+
+
+def test_sequence_numbers_are_backfilled_per_room(engine, user_id, monkeypatch):
+    monkeypatch.setattr(server.database, "engine", engine)
+    insert_messages(engine, user_id, [(room_id, b"x") for room_id in ["a", "b", "a", "a", "b"]])
+
+    backfill_message_seq(batch_size=2)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT room_id, seq FROM messages ORDER BY id")).all()
+    assert rows == [("a", 1), ("b", 1), ("a", 2), ("a", 3), ("b", 2)]
+
+
+def test_writes_run_in_order_off_the_event_loop():
+    finished = []
+    release = threading.Event()
+
+    def write(index):
+        if index == 0:
+            # Like waiting for the writer connection while another thread holds it
+            release.wait(5)
+        time.sleep(0.001 * (index % 3))
+        finished.append(index)
+        return index
+
+    async def main():
+        writes = asyncio.gather(*(run_write(write, index) for index in range(10)))
+        # The loop keeps serving while the first write is stuck
+        await asyncio.sleep(0.01)
+        assert finished == []
+        release.set()
+        return await writes
+
+    assert asyncio.run(main()) == list(range(10))
+    assert finished == list(range(10))
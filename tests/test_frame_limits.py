@@ -0,0 +1,37 @@
+"""
+Tests for the WebSocket frame size limit
+"""
+
+import json
+import uuid
+
+from server.main import WS_MAX_FRAME_BYTES, frame_too_large
+from server.metrics import metrics
+
+
+def test_frame_size_is_counted_in_utf8_bytes():
+    assert not frame_too_large("a" * WS_MAX_FRAME_BYTES)
+    assert frame_too_large("a" * (WS_MAX_FRAME_BYTES + 1))
+    assert not frame_too_large("é" * (WS_MAX_FRAME_BYTES // 2))
+    assert frame_too_large("é" * (WS_MAX_FRAME_BYTES // 2 + 1))
+    assert frame_too_large("😀" * (WS_MAX_FRAME_BYTES // 4 + 1))
+
+
+def test_multibyte_frame_over_the_byte_limit_is_rejected(client):
+    response = client.post("/api/register", json={
+        "username": f"user{uuid.uuid4().hex[:8]}",
+        "password": "secret123"
+    })
+    user_id = response.json()["user_id"]
+    before = metrics.snapshot().get("ws_frames_rejected_oversize", 0)
+
+    with client.websocket_connect(f"/ws/{user_id}?room_id=frame-tests") as websocket:
+        # Fewer characters than the limit, but twice as many bytes
+        websocket.send_text(json.dumps({"type": "message", "content": "é" * (WS_MAX_FRAME_BYTES // 2)}))
+        while True:
+            frame = json.loads(websocket.receive_text())
+            if frame["type"] == "error":
+                break
+
+    assert frame["code"] == "frame_too_large"
+    assert metrics.snapshot()["ws_frames_rejected_oversize"] == before + 1
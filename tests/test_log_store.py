@@ -0,0 +1,113 @@
+"""
+Tests for the append-only segmented message log
+"""
+
+import pytest
+
+from server.log_store import LogMessageStore
+from server.message_store import NewMessage
+
+
+def open_store(path, segment_bytes=1024):
+    return LogMessageStore(str(path), segment_bytes=segment_bytes, index_interval=4)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = open_store(tmp_path / "log")
+    yield store
+    store.close()
+
+
+def fill(store, first, last, room_id="general"):
+    store.append_many([
+        NewMessage(room_id, seq, 1, "alice", f"message {seq}".encode()) for seq in range(first, last + 1)
+    ])
+
+
+def seqs(messages):
+    return [msg.seq for msg in messages]
+
+
+def test_reads_forward_and_backward_across_segments(store):
+    fill(store, 1, 200)
+
+    assert len(store.rooms_open["general"].segments) > 1
+    assert seqs(store.read_range("general", 0, 5)) == [1, 2, 3, 4, 5]
+    assert seqs(store.read_range("general", 97, 4)) == [98, 99, 100, 101]
+    assert seqs(store.read_before("general", 101, 3)) == [98, 99, 100]
+    assert seqs(store.tail("general", 2)) == [199, 200]
+    assert store.read_range("general", 150, 1)[0].content == b"message 151"
+    assert (store.first_seq("general"), store.last_seq("general")) == (1, 200)
+
+
+def test_reopening_restores_the_log(tmp_path):
+    store = open_store(tmp_path / "log")
+    fill(store, 1, 120)
+    store.close()
+
+    reopened = open_store(tmp_path / "log")
+    assert reopened.rooms() == ["general"]
+    assert reopened.last_seq("general") == 120
+    assert seqs(reopened.read_range("general", 60, 100)) == list(range(61, 121))
+    reopened.close()
+
+
+def test_torn_tail_is_cut_off_on_reopen(tmp_path):
+    store = open_store(tmp_path / "log", segment_bytes=1 << 20)
+    fill(store, 1, 10)
+    store.close()
+
+    segment = next((tmp_path / "log").rglob("*.log"))
+    with open(segment, "ab") as f:
+        f.write(b"\x01\x02\x03 half a record")
+
+    reopened = open_store(tmp_path / "log", segment_bytes=1 << 20)
+    assert reopened.last_seq("general") == 10
+    fill(reopened, 11, 11)
+    assert seqs(reopened.read_range("general", 8, 10)) == [9, 10, 11]
+    reopened.close()
+
+
+def test_delete_through_drops_whole_sealed_segments(store):
+    fill(store, 1, 200)
+
+    removed = store.delete_through("general", 100)
+
+    assert 0 < removed <= 100
+    assert store.first_seq("general") == removed + 1
+    assert seqs(store.read_range("general", 0, 1)) == [removed + 1]
+
+
+def test_compact_merges_small_segments(tmp_path):
+    # Ten small segments, as left behind by rotating early
+    for first in range(1, 100, 10):
+        store = open_store(tmp_path / "log", segment_bytes=4096)
+        store._room("general")._rotate(first)
+        fill(store, first, first + 9)
+        store.close()
+
+    store = open_store(tmp_path / "log", segment_bytes=4096)
+    before = len(store._room("general").segments)
+
+    assert store.compact("general") > 0
+    assert len(store.rooms_open["general"].segments) < before
+    assert seqs(store.read_range("general", 0, 1000)) == list(range(1, 101))
+
+    store.close()
+    reopened = open_store(tmp_path / "log", segment_bytes=4096)
+    assert seqs(reopened.read_before("general", 101, 1000)) == list(range(1, 101))
+    reopened.close()
+
+
+def test_forget_reloads_the_room_from_disk(tmp_path, store):
+    fill(store, 1, 5)
+
+    # Another worker took the room over and appended to it
+    other = open_store(tmp_path / "log")
+    fill(other, 6, 8)
+    other.close()
+
+    assert store.last_seq("general") == 5
+    store.forget("general")
+    assert store.last_seq("general") == 8
@@ -0,0 +1,129 @@
+"""
+Tests for the client's on-disk message cache and its search
+"""
+
+import pytest
+
+from client.message_cache import MessageCache, fts5_available, highlight, match_expression
+from shared.crypto import MessageEncryption
+
+needs_fts5 = pytest.mark.skipif(not fts5_available(), reason="SQLite was built without FTS5")
+
+
+def message(seq, room_id="general", username="alice"):
+    return {
+        "id": seq, "seq": seq, "room_id": room_id, "user_id": 1, "username": username,
+        "timestamp": f"2024-01-01T00:{seq // 60:02d}:{seq % 60:02d}",
+    }
+
+
+def fill(cache, seqs, room_id="general", text="message {seq}"):
+    for seq in seqs:
+        cache.add(message(seq, room_id), text.format(seq=seq))
+    cache.flush()
+
+
+@pytest.fixture(params=["plain", "encrypted"])
+def cache(request, tmp_path):
+    encryption = MessageEncryption() if request.param == "encrypted" else None
+    cache = MessageCache(tmp_path / "cache.db", 10_000_000, encryption)
+    yield cache
+    cache.close()
+
+
+def test_latest_before_and_after(cache):
+    fill(cache, range(1, 11))
+
+    assert [m["seq"] for m in cache.latest("general", 3)] == [8, 9, 10]
+    assert [m["seq"] for m in cache.before("general", 5, 2)] == [3, 4]
+    assert [m["seq"] for m in cache.after("general", 5, 2)] == [6, 7]
+    assert cache.latest("general", 1)[0]["content"] == "message 10"
+    assert cache.first_seq("general") == 1
+
+
+def test_pages_stop_at_gaps(cache):
+    fill(cache, [1, 2, 3, 6, 7, 8])
+
+    assert [m["seq"] for m in cache.before("general", 8, 10)] == [6, 7]
+    assert [m["seq"] for m in cache.after("general", 1, 10)] == [2, 3]
+    assert cache.after("general", 3, 10) == []
+
+
+def test_eviction_keeps_the_size_bound(tmp_path):
+    cache = MessageCache(tmp_path / "cache.db", 2000, None)
+    fill(cache, range(1, 101))
+
+    assert cache.total_bytes <= 2000
+    assert cache.latest("general", 1)[0]["seq"] == 100
+    assert cache.first_seq("general") > 1
+    cache.close()
+
+
+def test_records_survive_reopening(tmp_path):
+    cache = MessageCache(tmp_path / "cache.db", 10_000_000, None)
+    fill(cache, range(1, 4))
+    cache.close()
+
+    reopened = MessageCache(tmp_path / "cache.db", 10_000_000, None)
+    assert [m["seq"] for m in reopened.latest("general", 10)] == [1, 2, 3]
+    reopened.close()
+
+
+def test_switching_to_encryption_drops_plain_records(tmp_path):
+    cache = MessageCache(tmp_path / "cache.db", 10_000_000, None)
+    fill(cache, range(1, 4))
+    cache.close()
+
+    encrypted = MessageCache(tmp_path / "cache.db", 10_000_000, MessageEncryption())
+    assert encrypted.latest("general", 10) == []
+    encrypted.close()
+
+
+def test_match_expression_quotes_words():
+    assert match_expression('deploy "AND" fri') == '"deploy"* "AND"* "fri"*'
+    assert match_expression("  -- ") is None
+
+
+def test_highlight_marks_prefix_matches():
+    assert highlight("Deploying on friday", ["deploy"]) == "[reverse]Deploying[/reverse] on friday"
+    snippet = highlight("x " * 100 + "needle", ["needle"], length=20)
+    assert snippet.startswith("…") and snippet.endswith("[reverse]needle[/reverse]")
+
+
+@needs_fts5
+def test_search_finds_every_word_in_one_room(cache):
+    fill(cache, [1], text="deploy the server friday")
+    fill(cache, [2], text="deploy the client")
+    fill(cache, [3], text="lunch on friday")
+    fill(cache, [4], room_id="other", text="deploy friday too")
+
+    hits = cache.search("deploy fri")
+    assert [hit["seq"] for hit in hits] == [1]
+    assert "[reverse]deploy[/reverse]" in hits[0]["snippet"]
+    assert {hit["seq"] for hit in cache.search("deploy")} == {1, 2}
+    assert cache.search("") == []
+
+
+@needs_fts5
+def test_encrypted_cache_indexes_existing_records(tmp_path):
+    encryption = MessageEncryption()
+    cache = MessageCache(tmp_path / "cache.db", 10_000_000, encryption)
+    fill(cache, [1, 2], text="secret plans {seq}")
+    cache.close()
+
+    reopened = MessageCache(tmp_path / "cache.db", 10_000_000, MessageEncryption(encryption.key))
+    assert reopened.search("plans") == []
+    reopened.index_existing()
+    assert {hit["seq"] for hit in reopened.search("plans")} == {1, 2}
+    reopened.close()
+
+
+@needs_fts5
+def test_clear_room_removes_search_hits(cache):
+    fill(cache, [1], text="keep this")
+    fill(cache, [1], room_id="other", text="keep that")
+
+    cache.clear_room("other")
+
+    assert [hit["seq"] for hit in cache.search("keep")] == [1]
+    assert cache.latest("other", 10) == []
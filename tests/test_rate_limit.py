@@ -0,0 +1,78 @@
+"""
+Tests for the inbound WebSocket frame rate limiter
+"""
+
+import pytest
+
+from server.rate_limit import OTHER_FRAMES, RateLimiter, TokenBucket
+
+LIMITS = {"message": (1, 3), OTHER_FRAMES: (1, 2)}
+
+
+def test_bucket_allows_its_burst_then_refills():
+    bucket = TokenBucket(2, 3)
+    now = bucket.updated
+
+    assert [bucket.try_consume(now) for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+    assert bucket.try_consume(now + 0.5)
+
+
+def test_connection_limit_reports_the_wait():
+    limiter = RateLimiter(LIMITS, {"message": (100, 100), OTHER_FRAMES: (100, 100)}).open("1")
+
+    assert [limiter.check("message") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0 < limiter.check("message") <= 1
+
+
+def test_user_limit_is_shared_by_connections():
+    limiter = RateLimiter({"message": (100, 100), OTHER_FRAMES: (100, 100)}, LIMITS)
+    first, second = limiter.open("1"), limiter.open("1")
+
+    assert [first.check("message") for _ in range(2)] == [0.0, 0.0]
+    assert second.check("message") == 0.0
+    assert second.check("message") > 0
+
+
+def test_frame_types_without_a_bucket_share_the_default_one():
+    limiter = RateLimiter(LIMITS, LIMITS).open("1")
+
+    assert [limiter.check("pong") for _ in range(2)] == [0.0, 0.0]
+    assert limiter.check("pong") > 0
+    assert limiter.check("made-up") > 0
+    assert limiter.check(None) > 0
+    # Other frame types still have their own budget
+    assert limiter.check("message") == 0.0
+
+
+def test_closing_the_last_connection_releases_user_buckets():
+    limiter = RateLimiter(LIMITS, LIMITS)
+    limiter.open("1")
+    limiter.open("1")
+
+    limiter.close("1")
+    assert "1" in limiter.user_buckets
+    limiter.close("1")
+    assert "1" not in limiter.user_buckets
+
+
+def test_flooding_is_detected_after_the_violation_burst():
+    limiter = RateLimiter(LIMITS, LIMITS).open("1")
+    limiter.violations = TokenBucket(1, 2)
+
+    assert [limiter.record_violation() for _ in range(3)] == [False, False, True]
+
+
+@pytest.mark.parametrize("limit", [(0, 10), (-1, 10), (1, 0)])
+def test_limits_that_never_allow_a_frame_are_refused(limit):
+    with pytest.raises(ValueError):
+        RateLimiter({"message": limit, OTHER_FRAMES: (1, 1)}, LIMITS)
+
+
+@pytest.mark.parametrize("connection_limits, user_limits", [
+    ({"message": (1, 3)}, {"message": (1, 3)}),
+    (LIMITS, {OTHER_FRAMES: (1, 2)}),
+])
+def test_limits_must_cover_other_frames_on_both_levels(connection_limits, user_limits):
+    with pytest.raises(ValueError):
+        RateLimiter(connection_limits, user_limits)
@@ -0,0 +1,73 @@
+"""
+Tests for resuming a room over the WebSocket after a reconnect
+"""
+
+import json
+import uuid
+
+import pytest
+
+import server.main
+from shared.crypto import MessageEncryption
+
+ROOM = "resume-tests"
+
+
+@pytest.fixture
+def user_id(client):
+    response = client.post("/api/register", json={
+        "username": f"user{uuid.uuid4().hex[:8]}",
+        "password": "secret123"
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["user_id"]
+
+
+def receive_until(websocket, frame_type):
+    """Collect frames up to and including the first one of frame_type"""
+    frames = []
+    while True:
+        frame = json.loads(websocket.receive_text())
+        frames.append(frame)
+        if frame["type"] == frame_type:
+            return frames
+
+
+def send_messages(websocket, count):
+    encryption = MessageEncryption()
+    seqs = []
+    for index in range(count):
+        websocket.send_text(json.dumps({
+            "type": "message", "room_id": ROOM, "content": encryption.encrypt(f"message {index}")
+        }))
+        frames = receive_until(websocket, "message")
+        seqs.append(frames[-1]["seq"])
+    return seqs
+
+
+def resume(websocket, last_seq):
+    websocket.send_text(json.dumps({"type": "resume", "room_id": ROOM, "last_seq": last_seq}))
+    frames = receive_until(websocket, "resume_complete")
+    replayed = [frame for frame in frames if frame["type"] == "message"]
+    assert all(frame["replay"] for frame in replayed)
+    return [frame["seq"] for frame in replayed], frames[-1]
+
+
+def test_resume_replays_from_the_buffer_and_the_store(client, user_id):
+    with client.websocket_connect(f"/ws/{user_id}?room_id={ROOM}") as websocket:
+        seqs = send_messages(websocket, 4)
+        assert seqs == list(range(seqs[0], seqs[0] + 4))
+
+        replayed, complete = resume(websocket, seqs[1])
+        assert replayed == seqs[2:]
+        assert (complete["seq"], complete["replayed"], complete["truncated"]) == (seqs[-1], 2, False)
+
+        # With the buffer gone the replay is read from the store
+        server.main.sequencer.forget(ROOM)
+        replayed, complete = resume(websocket, seqs[0])
+        assert replayed == seqs[1:]
+        assert complete["seq"] == seqs[-1]
+
+        # A room with nothing delivered yet is resumed from the start
+        replayed, _ = resume(websocket, 0)
+        assert replayed[-4:] == seqs
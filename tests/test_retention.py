@@ -0,0 +1,139 @@
+"""
+Tests for the hot store and archive tiers of message retention
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from server.message_store import SQLMessageStore
+from server.retention import MessageArchive, RetentionManager, RetentionPolicy
+from server.sequencer import RoomSequencer
+
+
+@pytest.fixture
+def store(session_factory):
+    return SQLMessageStore(session_factory)
+
+
+@pytest.fixture
+def archive(tmp_path, session_factory):
+    return MessageArchive(str(tmp_path / "archive"), session_factory)
+
+
+def fill(store, user_id, count, room_id="general"):
+    for seq in range(1, count + 1):
+        store.append(room_id, seq, user_id, "alice", f"message {seq}".encode())
+
+
+def seqs(messages):
+    return [msg.seq for msg in messages]
+
+
+def test_max_hot_messages_moves_older_messages_to_the_archive(store, archive, user_id):
+    fill(store, user_id, 30)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 0, 10))
+
+    assert manager.run_once() == {"archived_messages": 20, "expired_segments": 0, "compacted_segments": 0}
+    assert store.first_seq("general") == 21
+    assert archive.last_seq("general") == 20
+
+    # Running again finds nothing new to archive
+    assert manager.run_once()["archived_messages"] == 0
+
+
+def test_read_range_continues_from_the_archive_into_the_hot_store(store, archive, user_id):
+    fill(store, user_id, 30)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 0, 10))
+    manager.run_once()
+
+    assert seqs(manager.read_range("general", 15, 100)) == list(range(16, 31))
+    assert seqs(manager.read_range("general", 15, 10)) == list(range(16, 26))
+    assert seqs(manager.read_range("general", 0, 5)) == [1, 2, 3, 4, 5]
+    assert seqs(manager.read_range("general", 25, 100)) == list(range(26, 31))
+    assert manager.read_range("general", 30, 100) == []
+
+
+def test_read_before_continues_from_the_hot_store_into_the_archive(store, archive, user_id):
+    fill(store, user_id, 30)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 0, 10))
+    manager.run_once()
+
+    assert seqs(manager.read_before("general", 31, 15)) == list(range(16, 31))
+    assert seqs(manager.read_before("general", 16, 100)) == list(range(1, 16))
+    assert manager.read_before("general", 1, 100) == []
+
+
+def test_archived_content_round_trips(store, archive, user_id):
+    fill(store, user_id, 5)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 0, 1))
+    manager.run_once()
+
+    assert [msg.content for msg in manager.read_range("general", 0, 10)] == [
+        f"message {seq}".encode() for seq in range(1, 6)
+    ]
+
+
+def test_ttl_expires_whole_segments(store, archive, user_id):
+    fill(store, user_id, 5)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 1, 0))
+
+    result = manager.run_once(now=datetime.utcnow() + timedelta(days=3))
+
+    assert result["archived_messages"] == 5
+    assert result["expired_segments"] >= 1
+    assert manager.read_range("general", 0, 10) == []
+    assert manager.generation == 1
+
+
+def test_sequence_continues_after_a_whole_room_was_archived(store, archive, user_id):
+    fill(store, user_id, 5)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(1, 0, 0))
+    later = datetime.utcnow() + timedelta(days=3)
+    assert manager.run_once(now=later)["archived_messages"] == 5
+    assert store.last_seq("general") == 0
+
+    # A restarted server seeds its counter from both tiers
+    seq = RoomSequencer(manager).next_seq("general")
+    assert seq == 6
+    store.append("general", seq, user_id, "alice", b"message 6")
+
+    assert seqs(manager.read_range("general", 0, 100)) == list(range(1, 7))
+    assert seqs(manager.read_before("general", 7, 100)) == list(range(1, 7))
+    assert manager.run_once(now=later + timedelta(days=3))["archived_messages"] == 1
+
+
+def test_sequence_continues_after_the_archive_expired(store, archive, user_id):
+    fill(store, user_id, 5)
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 1, 0))
+    manager.run_once(now=datetime.utcnow() + timedelta(days=3))
+    assert archive.rooms() == []
+
+    assert RoomSequencer(manager).next_seq("general") == 6
+
+
+def test_run_once_skips_rooms_owned_by_other_workers(store, archive, user_id):
+    fill(store, user_id, 30, room_id="mine")
+    fill(store, user_id, 30, room_id="theirs")
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy(0, 0, 10),
+                               owns_room=lambda room_id: room_id == "mine")
+
+    assert manager.run_once()["archived_messages"] == 20
+    assert archive.rooms() == ["mine"]
+    assert store.first_seq("theirs") == 1
+
+
+def test_run_once_compacts_the_message_store(tmp_path, archive):
+    from server.log_store import LogMessageStore
+
+    store = LogMessageStore(str(tmp_path / "log"), segment_bytes=4096)
+    for first in range(1, 50, 10):
+        store._room("general")._rotate(first)
+        for seq in range(first, first + 10):
+            store.append("general", seq, 1, "alice", b"x")
+    manager = RetentionManager(store, archive, policies={}, default_policy=RetentionPolicy())
+
+    assert manager.needed
+    assert manager.run_once()["compacted_segments"] > 0
+    assert seqs(manager.read_range("general", 0, 100)) == list(range(1, 51))
+    store.close()
@@ -0,0 +1,57 @@
+"""
+Tests for per-room sequence numbers and the replay buffer
+"""
+
+from server.sequencer import RoomSequencer
+
+
+class FakeStore:
+    def __init__(self, **last_seqs):
+        self.last_seqs = last_seqs
+
+    def last_seq(self, room_id):
+        return self.last_seqs.get(room_id, 0)
+
+
+def test_sequence_continues_from_the_store():
+    sequencer = RoomSequencer(FakeStore(general=41))
+
+    assert sequencer.next_seq("general") == 42
+    assert sequencer.next_seq("general") == 43
+    assert sequencer.next_seq("other") == 1
+    assert sequencer.current("general") == 43
+
+
+def test_resync_gives_failed_seqs_out_again():
+    store = FakeStore(general=5)
+    sequencer = RoomSequencer(store)
+    sequencer.next_seq("general")
+    sequencer.next_seq("general")
+
+    sequencer.resync("general")
+
+    assert sequencer.next_seq("general") == 6
+
+
+def test_forget_reloads_from_the_store():
+    store = FakeStore(general=5)
+    sequencer = RoomSequencer(store)
+    sequencer.next_seq("general")
+    store.last_seqs["general"] = 20
+
+    sequencer.forget("general")
+
+    assert sequencer.next_seq("general") == 21
+
+
+def test_replay_returns_payloads_after_last_seq():
+    sequencer = RoomSequencer(FakeStore(), buffer_size=3)
+    for _ in range(5):
+        seq = sequencer.next_seq("general")
+        sequencer.record("general", seq, f"payload {seq}")
+
+    assert sequencer.replay("general", 5) == []
+    assert sequencer.replay("general", 3) == ["payload 4", "payload 5"]
+    assert sequencer.replay("general", 2) == ["payload 3", "payload 4", "payload 5"]
+    # Seq 2 has left the buffer, so the caller must read the store
+    assert sequencer.replay("general", 1) is None
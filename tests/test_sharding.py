@@ -0,0 +1,58 @@
+"""
+Tests for room-to-worker sharding
+"""
+
+import pytest
+
+from server.sharding import HashRing, ShardRouter, parse_workers
+
+WORKERS = {"w1": "http://127.0.0.1:8001", "w2": "https://chat.example.com", "w3": "http://127.0.0.1:8003"}
+ROOMS = [f"room-{index}" for index in range(300)]
+
+
+def test_parse_workers():
+    assert parse_workers(" w1=http://a:1/ , w2=http://b:2,") == {"w1": "http://a:1", "w2": "http://b:2"}
+    assert parse_workers("") == {}
+    with pytest.raises(ValueError):
+        parse_workers("w1")
+    with pytest.raises(ValueError):
+        parse_workers("=http://a:1")
+
+
+def test_removing_a_worker_only_moves_its_rooms():
+    before = HashRing(["w1", "w2", "w3"])
+    after = HashRing(["w1", "w3"])
+
+    for room_id in ROOMS:
+        if before.owner(room_id) != "w2":
+            assert after.owner(room_id) == before.owner(room_id)
+    assert {before.owner(room_id) for room_id in ROOMS} == {"w1", "w2", "w3"}
+
+
+def test_every_room_is_local_to_exactly_one_worker():
+    routers = [ShardRouter(WORKERS, self_id=worker_id) for worker_id in WORKERS]
+
+    for room_id in ROOMS:
+        assert sum(router.is_local(room_id) for router in routers) == 1
+
+
+def test_sharding_off_serves_every_room():
+    router = ShardRouter({}, self_id="")
+
+    assert not router.enabled
+    assert router.is_local("general")
+    assert HashRing([]).owner("general") is None
+
+
+def test_unknown_self_id_is_rejected():
+    with pytest.raises(ValueError):
+        ShardRouter(WORKERS, self_id="w9")
+
+
+def test_ws_url_matches_the_owner_scheme():
+    router = ShardRouter(WORKERS, self_id="w1")
+
+    for room_id in ROOMS:
+        http_url = router.http_url(room_id)
+        expected = http_url.replace("https://", "wss://").replace("http://", "ws://")
+        assert router.ws_url(room_id) == expected